@@ -0,0 +1,74 @@
+"""
+Async (ASGI) server for the Investment Plan API.
+
+Exposes the same /investment-plan and /status contract as app.py, but awaits the RPC
+balance fetches and LLM calls natively, so a single process can hold many in-flight chats.
+/investment-plan/stream answers the same requests as Server-Sent Events, streaming chatbot
+tokens as they are generated. /investment-plan/batch plans many wallets per call and streams
+the results back as NDJSON.
+
+Run with:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from src.pipeline import handle_investment_plan, stream_investment_plan, parse_batch_request, stream_batch_plans
+from src import metrics
+
+app = FastAPI(title="Investment Plan API")
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+async def _read_json(request: Request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+@app.get("/status", response_class=PlainTextResponse)
+async def index():
+    return "Investment Plan API is running!"
+
+
+@app.get("/metrics")
+async def metrics_api():
+    """Per-stage latency quantiles, counts and errors in Prometheus text format."""
+    return Response(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.post("/investment-plan")
+async def investment_plan_api(request: Request):
+    body, status, headers = await handle_investment_plan(await _read_json(request))
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+@app.post("/investment-plan/stream")
+async def investment_plan_stream_api(request: Request):
+    """Same request body as /investment-plan, answered as a text/event-stream."""
+    return StreamingResponse(
+        stream_investment_plan(await _read_json(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/investment-plan/batch")
+async def investment_plan_batch_api(request: Request):
+    """Plans many wallets per call, streaming one NDJSON line per wallet as it completes."""
+    try:
+        wallets, concurrency = parse_batch_request(await _read_json(request))
+    except ValueError as ve:
+        return JSONResponse({"error": str(ve)}, status_code=400)
+    return StreamingResponse(stream_batch_plans(wallets, concurrency), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
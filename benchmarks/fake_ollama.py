@@ -0,0 +1,199 @@
+"""
+Local stand-in for the Ollama HTTP API, used by the load test.
+
+Answers /api/generate and /api/chat (streaming NDJSON or a single JSON object) at a
+configurable token rate, with a configurable model-load delay before the first token.
+Replies are canned per prompt type: the query classifier gets a category picked from
+keywords in the current query, the risk classifier gets a filter JSON object, the combined
+classification/extraction call gets both in one object and anything
+else (the RAG chatbot) gets a fixed-length answer. Token counts and durations are reported
+in the final chunk the same way Ollama does.
+
+Run standalone with:
+    python -m benchmarks.fake_ollama --port 11435 --token-rate 50
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILTER_RESPONSE = {
+    "risk_profile": "Balanced",
+    "risk_levels": [],
+    "is_audited": False,
+    "protocols": [],
+    "min_tvl": 0,
+    "apy": 0,
+    "assets": [],
+}
+
+ANSWER_WORDS = (
+    "Starknet is a validity rollup that scales Ethereum using STARK proofs while "
+    "inheriting its security and keeping fees low for DeFi users"
+).split()
+
+
+def classify(prompt):
+    """Picks a query category from keywords in the current query of a classification prompt."""
+    current = prompt.rsplit("Current query:", 1)[-1].lower()
+    if any(word in current for word in ("invest", "risk", "yield", "strategy")):
+        return "investment_query"
+    if "balance" in current:
+        return "balance_query"
+    return "other_query"
+
+
+def reply_for(prompt, answer_tokens):
+    # The combined prompt also mentions investment preferences, so it must be matched first
+    if "extract their investment preferences in one JSON object" in prompt:
+        category = classify(prompt)
+        if category == "investment_query":
+            return json.dumps({"category": category, **FILTER_RESPONSE})
+        return json.dumps({"category": category, **FILTER_RESPONSE, "risk_profile": "None"})
+    if "classify user queries" in prompt:
+        return json.dumps({"category": classify(prompt), "response": None})
+    if "investment preferences" in prompt:
+        return json.dumps(FILTER_RESPONSE)
+    words = (ANSWER_WORDS * (answer_tokens // len(ANSWER_WORDS) + 1))[:answer_tokens]
+    return " ".join(words)
+
+
+def tokenize(text):
+    """Splits text into Ollama-like tokens (words with their leading whitespace, punctuation)."""
+    return re.findall(r"\s*\w+|\s*[^\w\s]", text) or [text]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    token_rate = 50.0
+    load_delay = 0.0
+    answer_tokens = 60
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self._send_json({"models": []})
+        elif self.path.startswith("/api/version"):
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.startswith("/api/generate"):
+            prompt = request.get("prompt", "")
+            chat = False
+        elif self.path.startswith("/api/chat"):
+            prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+            chat = True
+        else:
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        model = request.get("model", "fake")
+        tokens = tokenize(reply_for(prompt, self.answer_tokens))
+        stream = request.get("stream", True)
+        started = time.perf_counter()
+        time.sleep(self.load_delay)
+
+        def chunk(text, done, **extra):
+            payload = {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "done": done,
+                **extra,
+            }
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            return payload
+
+        def final_stats(generation_seconds):
+            return {
+                "done_reason": "stop",
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+                "load_duration": int(self.load_delay * 1e9),
+                "prompt_eval_count": len(prompt.split()),
+                "prompt_eval_duration": 0,
+                "eval_count": len(tokens),
+                "eval_duration": int(generation_seconds * 1e9),
+            }
+
+        interval = 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+        if not stream:
+            time.sleep(interval * len(tokens))
+            self._send_json(chunk("".join(tokens), True, **final_stats(interval * len(tokens))))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(payload):
+            data = (json.dumps(payload) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        generation_start = time.perf_counter()
+        try:
+            for token in tokens:
+                time.sleep(interval)
+                write(chunk(token, False))
+            write(chunk("", True, **final_stats(time.perf_counter() - generation_start)))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (e.g. early termination); stop generating
+            pass
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading a stream early (JsonStreamParser) reset the keep-alive
+        # connection; that is expected, not worth a traceback
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_fake_ollama(port=0, token_rate=50.0, load_delay=0.0, answer_tokens=60):
+    """Starts the fake Ollama server in a daemon thread and returns (server, base_url)."""
+    handler = type("ConfiguredFakeOllamaHandler", (FakeOllamaHandler,), {
+        "token_rate": token_rate,
+        "load_delay": load_delay,
+        "answer_tokens": answer_tokens,
+    })
+    server = FakeOllamaServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load testing")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Generated tokens per second")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Length of chatbot answers")
+    args = parser.parse_args()
+    server, url = start_fake_ollama(args.port, args.token_rate, args.load_delay, args.answer_tokens)
+    print(f"Fake Ollama listening on {url}")
+    threading.Event().wait()
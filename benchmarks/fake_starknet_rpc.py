@@ -0,0 +1,113 @@
+"""
+Local stand-in for a Starknet JSON-RPC node, used by the load test.
+
+Implements just enough of the API for src/wallet_portfolio.py: every address resolves to
+a Cairo 1 ERC-20 class whose ABI exposes `balanceOf`, and `starknet_call` returns a fixed
+u256 balance after a configurable latency. Batched JSON-RPC requests are supported.
+
+Run standalone with:
+    python -m benchmarks.fake_starknet_rpc --port 9545 --latency 0.05
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ERC20_ABI = [
+    {
+        "type": "function",
+        "name": "balanceOf",
+        "inputs": [{"name": "account", "type": "core::starknet::contract_address::ContractAddress"}],
+        "outputs": [{"type": "core::integer::u256"}],
+        "state_mutability": "view",
+    },
+    {
+        "type": "struct",
+        "name": "core::integer::u256",
+        "members": [
+            {"name": "low", "type": "core::integer::u128"},
+            {"name": "high", "type": "core::integer::u128"},
+        ],
+    },
+]
+
+SIERRA_CLASS = {
+    "sierra_program": ["0x1"],
+    "contract_class_version": "0.1.0",
+    "entry_points_by_type": {"CONSTRUCTOR": [], "EXTERNAL": [], "L1_HANDLER": []},
+    "abi": json.dumps(ERC20_ABI),
+}
+
+CLASS_HASH = "0x" + "ab" * 31
+
+
+class FakeRpcHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.05
+    balance = 5 * 10 ** 18
+
+    def log_message(self, format, *args):
+        pass
+
+    def _result(self, method, params):
+        if method == "starknet_specVersion":
+            return "0.7.1"
+        if method == "starknet_chainId":
+            return "0x534e5f4d41494e"  # SN_MAIN
+        if method == "starknet_blockNumber":
+            return 1
+        if method == "starknet_getClassHashAt":
+            return CLASS_HASH
+        if method in ("starknet_getClass", "starknet_getClassAt"):
+            return SIERRA_CLASS
+        if method == "starknet_call":
+            time.sleep(self.latency)
+            return [hex(self.balance), "0x0"]
+        raise KeyError(method)
+
+    def _handle(self, request):
+        try:
+            result = self._result(request.get("method"), request.get("params"))
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+        except KeyError as e:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32601, "message": f"Method not found: {e}"}}
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if isinstance(request, list):
+            response = [self._handle(r) for r in request]
+        else:
+            response = self._handle(request)
+
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_fake_rpc(port=0, latency=0.05, balance=5 * 10 ** 18):
+    """Starts the fake RPC node in a daemon thread and returns (server, node_url)."""
+    handler = type("ConfiguredFakeRpcHandler", (FakeRpcHandler,), {
+        "latency": latency,
+        "balance": balance,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-starknet-rpc", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Starknet JSON-RPC node for load testing")
+    parser.add_argument("--port", type=int, default=9545)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per starknet_call")
+    parser.add_argument("--balance", type=int, default=5 * 10 ** 18, help="Raw u256 balance returned")
+    args = parser.parse_args()
+    server, url = start_fake_rpc(args.port, args.latency, args.balance)
+    print(f"Fake Starknet RPC listening on {url}")
+    threading.Event().wait()
@@ -0,0 +1,230 @@
+"""
+End-to-end load test for the /investment-plan API, runnable fully offline.
+
+Starts a fake Ollama server and a fake Starknet RPC node, launches the API (ASGI or Flask)
+as a subprocess pointed at them, then drives /investment-plan with a configurable
+concurrency and query mix. Reports throughput and latency percentiles per query type,
+followed by the server's own per-stage /metrics.
+
+other_query requests go through the RAG chatbot, so they need a real retriever index; pass
+its directory with --retriever or leave `other` out of the mix.
+
+The server runs with HF_HUB_OFFLINE and TRANSFORMERS_OFFLINE set, so Hugging Face models
+(the query router, the semantic cache, the retriever's embeddings) are only loaded from the
+local cache and never retried against the hub. The semantic cache is off unless
+--semantic-cache is given, since it needs the embedding model downloaded beforehand.
+
+Example:
+    python -m benchmarks.load_test --server asgi --concurrency 32 --requests 500 \\
+        --mix balance=0.4,investment=0.6 --token-rate 80 --rpc-latency 0.05
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import httpx
+from benchmarks.fake_ollama import start_fake_ollama
+from benchmarks.fake_starknet_rpc import start_fake_rpc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = {
+    "balance": "{wallet} what's my wallet balance?",
+    "investment": "{wallet} suggest an investment strategy, balanced risk please",
+    "other": "What is Endur and how does liquid staking work on Starknet?",
+}
+
+SERVER_COMMANDS = {
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", "{port}",
+             "--log-level", "warning"],
+    "flask": [sys.executable, "-m", "flask", "--app", "app", "run", "--host", "127.0.0.1", "--port", "{port}",
+              "--with-threads"],
+}
+
+
+def write_apy_fixture(directory):
+    """Writes a small synthetic APY data file covering every tracked asset and risk level."""
+    pools = []
+    for asset in ("USDC", "ETH", "STRK", "XSTRK", "WSTETH"):
+        for i, risk in enumerate(("low", "medium", "high")):
+            pools.append({
+                "asset": asset,
+                "pool": f"{asset}-{risk}-pool",
+                "apy": 3.0 + 4.0 * i,
+                "risk_rating": risk,
+                "tvlusd": 1_000_000.0 / (i + 1),
+                "is_audited": 1,
+                "protocol": ("Vesu", "Strkfarm", "Endur")[i],
+            })
+    path = os.path.join(directory, "apy.json")
+    with open(path, "w") as f:
+        json.dump(pools, f)
+    return path
+
+
+def parse_mix(spec):
+    """Parses "balance=0.4,investment=0.6" into normalized weights."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in MESSAGES:
+            raise SystemExit(f"Unknown query type in --mix: {name}")
+        mix[name] = float(weight or 1)
+    total = sum(mix.values())
+    return {name: weight / total for name, weight in mix.items()}
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def wallet_address(i):
+    return "0x" + format(0x4cced5156ab726bf0e0ca2afeb1f521de0362e748b8bdf07857b088dbc7b457 + i, "064x")
+
+
+async def wait_for_server(base_url, process, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise SystemExit(f"Server exited early with code {process.returncode}")
+            try:
+                if (await client.get(f"{base_url}/status")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit("Server did not become ready in time")
+
+
+async def run_load(base_url, args, mix):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    rng = random.Random(args.seed)
+    plan = [rng.choices(names, weights)[0] for _ in range(args.requests)]
+    results = {name: {"latencies": [], "errors": 0} for name in names}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        async def one(i, query_type):
+            wallet = wallet_address(i % args.wallets)
+            body = {
+                "chat_id": f"bench-{i}",
+                "messages": [{"role": "user", "content": MESSAGES[query_type].format(wallet=wallet)}],
+            }
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/investment-plan", json=body)
+                    ok = response.status_code == 200 and "error" not in (response.json() or {})
+                except (httpx.HTTPError, ValueError, TypeError):
+                    ok = False
+                elapsed = time.perf_counter() - start
+            results[query_type]["latencies"].append(elapsed)
+            if not ok:
+                results[query_type]["errors"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i, query_type) for i, query_type in enumerate(plan)))
+        wall = time.perf_counter() - start
+
+        metrics_text = (await client.get("/metrics")).text
+
+    return results, wall, metrics_text
+
+
+def report(results, wall, metrics_text):
+    total = sum(len(r["latencies"]) for r in results.values())
+    print(f"\n{total} requests in {wall:.2f}s -> {total / wall:.1f} req/s\n")
+    print(f"{'query type':<12}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, r in results.items():
+        ordered = sorted(r["latencies"])
+        print(
+            f"{name:<12}{len(ordered):>7}{r['errors']:>8}{len(ordered) / wall:>9.1f}"
+            f"{percentile(ordered, 0.5) * 1000:>10.1f}{percentile(ordered, 0.95) * 1000:>10.1f}"
+            f"{percentile(ordered, 0.99) * 1000:>10.1f}{(ordered[-1] if ordered else 0) * 1000:>10.1f}"
+        )
+    print("\nServer stage metrics:")
+    for line in metrics_text.splitlines():
+        if line and not line.startswith("#"):
+            print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the Investment Plan API")
+    parser.add_argument("--server", choices=sorted(SERVER_COMMANDS), default="asgi")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mix", default="balance=0.5,investment=0.5", help="e.g. balance=0.4,investment=0.4,other=0.2")
+    parser.add_argument("--wallets", type=int, default=50, help="Distinct wallet addresses to cycle through")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Fake Ollama tokens per second")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="Fake Ollama delay before the first token")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Fake chatbot answer length")
+    parser.add_argument("--rpc-latency", type=float, default=0.05, help="Fake RPC seconds per balanceOf call")
+    parser.add_argument("--retriever", help="Retriever index directory used for other_query requests")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="Enable the semantic classification cache (needs its embedding model cached locally)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if "other" in mix and not args.retriever and not args.url:
+        raise SystemExit("other queries need --retriever (a real retriever index)")
+
+    if args.url:
+        results, wall, metrics_text = asyncio.run(run_load(args.url.rstrip("/"), args, mix))
+        report(results, wall, metrics_text)
+        return
+
+    ollama, ollama_url = start_fake_ollama(
+        token_rate=args.token_rate, load_delay=args.load_delay, answer_tokens=args.answer_tokens
+    )
+    rpc, rpc_url = start_fake_rpc(latency=args.rpc_latency)
+    print(f"Fake Ollama: {ollama_url}  Fake Starknet RPC: {rpc_url}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            OLLAMA_BASE_URL=ollama_url,
+            STARKNET_RPC_PROVIDER=rpc_url,
+            APY_DATA_LOCATION=write_apy_fixture(workdir),
+            CHAT_LOG_PATH=os.path.join(workdir, "chat_logs.jsonl"),
+            CONVERSATION_STORE="memory",
+            SEMANTIC_CACHE="1" if args.semantic_cache else "0",
+        )
+        # Never reach out to the Hugging Face hub; models missing locally fail at once
+        env.setdefault("HF_HUB_OFFLINE", "1")
+        env.setdefault("TRANSFORMERS_OFFLINE", "1")
+        if args.retriever:
+            env["RETRIEVER_PATH"] = os.path.abspath(args.retriever)
+
+        command = [part.format(port=args.port) for part in SERVER_COMMANDS[args.server]]
+        process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            asyncio.run(wait_for_server(base_url, process))
+            results, wall, metrics_text = asyncio.run(run_load(base_url, args, mix))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report(results, wall, metrics_text)
+
+
+if __name__ == "__main__":
+    main()
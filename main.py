@@ -3,7 +3,7 @@ from src.chatbot_ollama import create_chatbot  # Import your chatbot function
 
 start_time = time.time()  # Start the timer
 # Path to be checked after running the script "web_scrapping.py"
-RETRIEVER_PATH = "src/data/combined_retriever.pkl"
+RETRIEVER_PATH = "src/data/combined_index"
 
 # Initialize the chatbot with the JSON file
 chatbot = create_chatbot(RETRIEVER_PATH)
@@ -0,0 +1,120 @@
+import os
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from src import metrics
+
+# Requests allowed to run LLM-dependent stages at once, and how many may wait behind them
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+# Default end-to-end budget for one request; clients may ask for less with `timeout_ms`
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full; `retry_after` is a hint in whole seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__("Server is busy, please retry later.")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot finish within the request's remaining budget."""
+
+    def __init__(self, stage):
+        super().__init__(f"Request deadline exceeded during {stage}.")
+        self.stage = stage
+
+
+class Deadline:
+    """End-to-end time budget for one request, shared by every stage it runs."""
+
+    def __init__(self, budget=REQUEST_DEADLINE_SECONDS):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def allows(self, seconds):
+        """True if at least `seconds` of budget are left."""
+        return self.remaining() >= seconds
+
+    async def run(self, awaitable, stage, reserve=0.0):
+        """
+        Awaits `awaitable` with the remaining budget (minus `reserve`, kept for later stages)
+        as its timeout, raising DeadlineExceeded if it runs out.
+        """
+        timeout = self.remaining() - reserve
+        if timeout <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(stage)
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("deadline_exceeded_total", stage=stage)
+            raise DeadlineExceeded(stage)
+
+
+def request_deadline(data):
+    """Builds the Deadline for a request body, honouring an optional lower `timeout_ms`."""
+    budget = REQUEST_DEADLINE_SECONDS
+    timeout_ms = data.get("timeout_ms") if isinstance(data, dict) else None
+    if timeout_ms:
+        budget = min(budget, max(0.0, float(timeout_ms) / 1000))
+    return Deadline(budget)
+
+
+class AdmissionController:
+    """
+    Bounded admission queue in front of the LLM-dependent paths.
+
+    At most `max_inflight` requests run at once and at most `max_queue` wait for a slot.
+    Anything beyond that is rejected immediately with Overloaded, whose Retry-After hint is
+    derived from the recent average service time. Waiting for a slot counts against the
+    request's deadline.
+    """
+
+    def __init__(self, max_inflight=ADMISSION_MAX_INFLIGHT, max_queue=ADMISSION_MAX_QUEUE):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.inflight = 0
+        self.waiting = 0
+        self._avg_service = 1.0
+        self._semaphore = None
+
+    def retry_after(self):
+        """Seconds until a queued request would likely get a slot, rounded up."""
+        backlog = self.waiting + 1
+        return max(1, math.ceil(self._avg_service * backlog / max(1, self.max_inflight)))
+
+    @asynccontextmanager
+    async def slot(self, deadline=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+
+        if self.inflight + self.waiting >= self.max_inflight + self.max_queue:
+            metrics.inc("admission_rejected_total")
+            raise Overloaded(self.retry_after())
+
+        self.waiting += 1
+        try:
+            if deadline is not None:
+                await deadline.run(self._semaphore.acquire(), "admission")
+            else:
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.inflight += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+            # Exponentially weighted average of how long an admitted request holds its slot
+            self._avg_service = 0.8 * self._avg_service + 0.2 * (time.monotonic() - start)
@@ -0,0 +1,124 @@
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import shutil
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+CHAT_LOG_MAX_BATCH = int(os.getenv("CHAT_LOG_MAX_BATCH", "256"))
+CHAT_LOG_FLUSH_INTERVAL = float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "1.0"))
+CHAT_LOG_MAX_BYTES = int(os.getenv("CHAT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+CHAT_LOG_BACKUP_COUNT = int(os.getenv("CHAT_LOG_BACKUP_COUNT", "20"))
+CHAT_LOG_QUEUE_SIZE = int(os.getenv("CHAT_LOG_QUEUE_SIZE", "10000"))
+
+_STOP = object()
+
+
+class ChatLogWriter:
+    """
+    Background sink for chat logs.
+
+    `log` only enqueues a record, so requests never wait on disk I/O. A daemon thread writes
+    queued records as JSON lines, flushing once `max_batch` records are pending or
+    `flush_interval` seconds have passed. When the file grows beyond `max_bytes` it is rotated
+    to a timestamped segment and gzip-compressed, keeping at most `backup_count` segments.
+    If the queue is full the record is dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, path, max_batch=CHAT_LOG_MAX_BATCH, flush_interval=CHAT_LOG_FLUSH_INTERVAL,
+                 max_bytes=CHAT_LOG_MAX_BYTES, backup_count=CHAT_LOG_BACKUP_COUNT,
+                 queue_size=CHAT_LOG_QUEUE_SIZE):
+        self.path = path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, chat_id, messages):
+        """Queues one chat snapshot for writing; never blocks."""
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "chat_id": chat_id,
+            "messages": [
+                {"role": m.get("role", "unknown"), "content": m.get("content", "")} for m in messages
+            ],
+        }
+        self.write(record)
+
+    def write(self, record):
+        """Queues any JSON-serialisable record for writing; never blocks."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("chat_log_dropped_total")
+
+    def close(self, timeout=5.0):
+        """Flushes pending records and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        first_at = None
+        while True:
+            if first_at is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(0.0, first_at + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                if not batch:
+                    first_at = time.monotonic()
+                batch.append(item)
+
+            if batch and (len(batch) >= self.max_batch or time.monotonic() - first_at >= self.flush_interval):
+                self._flush(batch)
+                batch = []
+                first_at = None
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as log_file:
+                log_file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+                size = log_file.tell()
+            metrics.inc("chat_log_records_total", len(batch))
+            if size >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            logger.error("Failed to write chat log batch of %d records: %s", len(batch), e)
+            metrics.inc("chat_log_dropped_total", len(batch))
+
+    def _rotate(self):
+        """Moves the active file to a compressed, timestamped segment and prunes old segments."""
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        segment = f"{self.path}.{stamp}"
+        os.replace(self.path, segment)
+        with open(segment, "rb") as src, gzip.open(f"{segment}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(segment)
+
+        segments = sorted(glob.glob(f"{glob.escape(self.path)}.*.gz"))
+        for old in segments[:-self.backup_count] if self.backup_count > 0 else segments:
+            os.remove(old)
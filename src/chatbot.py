@@ -1,13 +1,13 @@
 import os
 from dotenv import load_dotenv
+from src import vector_index
+from src.embeddings import get_embeddings
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
 from langchain_community.llms import HuggingFaceHub
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-import pickle
 
 
 # Load API key from .env file
@@ -20,6 +20,9 @@ os.environ["HUGGINGFACEHUB_API_TOKEN"]=HUGGINGFACE_API_KEY
 if not HUGGINGFACE_API_KEY:
     raise ValueError("API key not found! Set it in a .env file or environment variables.")
 
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"      #sentence-transformers/all-MiniLM-l6-v2
+EMBEDDING_KIND = "bge"
+
 
 def load_and_prepare_data(file_path):
     """Loads and prepares text data for embedding."""
@@ -31,11 +34,7 @@ def load_and_prepare_data(file_path):
 
 def create_vector_store(texts):
     """Creates a FAISS vector store from text data."""
-    embeddings=HuggingFaceBgeEmbeddings(
-        model_name="BAAI/bge-small-en-v1.5",      #sentence-transformers/all-MiniLM-l6-v2
-        model_kwargs={'device':'cpu'},
-        encode_kwargs={'normalize_embeddings':True}
-    )
+    embeddings = get_embeddings(EMBEDDING_MODEL_NAME, normalize=True, kind=EMBEDDING_KIND)
     vector_store = FAISS.from_documents(texts, embeddings)
     return vector_store
 
@@ -47,20 +46,19 @@ def create_retriever(file_path):
     return retriever
 
 def create_and_save_retriever(file_path, save_path):
-    """Creates a retriever and saves it."""
-    retriever = create_retriever(file_path)
-     # Save retriever to a .pkl file
-    with open(save_path, "wb") as f:
-        pickle.dump(retriever, f)
+    """Creates a retriever and publishes its index to the `save_path` directory."""
+    texts = load_and_prepare_data(file_path)
+    vector_store = create_vector_store(texts)
+    # The manifest records the BGE query instruction so load_retriever embeds queries the same way
+    vector_index.save_vector_store(vector_store, save_path, EMBEDDING_MODEL_NAME, embedding_kind=EMBEDDING_KIND)
     print(f"Retriever saved to {save_path}")
-    return retriever
+    return vector_store.as_retriever(search_type="similarity")
 
 def create_chatbot(file_path, mode="Retriever"):
 
     """Initializes the chatbot using Hugging Face models."""
     if mode == "Retriever":
-        with open(file_path, "rb") as f:
-            retriever = pickle.load(f)
+        retriever = vector_index.load_retriever(file_path)
         print("Retriever loaded successfully!")
     else:
         retriever = create_retriever(file_path)
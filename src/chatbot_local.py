@@ -1,6 +1,7 @@
 import os
-import pickle
 from dotenv import load_dotenv
+from src import vector_index
+from src.embedding_cache import CachedEmbeddings
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
@@ -34,6 +35,7 @@ def create_vector_store(texts):
         model_kwargs={'device': 'cpu'},
         encode_kwargs={'normalize_embeddings': True}
     )
+    embeddings = CachedEmbeddings(embeddings, "BAAI/bge-small-en-v1.5", normalize=True)
     vector_store = FAISS.from_documents(texts, embeddings)
     return vector_store
 
@@ -47,12 +49,12 @@ def create_retriever(file_path):
 
 
 def create_and_save_retriever(file_path, save_path):
-    """Creates a retriever and saves it."""
-    retriever = create_retriever(file_path)
-    with open(save_path, "wb") as f:
-        pickle.dump(retriever, f)
+    """Creates a retriever and publishes its index to the `save_path` directory."""
+    texts = load_and_prepare_data(file_path)
+    vector_store = create_vector_store(texts)
+    vector_index.save_vector_store(vector_store, save_path, "BAAI/bge-small-en-v1.5")
     print(f"Retriever saved to {save_path}")
-    return retriever
+    return vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 4})
 
 
 def create_chatbot(file_path, model_path, mode="Retriever"):
@@ -60,8 +62,7 @@ def create_chatbot(file_path, model_path, mode="Retriever"):
 
     # Load retriever
     if mode == "Retriever":
-        with open(file_path, "rb") as f:
-            retriever = pickle.load(f)
+        retriever = vector_index.load_retriever(file_path, {"k": 4})
         print("Retriever loaded successfully!")
     else:
         retriever = create_retriever(file_path)
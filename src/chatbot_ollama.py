@@ -1,23 +1,21 @@
-import torch
-import pickle
 from dotenv import load_dotenv
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaEmbeddings, OllamaLLM
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 # from langchain_core.prompts import ChatPromptTemplate
 import faiss  
 import time 
+from src import llm_client, metrics, vector_index
+from src.embeddings import device, get_embeddings
 
 
 # Load API key from .env file (not needed for local models but keeping for flexibility)
 load_dotenv()
 
-# Apple Silicon Optimization (MPS for Metal GPU)
-device = torch.device("mps") if torch.backends.mps.is_available() else "cpu"
+CHATBOT_MODEL = "Mistral"
+RETRIEVER_SEARCH_KWARGS = {"k": 10}   # default k = 4
 
 def load_and_prepare_data(file_path):
     """Loads and prepares text data for embedding."""
@@ -34,11 +32,7 @@ def create_vector_store(texts):
     start_time = time.time()
     print("🔄 Initializing Ollama Embeddings...")
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name="BAAI/bge-small-en-v1.5",
-        model_kwargs={'device': device},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    embeddings = get_embeddings()
     print("🔄 Setting FAISS threads...")
     faiss.omp_set_num_threads(6)  # Use multiple CPU threads for FAISS
     print("🔄 Generating embeddings and creating FAISS index...")
@@ -53,7 +47,7 @@ def create_retriever(file_path):
     """Creates a retriever from text data."""
     texts = load_and_prepare_data(file_path)
     vector_store = create_vector_store(texts)
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 10})   # default k = 4
+    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs=RETRIEVER_SEARCH_KWARGS)
     # retriever = vector_store.as_retriever(
     #                             search_type="similarity_score_threshold", 
     #                                 search_kwargs={"score_threshold": 0.7, "k": 4})   # default k = 4
@@ -64,13 +58,12 @@ def create_retriever(file_path):
 
 
 def create_and_save_retriever(file_path, save_path):
-    """Creates a retriever and saves it."""
-    retriever = create_retriever(file_path)
-    with open(save_path, "wb") as f:
-        pickle.dump(retriever, f)
+    """Creates a retriever and publishes its index to the `save_path` directory."""
+    texts = load_and_prepare_data(file_path)
+    # Only chunks that changed since the last published index are embedded, by the worker pool
+    vector_store = vector_index.update_index(save_path, texts)
     print(f"Retriever saved to {save_path}")
-    return retriever
-
+    return vector_store.as_retriever(search_type="similarity", search_kwargs=RETRIEVER_SEARCH_KWARGS)
 
 
 def create_chatbot(file_path, mode="Retriever"):
@@ -78,15 +71,14 @@ def create_chatbot(file_path, mode="Retriever"):
 
     # Load retriever
     if mode == "Retriever":
-        with open(file_path, "rb") as f:
-            retriever = pickle.load(f)
+        retriever = vector_index.load_retriever(file_path, RETRIEVER_SEARCH_KWARGS)
         print("Retriever loaded successfully!")
     else:
         retriever = create_retriever(file_path)
 
-    selected_model = "Mistral"
-    llm = OllamaLLM(model=selected_model, 
-                    base_url = "http://localhost:11434", 
+    # Shared across chatbot reloads, so a new retriever reuses the pooled model connections
+    llm = llm_client.get_langchain_llm(
+                    CHATBOT_MODEL,
                     temperature = 0.1, 
                     device = device,
                     system_message=(
@@ -137,6 +129,38 @@ def create_chatbot(file_path, mode="Retriever"):
     return chatbot
 
 
+async def aretrieve(chatbot, question):
+    """Runs only the chatbot's retrieval step; the result can be passed to aanswer/astream_answer."""
+    with metrics.timed("retrieval"):
+        return await chatbot.retriever.ainvoke(question)
+
+
+async def _aprepare_prompt(chatbot, question, docs=None):
+    """Returns (llm, formatted prompt), retrieving context unless `docs` were prefetched."""
+    if docs is None:
+        docs = await aretrieve(chatbot, question)
+    llm_chain = chatbot.combine_documents_chain.llm_chain
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return llm_chain.llm, llm_chain.prompt.format(context=context, question=question)
+
+
+async def aanswer(chatbot, question, docs=None):
+    """Answers a question with the chatbot, timing retrieval and generation separately."""
+    llm, prompt = await _aprepare_prompt(chatbot, question, docs)
+    async with llm_client.amodel_slot(CHATBOT_MODEL):
+        with metrics.timed("chatbot_llm"):
+            return await llm.ainvoke(prompt)
+
+
+async def astream_answer(chatbot, question, docs=None):
+    """Runs the chatbot's retrieval step and yields answer tokens as the LLM generates them."""
+    llm, prompt = await _aprepare_prompt(chatbot, question, docs)
+    async with llm_client.amodel_slot(CHATBOT_MODEL):
+        with metrics.timed("chatbot_llm"):
+            async for token in llm.astream(prompt):
+                yield token
+
+
 # # Example Usage:
 # chatbot = create_chatbot("data/combined_retriever.pkl", "model/meta-llama/Llama-3.2-1B")
 # response = chatbot.invoke({"query": "What is the capital of India?"})
@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+import threading
+from src.chatbot_ollama import create_chatbot
+from src.vector_index import is_index_dir, manifest_path
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) a request is allowed to stat the retriever for changes
+CHECK_INTERVAL = float(os.getenv("CHATBOT_CHECK_INTERVAL", "2"))
+
+
+def _file_stamp(path):
+    """
+    Returns a (mtime, size) stamp for the retriever, or None if it is missing. For an index
+    directory this is its manifest, which is replaced last when a new version is published.
+    """
+    if is_index_dir(path):
+        path = manifest_path(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class _Entry:
+    def __init__(self, chatbot, stamp):
+        self.chatbot = chatbot
+        self.stamp = stamp
+        self.checked_at = time.monotonic()
+
+
+class ChatbotPool:
+    """
+    Keeps one warm RetrievalQA chain per retriever path, shared by every request in the process.
+
+    The chain is built on first use. When the retriever changes on disk a replacement is
+    built in a background thread while requests keep using the current chain; the new chain is
+    only published (a single reference swap) once it has been fully loaded.
+    """
+
+    def __init__(self, loader=create_chatbot, check_interval=CHECK_INTERVAL):
+        self._loader = loader
+        self._check_interval = check_interval
+        self._entries = {}
+        self._locks = {}
+        self._reloading = set()
+        self._guard = threading.Lock()
+
+    def _lock_for(self, path):
+        with self._guard:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def _load(self, path):
+        """Builds a chain and returns it with the file stamp it was built from."""
+        stamp = _file_stamp(path)
+        chatbot = self._loader(path)
+        if _file_stamp(path) != stamp:
+            # The file changed while we were reading it; force another reload on the next check
+            stamp = None
+        return _Entry(chatbot, stamp)
+
+    def _reload_in_background(self, path):
+        def _run():
+            try:
+                with self._lock_for(path):
+                    self._entries[path] = self._load(path)
+                logger.info("Chatbot for %s reloaded", path)
+            except Exception as e:
+                # Keep serving the previous chain; the next check will retry
+                logger.error("Failed to reload chatbot for %s: %s", path, e)
+            finally:
+                with self._guard:
+                    self._reloading.discard(path)
+
+        with self._guard:
+            if path in self._reloading:
+                return
+            self._reloading.add(path)
+        threading.Thread(target=_run, name="chatbot-reload", daemon=True).start()
+
+    def get(self, path):
+        """Returns the shared chain for `path`, scheduling a hot-swap if the file has changed."""
+        entry = self._entries.get(path)
+
+        if entry is None:
+            with self._lock_for(path):
+                entry = self._entries.get(path)
+                if entry is None:
+                    entry = self._load(path)
+                    self._entries[path] = entry
+            return entry.chatbot
+
+        now = time.monotonic()
+        if now - entry.checked_at >= self._check_interval:
+            entry.checked_at = now
+            stamp = _file_stamp(path)
+            if stamp is not None and stamp != entry.stamp:
+                self._reload_in_background(path)
+
+        return entry.chatbot
+
+
+_pool = ChatbotPool()
+
+
+def get_chatbot(path):
+    """Returns the process-wide warm chatbot for the given retriever path."""
+    return _pool.get(path)
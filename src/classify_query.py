@@ -1,12 +1,41 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.linear_model import LogisticRegression
+"""
+Tier-0 query router: a calibrated classifier on sentence embeddings that decides
+balance / investment / other in a few milliseconds, so only ambiguous queries need the
+classifier LLM in src/query_llm.py.
+
+The classifier is trained offline and persisted with joblib:
+    python -m src.classify_query            # train and save to ROUTER_MODEL_PATH
+    python -m src.classify_query --eval     # also report cross-validated accuracy
+
+At runtime `route(text)` returns (category, probability), or (None, 0.0) when no trained
+router is available. Nothing is loaded or trained at import time.
+"""
+import os
+import re
+import time
+import logging
+import argparse
+import threading
 import numpy as np
 
-# Step 1: Use a compact sentence transformer
-model = SentenceTransformer('all-MiniLM-L6-v2')
+logger = logging.getLogger(__name__)
+
+ROUTER_MODEL_PATH = os.getenv("ROUTER_MODEL_PATH", "src/data/query_router.joblib")
+ROUTER_EMBEDDING_MODEL = os.getenv("ROUTER_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Routed answers below this calibrated probability fall through to the LLM classifier
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.85"))
+
+CATEGORIES = {
+    "balance": "balance_query",
+    "investment": "investment_query",
+    "other": "other_query",
+}
+
+# Wallet addresses carry no signal about the category; drop them before embedding
+ADDRESS_PATTERN = re.compile(r"\b0x[a-fA-F0-9]{40,64}\b|\b\d{50,80}\b")
 
-# Step 2: Training examples
-examples = [
+# Training examples
+EXAMPLES = [
     ("What is the current market value of my tokens?", "balance"),
     ("What is the status of my crypto assets?", "balance"),
     ("Show me my contract address balance", "balance"),
@@ -59,92 +88,169 @@ examples = [
     ("How can I stay updated on market trends?", "investment"),
     ("What is the best way to invest in crypto?", "investment"),
     ("0x04cced5156ab726bf0e0ca2afeb1f521de0362e748b8bdf07857b088dbc7b457  update to only vesu protocols investments", "investment"),
-    # ("Hi", "other"),
-    # ("Hello", "other"),
-    # ("Goodbye", "other"),
-    # ("Thanks", "other"),
-    # ("What is your name?", "other"),
-    # ("Can you help me?", "other"),
-    # ("Tell me a joke", "other"),
-    # ("What is the weather like?", "other"),
-    # ("How are you?", "other"),
-    # ("What is your favorite color?", "other"),
-    # ("Do you like music?", "other"),
-    # ("What is your hobby?", "other"),
-    # ("Can you play a game?", "other"),
-    # ("What is your favorite food?", "other"),
-    # ("Tell me a story", "other"),
-    # ("What is your favorite movie?", "other"),
-    # ("What is your favorite book?", "other"),
-    # ("Can you sing?", "other"),
-    # ("What is your favorite sport?", "other"),
-    # ("Do you have any pets?", "other"),
-    # ("What is your favorite season?", "other"),
-    # ("Can you dance?", "other"),
-    # ("What is your favorite place to visit?", "other"),
-    # ("What is your dream job?", "other"),
-    # ("Do you like to travel?", "other"),
-    # ("What is your favorite animal?", "other"),
-    # ("Can you tell me a secret?", "other"),
-    # ("What is your favorite holiday?", "other"),
-    # ("What is Starknet", "other"),
-    # ("What is Ethereum", "other"),
-    # ("What is Bitcoin", "other"),
-    # ("What is a blockchain", "other"),
-    # ("What is a smart contract", "other"),
-    # ("What is DeFi", "other"),
-    # ("What is a token", "other"),
-    # ("What is a wallet", "other"),
-    # ("What is a DApp", "other"),
-    # ("What is a DAO", "other"),
-    # ("What is a cryptocurrency", "other"),
-    # ("What is an NFT", "other"),
-    # ("What is yield farming", "other"),
-    # ("What is liquidity mining", "other"),
-    # ("What is staking", "other"),
-    # ("What is a liquidity pool", "other"),
-    # ("What is a decentralized exchange", "other"),
-    # ("What is a centralized exchange", "other"),
-    # ("What is a market maker", "other"),
-    # ("What is a market taker", "other"),
-    # ("What is a limit order", "other"),
-    # ("What is a market order", "other"),
-    # ("What is a stop loss order", "other"),
-    # ("What is a take profit order", "other"),
-    # ("What is a candlestick chart", "other"),
-    # ("What is a trading strategy", "other"),
-    # ("What is technical analysis", "other"),
-    # ("What is fundamental analysis", "other"),
-    # ("What is sentiment analysis", "other"),
-    # ("What is a trading bot", "other"),
-    # ("What is algorithmic trading", "other"),
-    # ("What is high-frequency trading", "other"),
-    # ("What is a trading signal", "other"),
-    # ("What is a trading indicator", "other"),
-    # ("What is a trading platform", "other"),
-    # ("What is a trading account", "other"),
-    # ("What is a trading fee", "other"),
-    # ("What is a trading pair", "other"),
-    # ("What is a trading volume", "other"),
-    # ("What is a trading history", "other"),
-    # ("What is a trading journal", "other"),
+    ("Hi", "other"),
+    ("Hello", "other"),
+    ("Goodbye", "other"),
+    ("Thanks", "other"),
+    ("What is your name?", "other"),
+    ("Can you help me?", "other"),
+    ("Tell me a joke", "other"),
+    ("What is the weather like?", "other"),
+    ("How are you?", "other"),
+    ("What is your favorite color?", "other"),
+    ("Do you like music?", "other"),
+    ("What is your hobby?", "other"),
+    ("Can you play a game?", "other"),
+    ("What is your favorite food?", "other"),
+    ("Tell me a story", "other"),
+    ("What is your favorite movie?", "other"),
+    ("What is your favorite book?", "other"),
+    ("Can you sing?", "other"),
+    ("What is your favorite sport?", "other"),
+    ("Do you have any pets?", "other"),
+    ("What is your favorite season?", "other"),
+    ("Can you dance?", "other"),
+    ("What is your favorite place to visit?", "other"),
+    ("What is your dream job?", "other"),
+    ("Do you like to travel?", "other"),
+    ("What is your favorite animal?", "other"),
+    ("Can you tell me a secret?", "other"),
+    ("What is your favorite holiday?", "other"),
+    ("What is Starknet", "other"),
+    ("What is Ethereum", "other"),
+    ("What is Bitcoin", "other"),
+    ("What is a blockchain", "other"),
+    ("What is a smart contract", "other"),
+    ("What is DeFi", "other"),
+    ("What is a token", "other"),
+    ("What is a wallet", "other"),
+    ("What is a DApp", "other"),
+    ("What is a DAO", "other"),
+    ("What is a cryptocurrency", "other"),
+    ("What is an NFT", "other"),
+    ("What is yield farming", "other"),
+    ("What is liquidity mining", "other"),
+    ("What is staking", "other"),
+    ("What is a liquidity pool", "other"),
+    ("What is a decentralized exchange", "other"),
+    ("What is a centralized exchange", "other"),
+    ("What is a market maker", "other"),
+    ("What is a market taker", "other"),
+    ("What is a limit order", "other"),
+    ("What is a market order", "other"),
+    ("What is a stop loss order", "other"),
+    ("What is a take profit order", "other"),
+    ("What is a candlestick chart", "other"),
+    ("What is a trading strategy", "other"),
+    ("What is technical analysis", "other"),
+    ("What is fundamental analysis", "other"),
+    ("What is sentiment analysis", "other"),
+    ("What is a trading bot", "other"),
+    ("What is algorithmic trading", "other"),
+    ("What is high-frequency trading", "other"),
+    ("What is a trading signal", "other"),
+    ("What is a trading indicator", "other"),
+    ("What is a trading platform", "other"),
+    ("What is a trading account", "other"),
+    ("What is a trading fee", "other"),
+    ("What is a trading pair", "other"),
+    ("What is a trading volume", "other"),
+    ("What is a trading history", "other"),
+    ("What is a trading journal", "other"),
 ]
 
-# Step 3: Prepare data
-X_train = model.encode([x[0] for x in examples])
-y_train = [x[1] for x in examples]
 
-# Step 4: Train classifier
-clf = LogisticRegression()
-clf.fit(X_train, y_train)
+def _prepare(text):
+    return " ".join(ADDRESS_PATTERN.sub(" ", text).split())
+
+
+_lock = threading.Lock()
+_encoders = {}
+_router = None
+_router_mtime = None
+
+
+def _encoder(model_name):
+    """Loads a sentence transformer once per process."""
+    with _lock:
+        if model_name not in _encoders:
+            from sentence_transformers import SentenceTransformer
+            _encoders[model_name] = SentenceTransformer(model_name)
+        return _encoders[model_name]
+
+
+def train(examples=EXAMPLES, path=ROUTER_MODEL_PATH, model_name=ROUTER_EMBEDDING_MODEL, evaluate=False):
+    """Trains the calibrated router on `examples` and saves it to `path`."""
+    import joblib
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import cross_val_score
+
+    encoder = _encoder(model_name)
+    X_train = encoder.encode([_prepare(text) for text, _ in examples], normalize_embeddings=True)
+    y_train = [CATEGORIES[label] for _, label in examples]
+
+    # Sigmoid calibration turns the logistic scores into probabilities we can threshold on
+    classifier = CalibratedClassifierCV(LogisticRegression(max_iter=1000, C=4.0), method="sigmoid", cv=5)
+    if evaluate:
+        scores = cross_val_score(classifier, X_train, y_train, cv=5)
+        print(f"Cross-validated accuracy: {scores.mean():.3f} (+/- {scores.std():.3f})")
+    classifier.fit(X_train, y_train)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    joblib.dump({"embedding_model": model_name, "classifier": classifier}, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Router trained on {len(examples)} examples and saved to {path}")
+    return classifier
+
+
+def load_router(path=ROUTER_MODEL_PATH):
+    """Returns the persisted router, reloading it if the file changed, or None if there is none."""
+    global _router, _router_mtime
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _router_mtime:
+        import joblib
+        with _lock:
+            if mtime != _router_mtime:
+                _router = joblib.load(path)
+                _router_mtime = mtime
+                logger.info("Loaded query router from %s", path)
+    return _router
+
+
+def route(text, path=ROUTER_MODEL_PATH):
+    """
+    Classifies `text` into balance_query / investment_query / other_query.
+
+    Returns (category, probability). Callers should only trust categories whose probability
+    reaches ROUTER_MIN_CONFIDENCE. Returns (None, 0.0) if no router has been trained or it
+    cannot be used, so the caller simply falls back to the LLM classifier.
+    """
+    try:
+        router = load_router(path)
+        if router is None:
+            return None, 0.0
+        embedding = _encoder(router["embedding_model"]).encode([_prepare(text)], normalize_embeddings=True)
+        probabilities = router["classifier"].predict_proba(embedding)[0]
+    except Exception as e:
+        logger.warning("Query router unavailable: %s", e)
+        return None, 0.0
+    best = int(np.argmax(probabilities))
+    return router["classifier"].classes_[best], float(probabilities[best])
+
 
-# Function to classify new text
-def classify_query(text):
-    embedding = model.encode([text])
-    prediction = clf.predict(embedding)
-    return prediction[0]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the tier-0 query router")
+    parser.add_argument("--path", default=ROUTER_MODEL_PATH)
+    parser.add_argument("--eval", action="store_true", help="Report cross-validated accuracy")
+    args = parser.parse_args()
+    train(path=args.path, evaluate=args.eval)
 
-# Example
-print(classify_query("suggest where to put my tokens"))  # investment
-print(classify_query("Tokens in my account"))           # balance
-print(classify_query("What is Starknet"))                # other
+    for query in ("suggest where to put my tokens", "Tokens in my account", "What is Starknet"):
+        start = time.perf_counter()
+        category, probability = route(query, args.path)
+        print(f"{query!r}: {category} ({probability:.2f}) in {(time.perf_counter() - start) * 1000:.1f} ms")
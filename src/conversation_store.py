@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# CONVERSATION_STORE selects the backend: "memory" (default) or "sqlite:///path/to/file.db"
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory")
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL_SECONDS", str(24 * 3600)))
+CONVERSATION_MAX_CHATS = int(os.getenv("CONVERSATION_MAX_CHATS", "10000"))
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rough per-message bookkeeping cost on top of the text itself
+_MESSAGE_OVERHEAD = 200
+
+
+def _history_size(history):
+    return sum(len(m.get("content", "")) + len(m.get("role", "")) + _MESSAGE_OVERHEAD for m in history)
+
+
+class MemoryConversationStore:
+    """
+    In-process conversation store with LRU eviction, a TTL and a memory cap.
+
+    Only the last `max_history` user messages of each chat are kept, and the least recently
+    used chats are dropped once either `max_chats` or `max_bytes` is exceeded.
+    """
+
+    def __init__(self, ttl=CONVERSATION_TTL, max_chats=CONVERSATION_MAX_CHATS, max_bytes=CONVERSATION_MAX_BYTES):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self._chats = OrderedDict()  # chat_id -> (history, updated_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, chat_id):
+        _, _, size = self._chats.pop(chat_id)
+        self._bytes -= size
+
+    def _evict(self, now):
+        # Oldest entries sit at the front of the OrderedDict
+        while self._chats:
+            chat_id, (_, updated_at, _) = next(iter(self._chats.items()))
+            expired = now - updated_at > self.ttl
+            if not (expired or len(self._chats) > self.max_chats or self._bytes > self.max_bytes):
+                break
+            self._drop(chat_id)
+
+    def _history(self, chat_id, now):
+        entry = self._chats.get(chat_id)
+        if entry is None or now - entry[1] > self.ttl:
+            return []
+        return entry[0]
+
+    def get(self, chat_id):
+        """Returns the stored history for a chat, or an empty list if it is unknown or expired."""
+        with self._lock:
+            return list(self._history(chat_id, time.time()))
+
+    def append(self, chat_id, messages, max_history):
+        """Appends messages to a chat, keeps the last `max_history`, and returns the new history."""
+        now = time.time()
+        with self._lock:
+            previous = self._history(chat_id, now)
+            history = (previous + list(messages))[-max_history:]
+            if chat_id in self._chats:
+                self._drop(chat_id)
+            size = _history_size(history)
+            self._chats[chat_id] = (history, now, size)
+            self._bytes += size
+            self._evict(now)
+            return list(history)
+
+    def __len__(self):
+        return len(self._chats)
+
+
+class SQLiteConversationStore:
+    """
+    Conversation store backed by a SQLite file, so several worker processes share chats.
+
+    Appends run in an immediate transaction, so concurrent workers updating the same chat do
+    not lose messages. Expired chats and chats beyond `max_chats` are purged periodically.
+    """
+
+    def __init__(self, path, ttl=CONVERSATION_TTL, max_chats=CONVERSATION_MAX_CHATS, purge_interval=60.0):
+        self.path = path
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                chat_id TEXT PRIMARY KEY,
+                history TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations(updated_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, chat_id):
+        """Returns the stored history for a chat, or an empty list if it is unknown or expired."""
+        row = self._connect().execute(
+            "SELECT history FROM conversations WHERE chat_id = ? AND updated_at >= ?",
+            (str(chat_id), time.time() - self.ttl),
+        ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def append(self, chat_id, messages, max_history):
+        """Appends messages to a chat, keeps the last `max_history`, and returns the new history."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT history, updated_at FROM conversations WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+            previous = json.loads(row[0]) if row and now - row[1] <= self.ttl else []
+            history = (previous + list(messages))[-max_history:]
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (chat_id, history, updated_at) VALUES (?, ?, ?)",
+                (str(chat_id), json.dumps(history), now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            self.purge(now)
+        return history
+
+    def purge(self, now=None):
+        """Deletes expired chats and the least recently used ones beyond `max_chats`."""
+        now = now or time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM conversations WHERE updated_at < ?", (now - self.ttl,))
+        conn.execute("""
+            DELETE FROM conversations WHERE chat_id IN (
+                SELECT chat_id FROM conversations ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_chats,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+
+def create_conversation_store(spec=CONVERSATION_STORE):
+    """Builds the conversation store described by `spec` ("memory" or "sqlite:///path")."""
+    if spec.startswith("sqlite:///"):
+        path = spec[len("sqlite:///"):]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return SQLiteConversationStore(path)
+    if spec == "memory":
+        return MemoryConversationStore()
+    raise ValueError(f"Unknown CONVERSATION_STORE: {spec}")
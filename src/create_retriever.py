@@ -6,7 +6,7 @@ import random
 import logging
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
-from chatbot_ollama import create_and_save_retriever  # Import chatbot retriever function
+from src.chatbot_ollama import create_and_save_retriever  # Import chatbot retriever function (run as `python -m src.create_retriever`)
 import json
 # ────────────────────────────────────────────────────────────────────
 # Configuration
@@ -231,7 +231,7 @@ async def scrape_selected_websites():
 
     # 🔥 Save combined file
     combined_file_path = os.path.join(DATA_DIR, "combined.txt")
-    save_path = os.path.join(DATA_DIR, "combined_retriever.pkl")
+    save_path = os.path.join(DATA_DIR, "combined_index")
     save_combined_text_file(all_data_files, combined_file_path)
 
     # 🔥 Pass the combined file to retriever
@@ -239,4 +239,6 @@ async def scrape_selected_websites():
 
     logging.info("✅ Retriever updated!")
 
-asyncio.run(scrape_selected_websites())
+# Guarded so the spawned embedding workers can import this module without re-running the build
+if __name__ == "__main__":
+    asyncio.run(scrape_selected_websites())
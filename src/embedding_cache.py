@@ -0,0 +1,272 @@
+"""
+Disk-backed cache of text embeddings shared by index builds and query-time embedding.
+
+Vectors are stored in SQLite as raw little-endian float32 blobs, keyed by embedding model,
+normalization flag, kind (document or query, since some models embed queries with an
+instruction prefix) and the SHA-256 of the text. The cache is bounded to
+EMBEDDING_CACHE_MAX_ENTRIES; when it grows past that, the least recently used entries are
+evicted. Set EMBEDDING_CACHE_PATH to an empty string to disable it.
+
+    python -m src.embedding_cache            # print entry count, size and hit rate
+    python -m src.embedding_cache --clear    # drop every cached vector
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "src/data/embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+# Eviction trims the cache to this fraction of the bound so it does not run on every insert
+EVICT_TO = 0.9
+# Stay under SQLite's limit on bound parameters per statement
+QUERY_BATCH = 500
+# Hits only buffer their last-used time; the buffer is written with the next insert, or once
+# it holds this many entries, so lookups never wait for SQLite's write lock
+TOUCH_BUFFER = 4096
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    normalize INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    text_hash BLOB NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    UNIQUE (model, normalize, kind, text_hash)
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    SQLite store of embedding vectors. One connection per thread; several processes may
+    share the file (WAL mode), e.g. the API workers and an index build. Lookups only read:
+    the recency of hits is kept in memory and written together with the next insert.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._count = None
+        self._touched = {}
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model, normalize, kind, texts):
+        """Returns one vector (float32 array) or None per text."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        try:
+            conn = self._connection()
+            for start in range(0, len(hashes), QUERY_BATCH):
+                batch = list(set(hashes[start:start + QUERY_BATCH]))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND normalize = ? AND kind = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, int(normalize), kind, *batch],
+                ).fetchall()
+                found.update((bytes(h), np.frombuffer(v, dtype="<f4")) for h, v in rows)
+            if found:
+                self._touch(conn, model, normalize, kind, found)
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache %s unavailable: %s", self.path, e)
+            found = {}
+
+        vectors = [found.get(h) for h in hashes]
+        hits = sum(vector is not None for vector in vectors)
+        self._record(hits, len(vectors) - hits)
+        return vectors
+
+    def put_many(self, model, normalize, kind, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype="<f4")
+            rows.append((model, int(normalize), kind, text_hash(text), vector.shape[0], vector.tobytes(), now))
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, normalize, kind, text_hash, dim, vector, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._flush_touches(conn)
+            self._evict(conn, len(rows))
+        except sqlite3.Error as e:
+            logger.warning("Could not write to embedding cache %s: %s", self.path, e)
+
+    def _touch(self, conn, model, normalize, kind, hashes):
+        now = time.time()
+        with self._lock:
+            for h in hashes:
+                self._touched[(model, int(normalize), kind, h)] = now
+            full = len(self._touched) >= TOUCH_BUFFER
+        if full:
+            with conn:
+                self._flush_touches(conn)
+
+    def _flush_touches(self, conn):
+        """Writes buffered hit times; call inside a transaction on `conn`."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany(
+                "UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE model = ? AND normalize = ? AND kind = ? "
+                "AND text_hash = ?",
+                [(used, *key) for key, used in touched.items()],
+            )
+
+    def _evict(self, conn, inserted):
+        with self._lock:
+            if self._count is None:
+                self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            else:
+                self._count += inserted
+            if self._count <= self.max_entries:
+                return
+            # Recount: other processes may have written or evicted in the meantime
+            self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = self._count - int(self.max_entries * EVICT_TO)
+            if excess <= 0:
+                return
+            with conn:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+            self._count -= excess
+            metrics.inc("cache_evictions_total", excess, cache="embeddings")
+            logger.info("Evicted %d entries from embedding cache %s", excess, self.path)
+
+    def _record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if hits:
+            metrics.inc("cache_hits_total", hits, cache="embeddings")
+        if misses:
+            metrics.inc("cache_misses_total", misses, cache="embeddings")
+
+    def stats(self):
+        """Entry count and size on disk, plus this process's hits and misses."""
+        conn = self._connection()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "vector_bytes": size,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM embeddings")
+        with self._lock:
+            self._count = 0
+            self._touched = {}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path=EMBEDDING_CACHE_PATH):
+    """The process-wide cache for `path`, or None when caching is disabled."""
+    if not path:
+        return None
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = EmbeddingCache(path)
+        return cache
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a LangChain Embeddings object so that only texts missing from the cache are sent
+    to the model. `model_name` and `normalize` must describe the wrapped model, as they key
+    the cached vectors.
+    """
+
+    def __init__(self, embeddings, model_name, normalize=True, cache=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.normalize = normalize
+        self.cache = cache or get_cache()
+
+    def _embed(self, kind, texts, embed):
+        if self.cache is None:
+            return embed(texts)
+        vectors = self.cache.get_many(self.model_name, self.normalize, kind, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = embed(missing_texts)
+            self.cache.put_many(self.model_name, self.normalize, kind, missing_texts, fresh)
+            by_text = dict(zip(missing_texts, fresh))
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+    def embed_documents(self, texts):
+        return self._embed("document", list(texts), self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed("query", [text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the on-disk embedding cache.")
+    parser.add_argument("--path", default=EMBEDDING_CACHE_PATH)
+    parser.add_argument("--clear", action="store_true", help="delete every cached vector")
+    args = parser.parse_args()
+
+    cache = EmbeddingCache(args.path)
+    if args.clear:
+        cache.clear()
+        print(f"Cleared {args.path}")
+    stats = cache.stats()
+    print(f"{stats['entries']} vectors ({stats['vector_bytes'] / 1e6:.1f} MB of vectors, "
+          f"{stats['file_bytes'] / 1e6:.1f} MB on disk, bound {stats['max_entries']}) in {stats['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Batched, multi-process embedding for index builds.
+
+Texts are split into EMBEDDING_BATCH_SIZE batches and embedded by a pool of worker processes,
+each pinned to its own set of CPU cores (EMBEDDING_THREADS_PER_WORKER cores, one torch thread
+per core) so workers do not compete for the same cores. Batches are yielded as they finish,
+so callers can add vectors to the index while the rest is still being embedded. Texts already
+in the embedding cache are served from it and only the misses reach the workers.
+"""
+import os
+import time
+import multiprocessing
+import numpy as np
+from src.embedding_cache import get_cache
+from src.embeddings import device, get_embeddings
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# 0 picks one worker per EMBEDDING_THREADS_PER_WORKER cores on CPU and a single in-process
+# model when a GPU is used; 1 always embeds in-process
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "0"))
+EMBEDDING_THREADS_PER_WORKER = int(os.getenv("EMBEDDING_THREADS_PER_WORKER", "2"))
+# Progress is printed every this many batches
+PROGRESS_EVERY = 20
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def resolve_workers(workers=EMBEDDING_WORKERS, threads_per_worker=EMBEDDING_THREADS_PER_WORKER):
+    if workers > 0:
+        return workers
+    if str(device) != "cpu":
+        return 1
+    return max(1, len(available_cores()) // max(1, threads_per_worker))
+
+
+def core_groups(workers, threads_per_worker=EMBEDDING_THREADS_PER_WORKER):
+    """Splits the cores this process may use into one disjoint group per worker."""
+    cores = available_cores()
+    per_worker = max(1, min(threads_per_worker, len(cores) // workers))
+    groups = [cores[i * per_worker:(i + 1) * per_worker] for i in range(workers)]
+    # More workers than cores: share round-robin rather than leave a worker unpinned
+    return [group or [cores[i % len(cores)]] for i, group in enumerate(groups)]
+
+
+_model = None
+
+
+def _init_worker(model_name, normalize, core_queue):
+    global _model
+    cores = core_queue.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(len(cores))
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _model = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': normalize}
+    )
+
+
+def _embed_batch(texts):
+    return np.asarray(_model.embed_documents(texts), dtype=np.float32)
+
+
+class EmbeddingPool:
+    """Worker processes that each load `model_name` once; use as a context manager."""
+
+    def __init__(self, model_name, normalize=True, workers=EMBEDDING_WORKERS,
+                 threads_per_worker=EMBEDDING_THREADS_PER_WORKER):
+        self.model_name = model_name
+        self.normalize = normalize
+        self.workers = resolve_workers(workers, threads_per_worker)
+        self.threads_per_worker = threads_per_worker
+        self._pool = None
+
+    def __enter__(self):
+        # Spawned rather than forked: torch's thread pools do not survive a fork
+        context = multiprocessing.get_context("spawn")
+        core_queue = context.Queue()
+        for group in core_groups(self.workers, self.threads_per_worker):
+            core_queue.put(group)
+        self._pool = context.Pool(self.workers, _init_worker, (self.model_name, self.normalize, core_queue))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+
+    def imap(self, batches):
+        """Embeds batches of texts, yielding float32 arrays in input order."""
+        return self._pool.imap(_embed_batch, batches)
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def embed_stream(texts, model_name, normalize=True, batch_size=EMBEDDING_BATCH_SIZE, workers=EMBEDDING_WORKERS):
+    """
+    Embeds `texts` and yields (positions, vectors) batches: numpy index arrays into `texts` and
+    the float32 vectors for them. Cached texts come first, then freshly embedded batches as
+    the workers finish them; every fresh batch is written back to the embedding cache.
+    """
+    cache = get_cache()
+    positions = np.arange(len(texts))
+    if cache is not None:
+        cached = cache.get_many(model_name, normalize, "document", texts)
+        hits = [i for i, vector in enumerate(cached) if vector is not None]
+        for batch in _batches(hits, batch_size):
+            yield np.array(batch), np.stack([cached[i] for i in batch])
+        positions = np.array([i for i, vector in enumerate(cached) if vector is None], dtype=np.int64)
+        print(f"🔄 {len(hits)} of {len(texts)} chunks served from the embedding cache")
+
+    if not len(positions):
+        return
+    workers = resolve_workers(workers)
+    batches = list(_batches(positions, batch_size))
+    text_batches = ([texts[i] for i in batch] for batch in batches)
+    print(f"🔄 Embedding {len(positions)} chunks in {len(batches)} batches of {batch_size} with {workers} worker(s)...")
+    started = time.perf_counter()
+
+    def report(done, final=False):
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        print(f"{'✅' if final else '🔄'} Embedded {done}/{len(positions)} chunks ({rate:.1f} chunks/s)")
+
+    def consume(results):
+        done = 0
+        for number, (batch, vectors) in enumerate(zip(batches, results), 1):
+            if cache is not None:
+                cache.put_many(model_name, normalize, "document", [texts[i] for i in batch], vectors)
+            done += len(batch)
+            if number % PROGRESS_EVERY == 0:
+                report(done)
+            yield batch, vectors
+        report(done, final=True)
+
+    if workers == 1:
+        model = get_embeddings(model_name, normalize).embeddings
+        yield from consume(np.asarray(model.embed_documents(batch), dtype=np.float32) for batch in text_batches)
+    else:
+        with EmbeddingPool(model_name, normalize, workers) as pool:
+            yield from consume(pool.imap(text_batches))
@@ -0,0 +1,42 @@
+import os
+import torch
+from functools import lru_cache
+from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+from src.embedding_cache import CachedEmbeddings
+
+# Apple Silicon Optimization (MPS for Metal GPU)
+device = torch.device("mps") if torch.backends.mps.is_available() else "cpu"
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+# How queries are embedded: "huggingface" embeds them like documents, "bge" prefixes them
+# with the BGE retrieval instruction (LangChain's HuggingFaceBgeEmbeddings)
+EMBEDDING_KINDS = ("huggingface", "bge")
+
+
+def cache_model_name(model_name, kind="huggingface"):
+    """Model name the embedding cache keys vectors under; kinds embed queries differently."""
+    return model_name if kind == "huggingface" else f"{kind}:{model_name}"
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model_name=EMBEDDING_MODEL, normalize=True, kind="huggingface"):
+    """
+    Loads the sentence embedding model once per process and shares it between callers.
+    Vectors go through the on-disk embedding cache, so only unseen texts reach the model.
+    """
+    if kind == "huggingface":
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device},
+            encode_kwargs={'normalize_embeddings': normalize}
+        )
+    elif kind == "bge":
+        embeddings = HuggingFaceBgeEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device},
+            encode_kwargs={'normalize_embeddings': normalize}
+        )
+    else:
+        raise ValueError(f"Unknown embedding kind {kind!r}; expected one of {', '.join(EMBEDDING_KINDS)}")
+    return CachedEmbeddings(embeddings, cache_model_name(model_name, kind), normalize)
@@ -1,19 +1,23 @@
-from langchain_ollama import OllamaLLM  
-import re  
+import os
+import json
+from src import llm_client
+from src.single_flight import AsyncSingleFlight, SingleFlight, normalize_prompt
 
 model_name = "deepseek-r1"
 # model_name = "mistral"
 
-def classify_risk(statement: str, model_name=model_name):
-    """Classifies the user's risk appetite based on their statement."""
-    try:
-        filters_bot = OllamaLLM(
-            model=model_name,
-            base_url="http://localhost:11434",  
-            temperature=0.1  
-        )
+# Cheapest model first; deepseek-r1 only sees statements the smaller model cannot settle
+CASCADE_MODELS = [m.strip() for m in os.getenv("FILTER_CASCADE_MODELS", f"mistral,{model_name}").split(",") if m.strip()]
+CASCADE_SAMPLES = int(os.getenv("FILTER_CASCADE_SAMPLES", "2"))
+
+RISK_PROFILES = {"risk averse": "Risk averse", "balanced": "Balanced", "aggressive": "Aggressive", "none": "None"}
+RISK_LEVELS = ("low", "medium", "high")
 
-        query = f"""Analyze the following user statement and classify the user's investment preferences into the following categories, and return the result in a single JSON object:
+# Identical statements that are in flight at the same time share one generation
+_risk_flight = SingleFlight("classify_risk")
+_arisk_flight = AsyncSingleFlight("classify_risk")
+
+RISK_PROMPT = """Analyze the following user statement and classify the user's investment preferences into the following categories, and return the result in a single JSON object:
 
         - `risk_profile`: One of `"Risk averse"`, `"Balanced"`, `"Aggressive"`, or `"None"` (plain text, not a list). Use `"Risk averse"` if the user mentions only low-risk investments, `"Balanced"` for a mix, and `"Aggressive"` if the user prefers high-risk opportunities. If no preference is mentioned, use `"None"`.
 
@@ -35,17 +39,96 @@ def classify_risk(statement: str, model_name=model_name):
 
         User statement: {statement}"""
 
-        # and a brief justification for your classification
-        
-        response = filters_bot.invoke(query)
-        
-        if not isinstance(response, str):
-            raise ValueError("Unexpected response type from model.")
-
-        # Clean up any potential unwanted tags
-        cleaned_text = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
-        print(cleaned_text)
-        return cleaned_text
+
+def validate_filters(filters):
+    """
+    Checks a model answer against the classify_risk schema and returns it normalised (so two
+    answers can be compared for consistency). Raises ValueError if it does not fit.
+    """
+    if not isinstance(filters, dict):
+        raise ValueError("Filter answer is not a JSON object")
+    risk_profile = RISK_PROFILES.get(str(filters.get("risk_profile") or "None").strip().lower())
+    if risk_profile is None:
+        raise ValueError(f"Unknown risk_profile: {filters.get('risk_profile')!r}")
+
+    def string_list(name):
+        value = filters.get(name) or []
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError(f"{name} must be a list of strings")
+        return sorted({v.strip().lower() for v in value if v.strip()})
+
+    def number(name):
+        value = filters.get(name) or 0
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"{name} must be a non-negative number")
+        return value
+
+    risk_levels = string_list("risk_levels")
+    if any(level not in RISK_LEVELS for level in risk_levels):
+        raise ValueError(f"Unknown risk_levels: {risk_levels}")
+    if risk_levels and risk_profile != "None":
+        raise ValueError("Only one of risk_profile or risk_levels may be set")
+    is_audited = filters.get("is_audited", False)
+    if not isinstance(is_audited, bool):
+        raise ValueError("is_audited must be a boolean")
+
+    return {
+        "risk_profile": risk_profile,
+        "risk_levels": risk_levels,
+        "is_audited": is_audited,
+        "protocols": string_list("protocols"),
+        "min_tvl": number("min_tvl"),
+        "apy": number("apy"),
+        "assets": [asset.upper() for asset in string_list("assets")],
+    }
+
+
+_cascade = llm_client.Cascade("classify_risk", CASCADE_MODELS, validate_filters, samples=CASCADE_SAMPLES)
+
+
+def _format_filters(filters):
+    """
+    Serialises the filter object found in the model output. The JSON is read from the token
+    stream and generation stops at its closing brace, so reasoning (<think>) output and
+    anything after the object never reach the caller.
+    """
+    cleaned_text = json.dumps(filters)
+    print(cleaned_text)
+    return cleaned_text
+
+
+def classify_risk(statement: str, model_name=None):
+    """
+    Classifies the user's risk appetite based on their statement. Without `model_name` the
+    model cascade (CASCADE_MODELS) is used; with it, only that model is asked.
+    """
+    key = (model_name or "cascade", normalize_prompt(statement))
+    return _risk_flight.do(key, _classify_risk, statement, model_name)
+
+
+def _classify_risk(statement, model_name):
+    try:
+        query = RISK_PROMPT.format(statement=statement)
+        if model_name is None:
+            return _format_filters(_cascade.invoke(query))
+        return _format_filters(llm_client.invoke_json(model_name, query, caller="classify_risk"))
+
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+async def aclassify_risk(statement: str, model_name=None):
+    """Async variant of classify_risk that awaits the model without blocking the event loop."""
+    key = (model_name or "cascade", normalize_prompt(statement))
+    return await _arisk_flight.do(key, _aclassify_risk, statement, model_name)
+
+
+async def _aclassify_risk(statement, model_name):
+    try:
+        query = RISK_PROMPT.format(statement=statement)
+        if model_name is None:
+            return _format_filters(await _cascade.ainvoke(query))
+        return _format_filters(await llm_client.ainvoke_json(model_name, query, caller="classify_risk"))
 
     except Exception as e:
         return f"Error: {str(e)}"
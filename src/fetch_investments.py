@@ -2,6 +2,8 @@ import os
 import asyncio
 from extract_apy import vesu_investment_options, strkfarm_investment_options, endur_investment_options  # Import the async function
 import json
+import hashlib
+from datetime import datetime, timezone
 
 VESU_API_URL = os.getenv("VESU_API_URL")
 STRKFARM_API_URL = os.getenv("STRKFARM_API_URL")
@@ -40,14 +42,29 @@ def load_json(filename):
             return json.load(file)
     return None
 
+def publish_version(data_path, payload):
+    """Writes the snapshot version file that invalidates cached investment plans."""
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    version = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{digest}"
+    tmp_path = f"{data_path}.version.tmp"
+    with open(tmp_path, "w") as v_file:
+        v_file.write(version)
+    os.replace(tmp_path, f"{data_path}.version")
+    return version
+
 def combine_and_save(vesu_json, strkfarm_json, endur_json):
     """Combines the two investment data sets and saves the result"""
     combined_data = vesu_json + strkfarm_json + endur_json
+    payload = json.dumps(combined_data, indent=4)
+
+    # Swap the file in atomically, then publish the new version for the plan cache
+    tmp_path = f"{APY_DATA_LOC}.tmp"
+    with open(tmp_path, "w") as c_file:
+        c_file.write(payload)
+    os.replace(tmp_path, APY_DATA_LOC)
+    version = publish_version(APY_DATA_LOC, payload)
     
-    with open(APY_DATA_LOC, "w") as c_file:
-        json.dump(combined_data, c_file, indent=4)
-    
-    print(f"Combined data saved to {APY_DATA_LOC}")
+    print(f"Combined data saved to {APY_DATA_LOC} (version {version})")
 
 async def main():
     """Main function to run the script"""
@@ -1,92 +1,220 @@
-import spacy
-from rapidfuzz import process, fuzz
-
-# Load NLP model
-nlp = spacy.load("en_core_web_sm")
-
-# Define filter categories with synonyms
-RISK_LEVELS = ["low", "medium", "high"]
-RISK_SYNONYMS = {
-    "low": ["low", "safe", "conservative", "minimal risk"],
-    "medium": ["medium", "moderate", "balanced"],
-    "high": ["high", "risky", "aggressive"]
-}
-
-PROTOCOL_TYPES = ["lending", "amm", "yield aggregators", "staking", "derivatives"]
-PROTOCOL_SYNONYMS = {
-    "lending": ["lending", "borrowing", "loan"],
-    "amm": ["amm", "automated market maker", "dex"],
-    "yield aggregators": ["yield aggregator", "yield farming", "auto-compound"],
-    "staking": ["staking", "staked", "staking pool"],
-    "derivatives": ["derivatives", "futures", "perpetuals"]
-}
-
-TVL_RANGES = {
-    "low": ["under 10M", "small TVL", "low TVL"],
-    "medium": ["100M", "500M", "medium TVL"],
-    "high": ["1B", "above 1B", "high TVL"]
-}
-
-ASSETS = ["USDC", "ETH", "WBTC", "DAI", "STETH", "AVAX"]
-AUDITED_KEYWORDS = ["audited", "secure", "verified"]
-NON_AUDITED_KEYWORDS = ["unaudited", "risky", "unverified"]
-
-
-def fuzzy_match(query, choices):
-    """Find the closest match from a list of choices using fuzzy matching."""
-    match, score = process.extractOne(query, choices, scorer=fuzz.ratio)
-    return match if score > 70 else None  # Use 70% similarity threshold
-
-
-def extract_filters(query):
-    """Extracts filters like risk level, protocol type, TVL range, and assets from the user query."""
-    doc = nlp(query.lower())
-    filters = {}
-
-    # Extract risk level
-    for word in doc:
-        for risk, synonyms in RISK_SYNONYMS.items():
-            if word.text in synonyms:
-                filters["risk"] = risk
-                break
-
-    # Extract protocol type
-    for word in doc:
-        for protocol, synonyms in PROTOCOL_SYNONYMS.items():
-            if word.text in synonyms:
-                filters["protocol_type"] = protocol.capitalize()
-                break
-
-    # Extract audited status
-    if any(word.text in AUDITED_KEYWORDS for word in doc):
-        filters["is_audited"] = True
-    elif any(word.text in NON_AUDITED_KEYWORDS for word in doc):
-        filters["is_audited"] = False
-
-    # Extract TVL range
-    for tvl_category, keywords in TVL_RANGES.items():
-        for keyword in keywords:
-            if keyword in query:
-                filters["tvl_range"] = tvl_category
-                break
-
-    # Extract assets using fuzzy matching
-    found_assets = [fuzzy_match(word.text.upper(), ASSETS) for word in doc if fuzzy_match(word.text.upper(), ASSETS)]
-    if found_assets:
-        filters["assets"] = list(set(found_assets))  # Remove duplicates
-
-    return filters
-
-
-# **Test Cases**
-queries = [
-    "Find me a conservative lending platform with over 1 billion TVL that supports USDC and ETH.",
-    "Show me moderate-risk verified yield farming protocols with TVL in the 100M range.",
-    "I want aggressive DeFi AMMs that have small TVL.",
-    "Give me an unaudited staking protocol for ETH.",
+import os
+import re
+import threading
+from src.investment_model import load_apy_snapshot
+from src.wallet_portfolio import PORTFOLIO_TOKENS
+
+# Rule-based results at or above this confidence are used without asking the LLM
+FILTER_MIN_CONFIDENCE = float(os.getenv("FILTER_MIN_CONFIDENCE", "0.8"))
+
+# Confidence lost for each kind of ambiguity the rules cannot resolve on their own
+NEGATION_PENALTY = 0.6
+CONFLICT_PENALTY = 0.6
+CONTEXT_PENALTY = 0.5
+UNPARSED_PENALTY = 0.3
+ASSET_PENALTY = 0.3
+# An exclusion ("anything but vesu") inverts what the matchers found, so always ask the LLM
+EXCLUSION_PENALTY = 1.0
+
+ADDRESS_PATTERN = re.compile(r"\b0x[a-fA-F0-9]{40,64}\b|\b\d{50,80}\b")
+
+LEVEL = r"(?:low|medium|high)"
+RISK_LEVELS_PATTERN = re.compile(
+    rf"\b({LEVEL}(?:\s*(?:,|/|&|and|or)\s*{LEVEL})*)[\s-]+risk[\s-]+(?:pools?|protocols?|levels?|vaults?)\b",
+    re.IGNORECASE,
+)
+RISK_PROFILE_PATTERNS = [
+    ("Risk averse", re.compile(
+        r"\b(?:risk[\s-]?averse|low[\s-]risk|conservative(?:ly)?|safe(?:st|ly)?|minimi[sz]e (?:the )?risk)\b",
+        re.IGNORECASE,
+    )),
+    ("Balanced", re.compile(
+        r"\b(?:balanced|moderate(?:ly)?|medium[\s-]risk|middle ground)\b",
+        re.IGNORECASE,
+    )),
+    ("Aggressive", re.compile(
+        r"\b(?:aggressive(?:ly)?|high[\s-]risk|risky|degen)\b",
+        re.IGNORECASE,
+    )),
 ]
+AUDITED_PATTERN = re.compile(r"\b(?:only\s+)?(?<!un)audited(?:\s+(?:protocols?|pools?))?\b", re.IGNORECASE)
 
-for q in queries:
-    print(f"Query: {q}")
-    print("Extracted Filters:", extract_filters(q))
-    print("-" * 50)
+NUMBER = r"\$?(\d+(?:[.,]\d+)*)\s*(k|m|mn|b|bn|thousand|million|billion)?\b"
+COMPARATOR = r"(?:\s*(?:is|of|over|above|greater than|more than|at least|minimum|min|>=|>)\s*)*"
+TVL_PATTERNS = [
+    re.compile(rf"\b(?:min(?:imum)?\s+)?tvl\b{COMPARATOR}\s*{NUMBER}", re.IGNORECASE),
+    re.compile(rf"{NUMBER}\s*\+?\s*(?:of\s+)?tvl\b", re.IGNORECASE),
+]
+APY_PATTERNS = [
+    re.compile(r"\b(?:min(?:imum)?\s+)?ap[yr]\b" + COMPARATOR + r"\s*(\d+(?:\.\d+)?)\s*%?", re.IGNORECASE),
+    re.compile(r"(\d+(?:\.\d+)?)\s*%\s*\+?\s*(?:ap[yr]|yield|returns?)\b", re.IGNORECASE),
+]
+MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "mn": 1e6, "million": 1e6, "b": 1e9, "bn": 1e9, "billion": 1e9}
+
+ASSET_PATTERN = re.compile(r"\b(" + "|".join(map(re.escape, PORTFOLIO_TOKENS)) + r")\b", re.IGNORECASE)
+ASSET_KEYWORD_PATTERN = re.compile(r"\b(?:tokens?|assets?|coins?)\b", re.IGNORECASE)
+
+# Left over after the matchers ran, these mean the user said something the rules did not parse
+NEGATION_PATTERN = re.compile(
+    r"\b(?:not|no|don'?t|do not|never|without|except|excluding|exclude|avoid|other than|instead)\b",
+    re.IGNORECASE,
+)
+# Cues in front of a matched protocol, asset or risk preference that turn it into an exclusion
+EXCLUSION_PATTERN = re.compile(
+    r"\b(?:but|skip(?:ping)?|stay(?:ing)? away from|keep away from|steer clear of|apart from|aside from|"
+    r"besides|avoid(?:ing)?|except(?: for)?|excluding|exclude|without|not|no|never|none of|other than|"
+    r"instead of|rather than|ignor(?:e|ing)|drop|don'?t|do not|minus|outside of)\b",
+    re.IGNORECASE,
+)
+# How far before a match an exclusion cue is looked for, within the same clause
+EXCLUSION_WINDOW = 40
+CLAUSE_BREAK = re.compile(r"[.!?;\n]")
+HINT_PATTERN = re.compile(
+    r"\b(?:risk\w*|safe\w*|tvl|ap[yr]|yields?|\w*audit\w*|protocols?|pools?|percent)\b|%|\d",
+    re.IGNORECASE,
+)
+
+_protocols_lock = threading.Lock()
+_protocols = (None, None)
+
+
+def _protocol_pattern():
+    """Matcher for the protocol names in the current APY snapshot, rebuilt when it changes."""
+    global _protocols
+    try:
+        version, df = load_apy_snapshot()
+    except (OSError, TypeError, ValueError):
+        return None
+    if _protocols[0] != version:
+        with _protocols_lock:
+            if _protocols[0] != version:
+                names = sorted({str(p) for p in df["protocol"].dropna()}, key=len, reverse=True)
+                pattern = None
+                if names:
+                    pattern = re.compile(
+                        r"\b(" + "|".join(map(re.escape, names)) + r")(?:\s+(?:protocols?|pools?))?\b",
+                        re.IGNORECASE,
+                    )
+                _protocols = (version, pattern)
+    return _protocols[1]
+
+
+def _parse_amount(number, unit):
+    value = float(number.replace(",", ""))
+    return value * MULTIPLIERS.get((unit or "").lower(), 1)
+
+
+class _Scan:
+    """Text being matched; every matched span is blanked out so leftovers can be inspected."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def findall(self, pattern):
+        matches = list(pattern.finditer(self.text))
+        for match in reversed(matches):
+            start, end = match.span()
+            self.text = self.text[:start] + " " * (end - start) + self.text[end:]
+        return matches
+
+
+def _excluded(text, start):
+    """True if the clause leading up to `start` holds an exclusion cue."""
+    window = text[max(0, start - EXCLUSION_WINDOW):start]
+    window = CLAUSE_BREAK.split(window)[-1]
+    return bool(EXCLUSION_PATTERN.search(window))
+
+
+def _match_preferences(text):
+    """
+    Applies every matcher to `text`; returns (result fields, leftover text, conflicts,
+    whether any matched protocol, asset or risk preference is preceded by an exclusion cue).
+    """
+    scan = _Scan(ADDRESS_PATTERN.sub(" ", text))
+    original = scan.text
+    preference_starts = []
+    result = {
+        "risk_profile": "None",
+        "risk_levels": [],
+        "is_audited": False,
+        "protocols": [],
+        "min_tvl": 0,
+        "apy": 0,
+        "assets": [],
+    }
+    conflicts = 0
+
+    levels = []
+    for match in scan.findall(RISK_LEVELS_PATTERN):
+        levels += re.findall(LEVEL, match.group(1).lower())
+        preference_starts.append(match.start())
+    result["risk_levels"] = sorted(set(levels), key=["low", "medium", "high"].index)
+
+    profiles = set()
+    for profile, pattern in RISK_PROFILE_PATTERNS:
+        matches = scan.findall(pattern)
+        if matches:
+            profiles.add(profile)
+            preference_starts += [m.start() for m in matches]
+    if len(profiles) == 1:
+        result["risk_profile"] = profiles.pop()
+    conflicts += len(profiles) > 1 or (bool(profiles) and bool(levels))
+
+    result["is_audited"] = bool(scan.findall(AUDITED_PATTERN))
+
+    protocol_pattern = _protocol_pattern()
+    if protocol_pattern is not None:
+        matches = scan.findall(protocol_pattern)
+        result["protocols"] = sorted({m.group(1).lower() for m in matches})
+        preference_starts += [m.start() for m in matches]
+
+    tvls = {_parse_amount(m.group(1), m.group(2)) for pattern in TVL_PATTERNS for m in scan.findall(pattern)}
+    apys = {float(m.group(1)) for pattern in APY_PATTERNS for m in scan.findall(pattern)}
+    conflicts += (len(tvls) > 1) + (len(apys) > 1)
+    result["min_tvl"] = max(tvls, default=0)
+    result["apy"] = max(apys, default=0)
+
+    matches = scan.findall(ASSET_PATTERN)
+    result["assets"] = sorted({m.group(1).upper() for m in matches})
+    preference_starts += [m.start() for m in matches]
+
+    excluded = any(_excluded(original, start) for start in preference_starts)
+    return result, scan.text, conflicts, excluded
+
+
+def _has_preferences(result):
+    return result["risk_profile"] != "None" or any(
+        result[key] for key in ("risk_levels", "is_audited", "protocols", "min_tvl", "apy", "assets")
+    )
+
+
+def extract_filters(statement):
+    """
+    Extracts investment filters from a classify_risk-style statement with precompiled rules.
+
+    Returns the classify_risk JSON schema (risk_profile, risk_levels, is_audited, protocols,
+    min_tvl, apy, assets) plus `confidence` in [0, 1]. Confidence drops for anything the rules
+    cannot settle: negations, conflicting preferences, preference words left unparsed, tokens
+    named without saying they are assets, preferences in the previous chat that the current
+    query may amend, or a protocol, asset or risk preference the user excludes ("anything but
+    vesu") rather than asks for. Below FILTER_MIN_CONFIDENCE the LLM should decide instead.
+    """
+    previous, _, current = statement.rpartition("Current query:")
+    result, leftover, conflicts, excluded = _match_preferences(current)
+
+    confidence = 1.0
+    if excluded:
+        confidence -= EXCLUSION_PENALTY
+    elif NEGATION_PATTERN.search(leftover):
+        confidence -= NEGATION_PENALTY
+    confidence -= CONFLICT_PENALTY * conflicts
+    confidence -= UNPARSED_PENALTY * len(HINT_PATTERN.findall(leftover))
+    if result["assets"] and not ASSET_KEYWORD_PATTERN.search(current):
+        # Only tokens the user calls tokens/assets are filters, as in the classify_risk prompt
+        result["assets"] = []
+        confidence -= ASSET_PENALTY
+    if previous and _has_preferences(_match_preferences(previous)[0]):
+        confidence -= CONTEXT_PENALTY
+
+    result["confidence"] = round(max(0.0, confidence), 2)
+    return result
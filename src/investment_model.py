@@ -1,10 +1,52 @@
 import json
 import pandas as pd
 import os
+import threading
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables
 APY_DATA_LOC = os.getenv("APY_DATA_LOCATION")
 
+def apy_snapshot_version(file_path=APY_DATA_LOC):
+    """
+    Returns an identifier for the APY data currently on disk. fetch_investments.py publishes
+    one next to the data file; without it the file's mtime and size are used.
+    """
+    try:
+        with open(f"{file_path}.version", "r") as version_file:
+            return version_file.read().strip()
+    except OSError:
+        stat = os.stat(file_path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+_apy_frames = {}
+_apy_frames_lock = threading.Lock()
+
+
+def load_apy_snapshot(file_path=APY_DATA_LOC):
+    """
+    Returns (version, DataFrame) for the APY data on disk, parsing the file only once per
+    snapshot version. Callers planning many wallets can load it once and reuse it.
+    """
+    version = apy_snapshot_version(file_path)
+    cached = _apy_frames.get(file_path)
+    if cached is not None and cached[0] == version:
+        return cached
+
+    with _apy_frames_lock:
+        cached = _apy_frames.get(file_path)
+        if cached is None or cached[0] != version:
+            with open(file_path, "r") as file:
+                data = json.load(file)
+            cached = _apy_frames[file_path] = (version, pd.DataFrame(data))
+    return cached
+
+
+def load_apy_data(file_path=APY_DATA_LOC):
+    """Loads the APY data as a DataFrame, parsing the file only once per snapshot version."""
+    return load_apy_snapshot(file_path)[1]
+
+
 def get_allocation(risk_profile):
     """Returns risk allocation percentages based on the chosen risk profile."""
     risk_allocations = {
@@ -41,17 +83,18 @@ def adjust_allocation_percentages(asset_allocations, balance):
 
 
 def allocate_assets( user_assets, risk_profile= "Balanced", file_path = APY_DATA_LOC, audited_only=False, protocols=None, 
-                    risk_levels=None, min_tvl=0, assets = None, min_apy=0):
+                    risk_levels=None, min_tvl=0, assets = None, min_apy=0, apy_data=None):
     """
     Allocates 100% of each asset according to the risk profile, ensuring:
     ✅ Full allocation of all funds.
     ✅ Prioritization of highest-APY pools.
     ✅ Avoidance of redundant medium/high-risk pools if a better lower-risk option exists.
     ✅ Handling of rounding errors.
+
+    `apy_data` can be a DataFrame from load_apy_data to skip reading `file_path`.
     """
-    with open(file_path, "r") as file:
-        data = json.load(file)
-    df = pd.DataFrame(data)
+    # The cached snapshot is shared, so only ever derive new frames from it below
+    df = apy_data if apy_data is not None else load_apy_data(file_path)
     # Apply Filters
     if audited_only:
         df = df[df["is_audited"] == True]  # Keep only audited pools
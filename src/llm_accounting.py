@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from langchain_core.callbacks import BaseCallbackHandler
+from src import metrics
+from src.chat_log import ChatLogWriter
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated sinks for per-call LLM records: any of "log", "metrics", "jsonl"
+LLM_ACCOUNTING_SINKS = os.getenv("LLM_ACCOUNTING_SINKS", "metrics")
+LLM_TRACE_PATH = os.getenv("LLM_TRACE_PATH", "src/data/llm_trace.jsonl")
+
+NANOSECONDS = 1e9
+
+
+def _seconds(nanoseconds):
+    return nanoseconds / NANOSECONDS if nanoseconds else None
+
+
+def build_record(model, stats, started, first_token_at=None, output_chunks=0, stopped_early=False, caller=None):
+    """
+    Builds the accounting record of one LLM call.
+
+    `stats` holds Ollama's final counters (prompt_eval_count, eval_count, load_duration,
+    prompt_eval_duration, eval_duration, total_duration, in nanoseconds) and may be empty when
+    the stream was closed before Ollama sent them. `started` and `first_token_at` are
+    time.perf_counter() readings taken by the caller; without a first token time (a
+    non-streaming call) the server-side load and prompt evaluation time is used instead.
+    """
+    now = time.perf_counter()
+    load = _seconds(stats.get("load_duration"))
+    prompt_eval = _seconds(stats.get("prompt_eval_duration"))
+    eval_seconds = _seconds(stats.get("eval_duration"))
+    output_tokens = stats.get("eval_count") or output_chunks
+    if first_token_at is not None:
+        ttft = first_token_at - started
+    else:
+        ttft = (load or 0) + (prompt_eval or 0) or None
+    if not eval_seconds and first_token_at is not None and output_tokens:
+        eval_seconds = now - first_token_at
+    return {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "model": model,
+        "caller": caller,
+        "prompt_tokens": stats.get("prompt_eval_count"),
+        "output_tokens": output_tokens,
+        "load_seconds": load,
+        "prompt_eval_seconds": prompt_eval,
+        "eval_seconds": eval_seconds,
+        "ttft_seconds": ttft,
+        "tokens_per_second": output_tokens / eval_seconds if output_tokens and eval_seconds else None,
+        "wall_seconds": now - started,
+        "stopped_early": stopped_early,
+    }
+
+
+def log_sink(record):
+    logger.info(
+        "LLM call model=%s caller=%s prompt_tokens=%s output_tokens=%s load=%.3fs ttft=%.3fs tok/s=%.1f%s",
+        record["model"], record["caller"], record["prompt_tokens"], record["output_tokens"],
+        record["load_seconds"] or 0.0, record["ttft_seconds"] or 0.0, record["tokens_per_second"] or 0.0,
+        " (stopped early)" if record["stopped_early"] else "",
+    )
+
+
+def metrics_sink(record):
+    """Token counts as counters, TTFT and model load as latency stages, per model."""
+    model = record["model"]
+    metrics.inc("llm_calls_total", model=model)
+    if record["prompt_tokens"]:
+        metrics.inc("llm_prompt_tokens_total", record["prompt_tokens"], model=model)
+    if record["output_tokens"]:
+        metrics.inc("llm_output_tokens_total", record["output_tokens"], model=model)
+    if record["eval_seconds"]:
+        # Output tokens over this counter gives tokens/sec per model
+        metrics.inc("llm_eval_seconds_total", record["eval_seconds"], model=model)
+    if record["ttft_seconds"] is not None:
+        metrics.observe(f"llm_ttft.{model}", record["ttft_seconds"])
+    if record["load_seconds"]:
+        metrics.observe(f"llm_load.{model}", record["load_seconds"])
+    if record["stopped_early"]:
+        metrics.inc("llm_stopped_early_total", model=model)
+
+
+class JsonlSink:
+    """Appends records to a JSONL trace file through the background log writer."""
+
+    def __init__(self, path=LLM_TRACE_PATH):
+        self._writer = ChatLogWriter(path)
+
+    def __call__(self, record):
+        self._writer.write(record)
+
+
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    """Registers a callable that receives every LLM call record."""
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        _sinks.remove(sink)
+
+
+def record(entry):
+    """Hands one record to every sink; a failing sink never breaks the LLM call."""
+    for sink in list(_sinks):
+        try:
+            sink(entry)
+        except Exception as e:
+            logger.warning("LLM accounting sink %r failed: %s", sink, e)
+
+
+def _configure(spec):
+    for name in (part.strip().lower() for part in spec.split(",")):
+        if name == "log":
+            add_sink(log_sink)
+        elif name == "metrics":
+            add_sink(metrics_sink)
+        elif name == "jsonl":
+            add_sink(JsonlSink())
+        elif name:
+            logger.warning("Unknown LLM accounting sink %r", name)
+
+
+_configure(LLM_ACCOUNTING_SINKS)
+
+
+def response_stats(response):
+    """Reads Ollama's final counters from a response object, chunk or generation_info dict."""
+    keys = ("prompt_eval_count", "eval_count", "load_duration", "prompt_eval_duration", "eval_duration",
+            "total_duration")
+    if isinstance(response, dict):
+        return {key: response.get(key) for key in keys}
+    return {key: getattr(response, key, None) for key in keys}
+
+
+class StreamAccounting:
+    """Tracks one streamed call: first token time, chunks seen and the final stats chunk."""
+
+    def __init__(self, model, caller=None):
+        self.model = model
+        self.caller = caller
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.chunks = 0
+        self.stats = {}
+
+    def chunk(self, chunk, text):
+        if text and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if text:
+            self.chunks += 1
+        if getattr(chunk, "done", False):
+            self.stats = response_stats(chunk)
+
+    def finish(self):
+        record(build_record(
+            self.model, self.stats, self.started, self.first_token_at, self.chunks,
+            stopped_early=not self.stats, caller=self.caller,
+        ))
+
+
+class AccountingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records OllamaLLM calls made inside chains (e.g. RetrievalQA),
+    using the Ollama stats langchain_ollama puts in each generation's generation_info.
+    """
+
+    run_inline = True
+
+    def __init__(self, model, caller=None):
+        self.model = model
+        self.caller = caller
+        self._runs = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._runs[run_id] = [time.perf_counter(), None]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run[1] is None and token:
+            run[1] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started, first_token_at = self._runs.pop(run_id, (time.perf_counter(), None))
+        for generations in response.generations:
+            for generation in generations:
+                stats = response_stats(generation.generation_info or {})
+                record(build_record(self.model, stats, started, first_token_at, caller=self.caller))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._runs.pop(run_id, None)
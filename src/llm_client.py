@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+import httpx
+from ollama import AsyncClient, Client
+from langchain_ollama import OllamaLLM
+from src import llm_accounting, metrics
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# HTTP connections kept open to the model server, shared by every LLM call in the process
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "300"))
+# How long Ollama keeps a model loaded after a call, so bursts do not pay cold loads
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Reasoning tokens (inside <think>) a JSON call may spend before it is retried on the
+# non-reasoning fallback model; 0 disables the budget
+REASONING_TOKEN_BUDGET = int(os.getenv("REASONING_TOKEN_BUDGET", "512"))
+REASONING_FALLBACK_MODEL = os.getenv("REASONING_FALLBACK_MODEL", "mistral")
+# Concurrent generations per model, e.g. "mistral=4,deepseek-r1=2"; others use the default
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("OLLAMA_DEFAULT_MODEL_CONCURRENCY", "4"))
+MODEL_CONCURRENCY = {
+    name.strip().lower(): int(limit)
+    for name, _, limit in (
+        part.partition("=") for part in os.getenv("OLLAMA_MODEL_CONCURRENCY", "").split(",") if part.strip()
+    )
+}
+
+
+def _client_kwargs():
+    return {
+        "timeout": OLLAMA_TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+        ),
+    }
+
+
+def _model_key(model):
+    # Ollama model names are case-insensitive, so "Mistral" and "mistral" share one limit
+    return model.lower()
+
+
+def model_concurrency(model):
+    return MODEL_CONCURRENCY.get(_model_key(model), DEFAULT_MODEL_CONCURRENCY)
+
+
+_lock = threading.Lock()
+_sync_client = None
+# httpx async pools are bound to the loop that created them, so keep one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+_sync_slots = {}
+_async_slots = weakref.WeakKeyDictionary()
+_langchain_llms = {}
+
+
+def get_client():
+    """Returns the process-wide, connection-pooled Ollama client."""
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                _sync_client = Client(host=OLLAMA_BASE_URL, **_client_kwargs())
+    return _sync_client
+
+
+def get_async_client():
+    """Returns the connection-pooled async Ollama client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncClient(host=OLLAMA_BASE_URL, **_client_kwargs())
+    return client
+
+
+@contextmanager
+def model_slot(model):
+    """Holds one of the model's concurrency slots for the duration of a sync call."""
+    key = _model_key(model)
+    with _lock:
+        slot = _sync_slots.get(key)
+        if slot is None:
+            slot = _sync_slots[key] = threading.BoundedSemaphore(model_concurrency(model))
+    with slot:
+        yield
+
+
+@asynccontextmanager
+async def amodel_slot(model):
+    """Holds one of the model's concurrency slots for the duration of an async call."""
+    key = _model_key(model)
+    slots = _async_slots.setdefault(asyncio.get_running_loop(), {})
+    slot = slots.get(key)
+    if slot is None:
+        slot = slots[key] = asyncio.Semaphore(model_concurrency(model))
+    async with slot:
+        yield
+
+
+def _request(model, prompt, temperature, format, system, options):
+    request = {
+        "model": model,
+        "prompt": prompt,
+        "format": format,
+        "options": {"temperature": temperature, **(options or {})},
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+    }
+    if system:
+        request["system"] = system
+    return request
+
+
+def generate(model, prompt, temperature=0.1, format="", system=None, options=None, caller=None):
+    """
+    Runs one non-streaming generation and returns Ollama's full response object.
+    `caller` labels the call in the LLM accounting records.
+    """
+    with model_slot(model):
+        started = time.perf_counter()
+        response = get_client().generate(**_request(model, prompt, temperature, format, system, options))
+    llm_accounting.record(llm_accounting.build_record(
+        model, llm_accounting.response_stats(response), started, caller=caller
+    ))
+    return response
+
+
+async def agenerate(model, prompt, temperature=0.1, format="", system=None, options=None, caller=None):
+    """Async variant of generate."""
+    async with amodel_slot(model):
+        started = time.perf_counter()
+        response = await get_async_client().generate(
+            **_request(model, prompt, temperature, format, system, options)
+        )
+    llm_accounting.record(llm_accounting.build_record(
+        model, llm_accounting.response_stats(response), started, caller=caller
+    ))
+    return response
+
+
+def stream(model, prompt, temperature=0.1, format="", system=None, options=None, caller=None):
+    """Yields Ollama response chunks as they are generated; closing the generator stops the request."""
+    with model_slot(model):
+        accounting = llm_accounting.StreamAccounting(model, caller)
+        chunks = get_client().generate(stream=True, **_request(model, prompt, temperature, format, system, options))
+        try:
+            for chunk in chunks:
+                accounting.chunk(chunk, chunk.response)
+                yield chunk
+        finally:
+            chunks.close()
+            accounting.finish()
+
+
+async def astream(model, prompt, temperature=0.1, format="", system=None, options=None, caller=None):
+    """Async variant of stream."""
+    async with amodel_slot(model):
+        accounting = llm_accounting.StreamAccounting(model, caller)
+        chunks = await get_async_client().generate(
+            stream=True, **_request(model, prompt, temperature, format, system, options)
+        )
+        try:
+            async for chunk in chunks:
+                accounting.chunk(chunk, chunk.response)
+                yield chunk
+        finally:
+            # Closing the response stream is what makes Ollama stop generating
+            await chunks.aclose()
+            accounting.finish()
+
+
+def invoke(model, prompt, **kwargs):
+    """Generates a completion and returns only its text."""
+    return generate(model, prompt, **kwargs).response
+
+
+async def ainvoke(model, prompt, **kwargs):
+    """Async variant of invoke."""
+    return (await agenerate(model, prompt, **kwargs)).response
+
+
+class JsonStreamParser:
+    """
+    Incrementally scans streamed model output for the first complete JSON object.
+
+    `<think>...</think>` reasoning blocks are skipped and counted in `reasoning_tokens`
+    (one per fed chunk, which is one token for Ollama streams). `feed` returns the parsed
+    object as soon as its closing brace arrives, so the caller can stop the generation.
+    """
+
+    THINK_OPEN = "<think>"
+    THINK_CLOSE = "</think>"
+
+    def __init__(self):
+        self.reasoning_tokens = 0
+        self._buffer = ""
+        self._pos = 0
+        self._in_think = False
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        if self._in_think:
+            self.reasoning_tokens += 1
+        self._buffer += text
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            if self._in_think:
+                end = buffer.find(self.THINK_CLOSE, self._pos)
+                if end == -1:
+                    # Keep a possible partial closing tag for the next chunk
+                    self._pos = max(self._pos, len(buffer) - len(self.THINK_CLOSE) + 1)
+                    return None
+                self._pos = end + len(self.THINK_CLOSE)
+                self._in_think = False
+            elif self._start is None:
+                think = buffer.find(self.THINK_OPEN, self._pos)
+                brace = buffer.find("{", self._pos)
+                if think != -1 and (brace == -1 or think < brace):
+                    self._pos = think + len(self.THINK_OPEN)
+                    self._in_think = True
+                elif brace != -1:
+                    self._start, self._depth, self._pos = brace, 1, brace + 1
+                else:
+                    self._pos = max(self._pos, len(buffer) - len(self.THINK_OPEN) + 1)
+                    return None
+            else:
+                result = self._scan_object(buffer)
+                if result is not None:
+                    return result
+        return None
+
+    def _scan_object(self, buffer):
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    start, self._start = self._start, None
+                    try:
+                        return json.loads(buffer[start:self._pos])
+                    except ValueError:
+                        # Not valid JSON after all; look for the next object after its brace
+                        self._pos = start + 1
+                        self._in_string = self._escape = False
+                        return None
+        return None
+
+
+def _json_fallback(model, reasoning_budget, fallback_model, parser):
+    """Decides whether a JSON call that found no object should be retried on the fallback model."""
+    over_budget = bool(reasoning_budget) and parser.reasoning_tokens > reasoning_budget
+    if over_budget:
+        metrics.inc("llm_reasoning_budget_exceeded_total", model=model)
+    if fallback_model and fallback_model != model:
+        return fallback_model
+    raise ValueError(f"No JSON object in {model} output")
+
+
+def invoke_json(model, prompt, reasoning_budget=REASONING_TOKEN_BUDGET, fallback_model=REASONING_FALLBACK_MODEL,
+                **kwargs):
+    """
+    Streams a generation and returns the first complete JSON object in it, closing the stream
+    (which stops generation on the server) as soon as the object is complete. If the model
+    spends more than `reasoning_budget` tokens thinking, or finishes without an object, the
+    prompt is retried once on `fallback_model`. Raises ValueError if no object is produced.
+    """
+    parser = JsonStreamParser()
+    chunks = stream(model, prompt, **kwargs)
+    try:
+        for chunk in chunks:
+            result = parser.feed(chunk.response)
+            if result is not None:
+                metrics.inc("llm_json_early_stop_total", model=model)
+                return result
+            if reasoning_budget and parser.reasoning_tokens > reasoning_budget:
+                break
+    finally:
+        chunks.close()
+    fallback = _json_fallback(model, reasoning_budget, fallback_model, parser)
+    return invoke_json(fallback, prompt, reasoning_budget=0, fallback_model=None, **kwargs)
+
+
+async def ainvoke_json(model, prompt, reasoning_budget=REASONING_TOKEN_BUDGET,
+                       fallback_model=REASONING_FALLBACK_MODEL, **kwargs):
+    """Async variant of invoke_json."""
+    parser = JsonStreamParser()
+    chunks = astream(model, prompt, **kwargs)
+    try:
+        async for chunk in chunks:
+            result = parser.feed(chunk.response)
+            if result is not None:
+                metrics.inc("llm_json_early_stop_total", model=model)
+                return result
+            if reasoning_budget and parser.reasoning_tokens > reasoning_budget:
+                break
+    finally:
+        await chunks.aclose()
+    fallback = _json_fallback(model, reasoning_budget, fallback_model, parser)
+    return await ainvoke_json(fallback, prompt, reasoning_budget=0, fallback_model=None, **kwargs)
+
+
+class InconsistentAnswers(ValueError):
+    """Raised when a cascade tier's samples validate but disagree with each other."""
+
+
+async def _gather_or_cancel(coros):
+    """
+    Like asyncio.gather, but once one coroutine fails the others are cancelled, and have
+    finished (releasing their model slots), before the error is raised.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class Cascade:
+    """
+    Tries a list of models from cheapest to most capable and returns the first answer that
+    passes validation.
+
+    `validate` turns a parsed JSON object into its normalised form or raises ValueError.
+    Every tier but the last must also be self-consistent: it is sampled `samples` times at
+    `sample_temperature` and only trusted if all normalised answers agree. The last tier
+    only has to validate. No tier falls back to another model: the cheaper ones already
+    failed, so the last tier reasons with `final_reasoning_budget` (0 for no limit; the
+    request deadline still bounds it). Per-tier latency is recorded as stage
+    `<name>.<model>`, and resolved/escalated calls are counted per tier.
+    """
+
+    def __init__(self, name, models, validate, samples=2, sample_temperature=0.5, final_reasoning_budget=0):
+        self.name = name
+        self.models = list(models)
+        self.validate = validate
+        self.samples = samples
+        self.sample_temperature = sample_temperature
+        self.final_reasoning_budget = final_reasoning_budget
+
+    def _tier_options(self, model, kwargs):
+        """Returns (samples, invoke_json keyword arguments) for one tier."""
+        if model == self.models[-1]:
+            return 1, dict(
+                kwargs, caller=self.name, fallback_model=None, reasoning_budget=self.final_reasoning_budget
+            )
+        return self.samples, dict(kwargs, caller=self.name, temperature=self.sample_temperature, fallback_model=None)
+
+    def _check(self, model, answers):
+        """Returns the agreed answer of a tier, or raises ValueError describing why not."""
+        normalized = [self.validate(answer) for answer in answers]
+        if any(answer != normalized[0] for answer in normalized[1:]):
+            raise InconsistentAnswers(f"{model} gave inconsistent answers")
+        return normalized[0]
+
+    def _escalate(self, model, error):
+        """Counts a failed tier; the last tier's failure is re-raised to the caller."""
+        if isinstance(error, InconsistentAnswers):
+            reason = "inconsistent"
+        elif isinstance(error, ValueError):
+            reason = "invalid"
+        else:
+            reason = "error"
+        metrics.inc("llm_cascade_escalations_total", cascade=self.name, model=model, reason=reason)
+        if model == self.models[-1]:
+            raise error
+
+    def _resolved(self, model, answer):
+        metrics.inc("llm_cascade_resolved_total", cascade=self.name, model=model)
+        return answer
+
+    def invoke(self, prompt, **kwargs):
+        for model in self.models:
+            samples, tier_kwargs = self._tier_options(model, kwargs)
+            try:
+                with metrics.timed(f"{self.name}.{model}"):
+                    answers = [invoke_json(model, prompt, **tier_kwargs) for _ in range(samples)]
+                    return self._resolved(model, self._check(model, answers))
+            except Exception as e:
+                self._escalate(model, e)
+
+    async def ainvoke(self, prompt, **kwargs):
+        for model in self.models:
+            samples, tier_kwargs = self._tier_options(model, kwargs)
+            try:
+                with metrics.timed(f"{self.name}.{model}"):
+                    answers = await _gather_or_cancel(
+                        ainvoke_json(model, prompt, **tier_kwargs) for _ in range(samples)
+                    )
+                    return self._resolved(model, self._check(model, answers))
+            except Exception as e:
+                self._escalate(model, e)
+
+
+def get_langchain_llm(model, temperature=0.1, **kwargs):
+    """
+    Returns a shared OllamaLLM for LangChain chains (e.g. RetrievalQA), built once per
+    configuration and using the same pooled connection settings as the direct calls.
+    Callers should hold `amodel_slot(model)` around its use to respect the model's limit.
+    """
+    key = (model, temperature, tuple(sorted((k, str(v)) for k, v in kwargs.items())))
+    with _lock:
+        llm = _langchain_llms.get(key)
+        if llm is None:
+            llm = _langchain_llms[key] = OllamaLLM(
+                model=model,
+                callbacks=[llm_accounting.AccountingCallbackHandler(model, caller="chatbot")],
+                base_url=OLLAMA_BASE_URL,
+                temperature=temperature,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                client_kwargs=_client_kwargs(),
+                **kwargs,
+            )
+    return llm
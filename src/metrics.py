@@ -0,0 +1,129 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Number of most recent samples per stage used to compute the latency quantiles
+WINDOW_SIZE = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "tyrion"
+
+
+class StageStats:
+    """Latency samples and counters for one pipeline stage."""
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.samples = deque(maxlen=window_size)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def observe(self, seconds, error=False):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def quantiles(self):
+        """Returns {quantile: seconds} over the sliding window of recent samples."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in QUANTILES}
+
+
+_stages = {}
+_counters = {}
+_lock = threading.Lock()
+
+
+def observe(stage, seconds, error=False):
+    """Records one timing sample for a pipeline stage."""
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = StageStats()
+        stats.observe(seconds, error)
+
+
+def inc(name, value=1, **labels):
+    """Increments a free-form counter, e.g. inc("cache_hits_total", cache="plan")."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def timed(stage):
+    """
+    Times the enclosed block as one sample of `stage`; an exception counts as an error
+    (cancellation does not). Works around `await` expressions too, so async stages can
+    use it directly.
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, error)
+
+
+def snapshot():
+    """Returns a JSON-friendly view of all stage statistics."""
+    with _lock:
+        return {
+            stage: {
+                "count": stats.count,
+                "errors": stats.errors,
+                "sum": stats.total,
+                **{f"p{int(q * 100)}": v for q, v in stats.quantiles().items()},
+            }
+            for stage, stats in _stages.items()
+        }
+
+
+def _format_labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels)
+
+
+def render_prometheus():
+    """Renders every stage and counter in the Prometheus text exposition format."""
+    name = f"{METRIC_PREFIX}_stage_latency_seconds"
+    errors_name = f"{METRIC_PREFIX}_stage_errors_total"
+    lines = [
+        f"# HELP {name} Latency of investment pipeline stages.",
+        f"# TYPE {name} summary",
+    ]
+    with _lock:
+        stages = sorted(_stages.items())
+        counters = sorted(_counters.items())
+
+        for stage, stats in stages:
+            for q, value in stats.quantiles().items():
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stats.total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats.count}')
+
+        lines.append(f"# HELP {errors_name} Failed executions of investment pipeline stages.")
+        lines.append(f"# TYPE {errors_name} counter")
+        for stage, stats in stages:
+            lines.append(f'{errors_name}{{stage="{stage}"}} {stats.errors}')
+
+        seen = set()
+        for (counter, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{counter}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            suffix = f"{{{_format_labels(labels)}}}" if labels else ""
+            lines.append(f"{metric}{suffix} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,547 @@
+import os
+import json
+import asyncio
+import re
+from typing import Dict, List, Tuple
+from src.wallet_portfolio import get_token_balances_dict
+from src.investment_model import allocate_assets, apy_snapshot_version, load_apy_snapshot
+from src.extract_filters import aclassify_risk
+from src.filters import FILTER_MIN_CONFIDENCE, extract_filters as extract_rule_filters
+from src.query_llm import aclassify_query, aextract_query
+from src.chatbot_pool import get_chatbot
+from src.chatbot_ollama import aanswer, aretrieve, astream_answer
+from src.stage_scheduler import StageScheduler
+from src.conversation_store import create_conversation_store
+from src.chat_log import ChatLogWriter
+from src.plan_cache import PlanCache, LRUCache, FILTER_CACHE_SIZE
+from src.single_flight import normalize_prompt
+from src.classify_query import ROUTER_MIN_CONFIDENCE, route
+from src.semantic_cache import SemanticCache
+from src.embeddings import get_embeddings
+from src.admission import AdmissionController, Deadline, DeadlineExceeded, Overloaded, request_deadline
+from src import metrics
+
+conversation_store = create_conversation_store()
+MAX_HISTORY = 3
+# classify_risk model; unset runs the small-to-large model cascade in extract_filters
+selected_model = os.getenv("FILTER_MODEL") or None
+# Classify and extract investment filters in one JSON-mode generation instead of two calls
+COMBINED_EXTRACTION = os.getenv("COMBINED_EXTRACTION", "0") == "1"
+
+LOG_FILE_PATH = os.getenv("CHAT_LOG_PATH", "src/data/chat_logs.jsonl")
+chat_log = ChatLogWriter(LOG_FILE_PATH)
+RETRIEVER_PATH = os.getenv("RETRIEVER_PATH", "src/data/combined_index")
+
+# Repeated chats skip the LLM filter extraction and allocate_assets
+plan_cache = PlanCache()
+filter_cache = LRUCache("filters", FILTER_CACHE_SIZE)
+# Paraphrased balance/investment queries reuse an earlier category instead of calling the
+# classifier LLM. other_query results carry a free-text answer and are never cached.
+# Set SEMANTIC_CACHE=0 to classify every request without it.
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "1") == "1"
+# The embedding model is loaded in the background; until then (or if it cannot be loaded)
+# requests go straight to the classifier.
+SEMANTIC_CACHE_CATEGORIES = ("balance_query", "investment_query")
+classification_cache = SemanticCache(
+    "classification",
+    lambda text: get_embeddings().embed_query(text),
+    values=SEMANTIC_CACHE_CATEGORIES,
+    load=get_embeddings,
+)
+
+# Bounded admission queue in front of the LLM-dependent paths
+admission = AdmissionController()
+# Budget needed to attempt LLM filter extraction, and budget kept back for allocate_assets
+FILTER_MIN_BUDGET = float(os.getenv("FILTER_MIN_BUDGET_SECONDS", "5"))
+PLAN_RESERVE = float(os.getenv("PLAN_RESERVE_SECONDS", "1"))
+
+# Batch plans: wallets per call and concurrent wallets in flight
+BATCH_MAX_WALLETS = int(os.getenv("BATCH_MAX_WALLETS", "10000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+
+# Starknet contract addresses (66-character hex or large decimal numbers)
+CONTRACT_ADDRESS_PATTERN = r"\b0x[a-fA-F0-9]{64}\b|\b\d{50,80}\b"
+
+
+def format_token_balances(token_balances: Dict[str, float]) -> List[Dict[str, float]]:
+    return [
+        {
+            "symbol": symbol,
+            "balance": balance,
+            "usdValue": balance  # Placeholder
+        }
+        for symbol, balance in token_balances.items() if balance > 0
+    ]
+
+def get_contract_address(statement: str) -> str:
+    match = re.findall(CONTRACT_ADDRESS_PATTERN, statement)
+    if not match:
+        raise ValueError("Please provide a valid contract address.")
+    print(f"[INFO] Using contract address: {match[0]}")
+    return str(match[0])
+
+def extract_query_category_and_response(prompt):
+    try:
+        # Try to extract the JSON structure from the prompt
+        # Find the JSON part (after "Return the result in the following format:")
+        start = prompt.find("{")
+        end = prompt.rfind("}") + 1  # Include closing brace
+
+        # Extract the JSON part
+        json_part = prompt[start:end]
+
+        # Parse the extracted JSON
+        parsed_data = json.loads(json_part)
+
+        # Extract query category and response
+        query_category = parsed_data.get("category", "Unknown")
+        response = parsed_data.get("response", "No response")
+
+        return query_category, response
+
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+def filters_from_response(filter_response: dict) -> dict:
+    """Maps a classify_risk-style filter object onto allocate_assets keyword arguments."""
+    risk_profile = (filter_response.get("risk_profile") or "").capitalize()
+
+    pattern = r"\b(risk averse|balanced|aggressive)\b"
+    match = re.search(pattern, risk_profile, re.IGNORECASE)
+
+    if match:
+        risk_profile = match.group(0).capitalize()
+    else:
+        risk_profile = None
+
+    return {
+        "risk_profile": risk_profile,
+        "audited_only": filter_response.get("is_audited", False),
+        "protocols": filter_response.get("protocols", []),
+        "risk_levels": filter_response.get("risk_levels", []),
+        "min_tvl": filter_response.get("min_tvl", 0),
+        "assets": filter_response.get("assets", []),
+        "min_apy": filter_response.get("apy", []),
+    }
+
+def parse_filter_response(filter_string: str) -> dict:
+    """Turns the raw classify_risk output into keyword arguments for allocate_assets."""
+    if not filter_string:
+        raise ValueError("Received empty response from classify_risk()")
+
+    match = re.search(r'\{[\s\S]*?\}', filter_string)
+    if not match:
+        raise ValueError("No valid JSON filter response found")
+
+    filters = filters_from_response(json.loads(match.group(0)))
+    print(f"[INFO] Risk profile classified as: {filters['risk_profile']}")
+    return filters
+
+def build_investment_plan(user_assets: Dict[str, float], filters: dict, snapshot=None) -> list:
+    """
+    Runs allocate_assets for the given balances and filters and returns the formatted plan.
+    Plans are cached per APY snapshot, so repeats skip the DataFrame work entirely.
+    `snapshot` is an optional (version, DataFrame) pair from load_apy_snapshot.
+    """
+    version, apy_data = snapshot if snapshot is not None else (apy_snapshot_version(), None)
+    cached = plan_cache.get(user_assets, filters, version)
+    if cached is not None:
+        return cached
+    try:
+        with metrics.timed("allocate_assets"):
+            investment_plan, formatted_plan = allocate_assets(user_assets, apy_data=apy_data, **filters)
+        plan_cache.put(user_assets, filters, version, formatted_plan)
+        return formatted_plan
+    except ValueError as ve:
+        if "not enough values to unpack" in str(ve):
+            raise ValueError("No investments found for the given filters.")
+        else:
+            raise ve
+
+def build_statement(history: List[Dict[str, str]]) -> str:
+    """Formats the stored history into the prompt passed to the classifiers."""
+    previous_messages = history[:-1]
+    current_message = history[-1]
+
+    formatted_previous = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in previous_messages])
+    formatted_current = f"{current_message['role'].capitalize()}: {current_message['content']}"
+
+    return f"Previous chat:\n{formatted_previous}\n\nCurrent query:\n{formatted_current}"
+
+def parse_request(data) -> Tuple[str, List[Dict[str, str]]]:
+    """Validates an /investment-plan request body and returns (chat_id, user_messages)."""
+    if not data:
+        raise ValueError("Missing JSON body")
+
+    chat_id = data.get("chat_id")
+    messages = data.get("messages", [])
+
+    if not chat_id or not messages:
+        raise ValueError("Missing chat_id or messages")
+
+    user_messages = [m for m in messages if m["role"] == "user"]
+    if not user_messages:
+        raise ValueError("No user message found")
+
+    return chat_id, user_messages
+
+def update_history(chat_id: str, user_messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Appends the new user messages to the stored history, keeping the last MAX_HISTORY."""
+    return conversation_store.append(chat_id, user_messages, MAX_HISTORY)
+
+
+async def fetch_balances(contract_address: str) -> Dict[str, float]:
+    """Timed wrapper around the RPC balance fan-out."""
+    with metrics.timed("get_token_balances"):
+        return await get_token_balances_dict(contract_address)
+
+
+async def load_context(statement: str, deadline: Deadline):
+    """Loads the shared chatbot and retrieves context for the statement; returns (chatbot, docs)."""
+    # Shared warm chain, hot-swapped when a new retriever index is published
+    chatbot = await deadline.run(asyncio.to_thread(get_chatbot, RETRIEVER_PATH), "load_chatbot")
+    return chatbot, await deadline.run(aretrieve(chatbot, statement), "retrieve")
+
+
+async def extract_filters(statement: str, deadline: Deadline = None) -> dict:
+    """
+    Extracts the statement's filters as allocate_assets keyword arguments, using the rule-based
+    extractor when it is confident and the LLM otherwise. When the request's deadline is too
+    close for an LLM call, the default Balanced profile is used instead of failing the request.
+    """
+    key = (selected_model, normalize_prompt(statement))
+    filters = filter_cache.get(key)
+    if filters is not None:
+        return dict(filters)
+
+    # Tier 0: precompiled rules settle unambiguous statements without the LLM
+    rule_filters = await asyncio.to_thread(extract_rule_filters, statement)
+    if rule_filters["confidence"] >= FILTER_MIN_CONFIDENCE:
+        metrics.inc("filter_extraction_total", tier="rules")
+        filters = filters_from_response(rule_filters)
+        filter_cache.put(key, filters)
+        return dict(filters)
+    metrics.inc("filter_extraction_total", tier="llm")
+
+    if deadline is not None and not deadline.allows(FILTER_MIN_BUDGET + PLAN_RESERVE):
+        return degraded_filters("classify_risk")
+    try:
+        with metrics.timed("classify_risk"):
+            call = aclassify_risk(statement, model_name=selected_model)
+            if deadline is not None:
+                filter_string = await deadline.run(call, "classify_risk", reserve=PLAN_RESERVE)
+            else:
+                filter_string = await call
+    except DeadlineExceeded:
+        return degraded_filters("classify_risk")
+
+    filters = parse_filter_response(filter_string)
+    filter_cache.put(key, filters)
+    return dict(filters)
+
+
+def degraded_filters(stage: str) -> dict:
+    """Default filters used when there is no budget left to extract them with the LLM."""
+    print(f"[WARN] Deadline budget low, skipping {stage} and using the Balanced profile")
+    metrics.inc("degraded_total", stage=stage)
+    return filters_from_response({"risk_profile": "Balanced"})
+
+
+def start_speculative_stages(stages: StageScheduler, statement: str):
+    """
+    Starts cheap stages that the likely answer will need while classification is running.
+    A wallet address makes a balance or investment query likely, so its balances are fetched;
+    otherwise the RAG context for an other_query is prefetched. Unused work is cancelled when
+    the scheduler closes.
+    """
+    match = re.search(CONTRACT_ADDRESS_PATTERN, statement)
+    if match:
+        stages.start("balances", fetch_balances(match.group(0)))
+    else:
+        stages.start("context", load_context(statement, stages.deadline))
+
+
+async def aget_investment_plan(statement: str, stages: StageScheduler) -> list:
+    contract_address = get_contract_address(statement)
+    # Balance fetch (RPC) and filter extraction (LLM) are independent; run them side by side
+    results = await stages.gather(
+        balances=fetch_balances(contract_address),
+        filters=extract_filters(statement, stages.deadline),
+    )
+    # allocate_assets is pandas-bound; keep it off the event loop
+    return await stages.deadline.run(
+        asyncio.to_thread(build_investment_plan, results["balances"], results["filters"]), "allocate_assets"
+    )
+
+
+async def classify_and_extract(statement: str, deadline: Deadline) -> str:
+    """
+    Runs the combined classification + filter extraction call. For investment queries the
+    filters are stored in the filter cache, so extract_filters does not call the LLM again.
+    Returns the category, or None if the combined output was unusable.
+    """
+    try:
+        with metrics.timed("extract_query"):
+            result = await deadline.run(aextract_query(statement), "extract_query")
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"[WARN] Combined extraction failed, falling back to separate calls: {e}")
+        metrics.inc("combined_extraction_fallback_total")
+        return None
+
+    query_type = result["category"]
+    print(f"[INFO] Query classified as: {query_type} (combined extraction)")
+    if query_type == "investment_query":
+        filter_cache.put((selected_model, normalize_prompt(statement)), filters_from_response(result))
+    return query_type
+
+
+async def classify_request(chat_id: str, user_messages: List[Dict[str, str]], stages: StageScheduler) -> Tuple[str, str]:
+    """Stores and logs the new messages, then returns (statement, query_type) for the chat."""
+    # Store limited history (the SQLite backend does disk I/O, so keep it off the event loop)
+    history = await stages.deadline.run(
+        asyncio.to_thread(update_history, chat_id, user_messages), "conversation_store"
+    )
+
+    # Log chat history (queued for the background writer, never blocks)
+    chat_log.log(chat_id, history)
+
+    statement = build_statement(history)
+    print(f"[DEBUG] ClassifyQuery input:\n{statement}")
+    start_speculative_stages(stages, statement)
+
+    # The router and the semantic cache only see the current message, so they are skipped for
+    # follow-ups ("yes, do that") whose category depends on the earlier turns
+    standalone = len(history) == 1
+    cache_vector = None
+    if standalone:
+        # Tier 0: the embedding router settles most queries in milliseconds
+        with metrics.timed("router"):
+            query_type, confidence = await stages.deadline.run(
+                asyncio.to_thread(route, history[-1]["content"]), "router"
+            )
+        if query_type is not None and confidence >= ROUTER_MIN_CONFIDENCE:
+            metrics.inc("router_decisions_total", outcome="routed", category=query_type)
+            print(f"[INFO] Query classified as: {query_type} (router, p={confidence:.2f})")
+            return statement, query_type
+        metrics.inc("router_decisions_total", outcome="fallthrough")
+
+        if SEMANTIC_CACHE:
+            # Wallet addresses differ between users but never change the category, so mask them
+            cache_text = re.sub(CONTRACT_ADDRESS_PATTERN, "<address>", history[-1]["content"])
+            query_type, cache_vector = await stages.deadline.run(
+                asyncio.to_thread(classification_cache.lookup, cache_text), "semantic_cache"
+            )
+            if query_type is not None:
+                print(f"[INFO] Query classified as: {query_type} (semantic cache)")
+                return statement, query_type
+    else:
+        metrics.inc("router_decisions_total", outcome="context")
+
+    if COMBINED_EXTRACTION:
+        query_type = await classify_and_extract(statement, stages.deadline)
+        if query_type is not None:
+            classification_cache.put(cache_vector, query_type)
+            return statement, query_type
+
+    # Run query classifier
+    with metrics.timed("classify_query"):
+        response = await stages.deadline.run(aclassify_query(statement), "classify_query")
+    query_type,response_text = extract_query_category_and_response(response)
+    print(f"[INFO] Query classified as: {query_type}")
+    print(f"[INFO] Model response: {response_text}")
+    classification_cache.put(cache_vector, query_type)
+    return statement, query_type
+
+
+async def answer_query(statement: str, query_type: str, stages: StageScheduler) -> object:
+    """Produces the response body for an already classified query."""
+    if query_type == "balance_query":
+        print(f"[INFO] Handling balance query")
+        contract_address = get_contract_address(statement)
+        user_assets = await stages.result("balances", fetch_balances(contract_address))
+        return {"balances": format_token_balances(user_assets)}
+
+    elif query_type == "investment_query":
+        print(f"[INFO] Handling investment query")
+        return {"investment_plan": await aget_investment_plan(statement, stages)}
+
+    elif query_type == "other_query":
+        chatbot, docs = await stages.result("context", load_context(statement, stages.deadline))
+        print(f"[INFO] Handling other query")
+        return await stages.deadline.run(aanswer(chatbot, statement, docs), "chatbot")
+
+    else:
+        print(f"[WARN] Unrecognized query type: {query_type}")
+        return {"error": "Sorry, I couldn't understand your query."}
+
+
+async def handle_investment_plan(data) -> Tuple[object, int, Dict[str, str]]:
+    """
+    Runs the /investment-plan pipeline for one request body.
+
+    Returns the JSON-serialisable response body, the HTTP status code and any extra response
+    headers, so the Flask and ASGI servers can share the same contract. Requests beyond the
+    admission queue get 429 with Retry-After; requests that run out of budget get 504.
+    """
+    try:
+        try:
+            chat_id, user_messages = parse_request(data)
+        except ValueError as ve:
+            return {"error": str(ve)}, 400, {}
+
+        deadline = request_deadline(data)
+        with metrics.timed("request"):
+            async with admission.slot(deadline):
+                async with StageScheduler(deadline) as stages:
+                    statement, query_type = await classify_request(chat_id, user_messages, stages)
+                    return await answer_query(statement, query_type, stages), 200, {}
+
+    except Overloaded as e:
+        print(f"[WARN] {str(e)}")
+        return {"error": str(e)}, 429, {"Retry-After": str(e.retry_after)}
+
+    except DeadlineExceeded as e:
+        print(f"[ERROR] {str(e)}")
+        return {"error": "The request took too long, please try again."}, 504, {}
+
+    except ValueError as ve:
+        print(f"[ERROR] {str(ve)}")
+        return {"error": str(ve)}, 400, {}
+
+    except Exception as e:
+        print(f"[ERROR] {str(e)}")
+        return {"error": "An unexpected error occurred."}, 500, {}
+
+
+def sse_event(event: str, data) -> str:
+    """Formats one Server-Sent Event with a JSON-encoded payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def within_deadline(agen, deadline: Deadline, stage: str):
+    """
+    Re-yields the items of an async generator, raising DeadlineExceeded once the request's
+    budget runs out while waiting for the next one. The generator is always closed, which
+    for a model stream stops the generation.
+    """
+    try:
+        while True:
+            try:
+                item = await deadline.run(agen.__anext__(), stage)
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        await agen.aclose()
+
+
+async def stream_investment_plan(data):
+    """
+    Streaming variant of handle_investment_plan that yields Server-Sent Events.
+
+    For other_query the chatbot answer is sent as `token` events while Ollama generates it.
+    Every other query type produces a single `result` event with the usual response body.
+    Failures are reported as an `error` event carrying the HTTP status the non-streaming
+    endpoint would have used, including a 504 when the request deadline runs out mid-stream.
+    The stream always ends with a `done` event.
+    """
+    try:
+        chat_id, user_messages = parse_request(data)
+        deadline = request_deadline(data)
+        async with admission.slot(deadline), StageScheduler(deadline) as stages:
+            statement, query_type = await classify_request(chat_id, user_messages, stages)
+            yield sse_event("category", {"category": query_type})
+
+            if query_type == "other_query":
+                print("[INFO] Streaming other query")
+                chatbot, docs = await stages.result("context", load_context(statement, stages.deadline))
+                # The stream is bounded by the same deadline as the blocking endpoint
+                async for token in within_deadline(astream_answer(chatbot, statement, docs), deadline, "chatbot"):
+                    yield sse_event("token", {"token": token})
+            else:
+                yield sse_event("result", await answer_query(statement, query_type, stages))
+
+    except Overloaded as e:
+        print(f"[WARN] {str(e)}")
+        yield sse_event("error", {"error": str(e), "status": 429, "retry_after": e.retry_after})
+
+    except DeadlineExceeded as e:
+        print(f"[ERROR] {str(e)}")
+        yield sse_event("error", {"error": "The request took too long, please try again.", "status": 504})
+
+    except ValueError as ve:
+        print(f"[ERROR] {str(ve)}")
+        yield sse_event("error", {"error": str(ve), "status": 400})
+
+    except Exception as e:
+        print(f"[ERROR] {str(e)}")
+        yield sse_event("error", {"error": "An unexpected error occurred.", "status": 500})
+
+    yield sse_event("done", {})
+
+
+def parse_batch_request(data) -> Tuple[List[dict], int]:
+    """Validates a batch request body and returns (wallet items, concurrency)."""
+    if not data:
+        raise ValueError("Missing JSON body")
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+
+    wallets = data.get("wallets")
+    if not isinstance(wallets, list) or not wallets:
+        raise ValueError("Missing wallets")
+    if len(wallets) > BATCH_MAX_WALLETS:
+        raise ValueError(f"Too many wallets; at most {BATCH_MAX_WALLETS} per call")
+
+    concurrency = data.get("concurrency") or BATCH_CONCURRENCY
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int):
+        raise ValueError(f"concurrency must be an integer between 1 and {BATCH_CONCURRENCY}")
+    return wallets, max(1, min(concurrency, BATCH_CONCURRENCY))
+
+
+async def _plan_wallet(index: int, item, snapshot) -> dict:
+    """Plans one batch item; failures are reported in the item's result instead of raised."""
+    wallet = item.get("wallet") if isinstance(item, dict) else None
+    result = {"index": index, "wallet": wallet}
+    try:
+        if not wallet:
+            raise ValueError("Missing wallet")
+        filters = filters_from_response(item.get("filters") or {})
+        user_assets = await fetch_balances(wallet)
+        plan = await asyncio.to_thread(build_investment_plan, user_assets, filters, snapshot)
+        result["investment_plan"] = plan
+    except ValueError as ve:
+        result["error"] = str(ve)
+    except Exception as e:
+        print(f"[ERROR] Batch item {index}: {str(e)}")
+        result["error"] = "An unexpected error occurred."
+    return result
+
+
+async def stream_batch_plans(wallets: List[dict], concurrency: int):
+    """
+    Plans many wallets against one APY snapshot and yields NDJSON lines as each completes.
+
+    Each item is {"wallet": address, "filters": {...}} where filters use the classify_risk
+    schema (risk_profile, risk_levels, is_audited, protocols, min_tvl, apy, assets), so no
+    LLM call is made. At most `concurrency` wallets are in flight at once. Lines arrive in
+    completion order and carry the item's `index`.
+    """
+    snapshot = await asyncio.to_thread(load_apy_snapshot)
+    queue = asyncio.Queue()
+    items = iter(enumerate(wallets))
+
+    async def worker():
+        for index, item in items:
+            await queue.put(await _plan_wallet(index, item, snapshot))
+
+    with metrics.timed("batch"):
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(concurrency, len(wallets)))]
+        try:
+            for _ in range(len(wallets)):
+                yield json.dumps(await queue.get()) + "\n"
+        finally:
+            for task in workers:
+                task.cancel()
@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from src import metrics
+
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "4096"))
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "4096"))
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping that reports hits and misses to /metrics."""
+
+    def __init__(self, name, max_entries):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                metrics.inc("cache_misses_total", cache=self.name)
+                return default
+            self._entries.move_to_end(key)
+            metrics.inc("cache_hits_total", cache=self.name)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def balances_fingerprint(user_assets):
+    """Stable digest of a wallet's balances, independent of dict ordering."""
+    canonical = json.dumps(sorted((symbol, round(float(balance), 12)) for symbol, balance in user_assets.items()))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def normalize_filters(filters):
+    """Canonical, hashable form of allocate_assets keyword arguments."""
+    normalized = []
+    for name, value in sorted(filters.items()):
+        if isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(str(v).lower() for v in value))
+        elif isinstance(value, str):
+            value = value.lower()
+        normalized.append((name, value))
+    return tuple(normalized)
+
+
+class PlanCache:
+    """
+    Caches allocate_assets output keyed by (balances fingerprint, normalized filters,
+    APY snapshot version). When a new APY snapshot version shows up, every cached plan
+    is dropped, so plans are never served from stale yield data.
+    """
+
+    def __init__(self, max_entries=PLAN_CACHE_SIZE):
+        self._cache = LRUCache("plan", max_entries)
+        self._version = None
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+
+    def get(self, user_assets, filters, version):
+        self._check_version(version)
+        return self._cache.get((balances_fingerprint(user_assets), normalize_filters(filters), version))
+
+    def put(self, user_assets, filters, version, plan):
+        self._check_version(version)
+        self._cache.put((balances_fingerprint(user_assets), normalize_filters(filters), version), plan)
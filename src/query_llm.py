@@ -1,34 +1,25 @@
-from langchain_ollama import OllamaLLM
+import os
 import re
+import json
 import logging
+from src import llm_client
+from src.single_flight import AsyncSingleFlight, SingleFlight, normalize_prompt
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Identical prompts that are in flight at the same time share one generation
+_classify_flight = SingleFlight("classify_query")
+_aclassify_flight = AsyncSingleFlight("classify_query")
+_extract_flight = SingleFlight("extract_query")
+_aextract_flight = AsyncSingleFlight("extract_query")
 
-def classify_query(statement: str, model_name: str = "mistral", base_url: str = "http://localhost:11434") -> str:
-    """
-    Classifies a user query into one of the following categories:
-    - investment_query
-    - balance_query
-    - other_query (with a model-generated response)
+# Model used for the combined classification + filter extraction call
+COMBINED_MODEL = os.getenv("COMBINED_MODEL", "mistral")
 
-    Parameters:
-    - statement (str): The user's input statement.
-    - model_name (str): The name of the local model to use.
-    - base_url (str): The base URL of the Ollama server.
 
-    Returns:
-    - str: The classification category, and optionally a model response.
-    """
-    try:
-        llm = OllamaLLM(
-            model=model_name,
-            base_url=base_url,
-            temperature=0.1
-        )
-        prompt = f"""
+CLASSIFICATION_PROMPT = """
         You are a smart assistant designed to classify user queries into one of three categories:
 
         1. investment_query — Queries asking for contract addresses, investment suggestions, or investment filters.
@@ -51,27 +42,148 @@ def classify_query(statement: str, model_name: str = "mistral", base_url: str =
         {statement}
         """
 
+
+def _parse_classification(response) -> str:
+    """Normalises the raw model output returned by classify_query / aclassify_query."""
+    if not isinstance(response, str):
+        raise ValueError("Unexpected response type from model.")
+
+    response = response.strip().lower()
+
+    # Validate the start of the response
+    match = re.match(r"^(investment_query|balance_query|other_query)", response)
+    if match:
+        return response
+    else:
+        return f"Unexpected model response format: {response}"
+
+
+def classify_query(statement: str, model_name: str = "mistral") -> str:
+    """
+    Classifies a user query into one of the following categories:
+    - investment_query
+    - balance_query
+    - other_query (with a model-generated response)
+
+    Parameters:
+    - statement (str): The user's input statement.
+    - model_name (str): The name of the local model to use.
+
+    Returns:
+    - str: The classification category, and optionally a model response.
+    """
+    key = (model_name, normalize_prompt(statement))
+    return _classify_flight.do(key, _classify_query, statement, model_name)
+
+
+def _classify_query(statement, model_name):
+    try:
+        prompt = CLASSIFICATION_PROMPT.format(statement=statement)
+
         logger.info("Sending prompt to model:\n%s", prompt)
 
-        response = llm.invoke(prompt)
+        return _parse_classification(llm_client.invoke(model_name, prompt, caller="classify_query"))
+
+    except Exception as e:
+        logger.error("Error during classification: %s", str(e))
+        return f"Error: {str(e)}"
+
 
-        if not isinstance(response, str):
-            raise ValueError("Unexpected response type from model.")
+async def aclassify_query(statement: str, model_name: str = "mistral") -> str:
+    """Async variant of classify_query that awaits the model without blocking the event loop."""
+    key = (model_name, normalize_prompt(statement))
+    return await _aclassify_flight.do(key, _aclassify_query, statement, model_name)
 
-        response = response.strip().lower()
 
-        # Validate the start of the response
-        match = re.match(r"^(investment_query|balance_query|other_query)", response)
-        if match:
-            return response
-        else:
-            return f"Unexpected model response format: {response}"
+async def _aclassify_query(statement, model_name):
+    try:
+        prompt = CLASSIFICATION_PROMPT.format(statement=statement)
+
+        logger.info("Sending prompt to model:\n%s", prompt)
+
+        return _parse_classification(await llm_client.ainvoke(model_name, prompt, caller="classify_query"))
 
     except Exception as e:
         logger.error("Error during classification: %s", str(e))
         return f"Error: {str(e)}"
 
 
+CATEGORIES = ("investment_query", "balance_query", "other_query")
+
+COMBINED_PROMPT = """Classify the user's current query and extract their investment preferences in one JSON object.
+
+        - `category`: `"investment_query"` for contract addresses, investment suggestions or investment filters, `"balance_query"` for wallet balance questions, otherwise `"other_query"`.
+        - `risk_profile`: One of `"Risk averse"`, `"Balanced"`, `"Aggressive"` or `"None"`. Use `"Risk averse"` for only low-risk investments, `"Balanced"` for a mix, `"Aggressive"` for high-risk opportunities, `"None"` if no preference is mentioned.
+        - `risk_levels`: Protocol risk levels the user restricts to (`"low"`, `"medium"`, `"high"`), else `[]`. Only one of `risk_profile` or `risk_levels` may be set.
+        - `is_audited`: `true` if the user asks for only audited protocols, else `false`.
+        - `protocols`: Protocols mentioned (e.g. `"vesu"`, `"strkfarm"`, `"endur"`), else `[]`.
+        - `min_tvl`: Minimum TVL mentioned as a number, else `0`.
+        - `apy`: Minimum APY mentioned as a number, else `0`.
+        - `assets`: Tokens explicitly mentioned as tokens or assets (e.g. `"USDC"`, `"STRK"`, `"ETH"`), else `[]`.
+
+        For balance_query and other_query, leave every preference at its empty value.
+        The last sentence is the **current user query**, with previous conversation context included if applicable.
+
+        User query:
+        {statement}"""
+
+# JSON schema passed as Ollama's `format`, so the model can only produce a matching object
+COMBINED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": list(CATEGORIES)},
+        "risk_profile": {"type": "string", "enum": ["Risk averse", "Balanced", "Aggressive", "None"]},
+        "risk_levels": {"type": "array", "items": {"type": "string", "enum": ["low", "medium", "high"]}},
+        "is_audited": {"type": "boolean"},
+        "protocols": {"type": "array", "items": {"type": "string"}},
+        "min_tvl": {"type": "number"},
+        "apy": {"type": "number"},
+        "assets": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["category", "risk_profile", "risk_levels", "is_audited", "protocols", "min_tvl", "apy", "assets"],
+}
+
+
+def _parse_extraction(result) -> dict:
+    """Validates the combined call's JSON object; raises ValueError if it is unusable."""
+    if result.get("category") not in CATEGORIES:
+        raise ValueError(f"Unexpected model response format: {json.dumps(result)}")
+    return result
+
+
+def extract_query(statement: str, model_name: str = COMBINED_MODEL) -> dict:
+    """
+    Classifies a query and extracts its investment filters with a single schema-constrained
+    generation. Returns a dict with `category` plus the classify_risk filter fields
+    (risk_profile, risk_levels, is_audited, protocols, min_tvl, apy, assets).
+    Raises ValueError if the model output does not match the schema.
+    """
+    key = (model_name, normalize_prompt(statement))
+    return _extract_flight.do(key, _extract_query, statement, model_name)
+
+
+def _extract_query(statement, model_name):
+    prompt = COMBINED_PROMPT.format(statement=statement)
+    result = llm_client.invoke_json(
+        model_name, prompt, fallback_model=None, format=COMBINED_SCHEMA, temperature=0, caller="extract_query"
+    )
+    return _parse_extraction(result)
+
+
+async def aextract_query(statement: str, model_name: str = COMBINED_MODEL) -> dict:
+    """Async variant of extract_query."""
+    key = (model_name, normalize_prompt(statement))
+    return await _aextract_flight.do(key, _aextract_query, statement, model_name)
+
+
+async def _aextract_query(statement, model_name):
+    prompt = COMBINED_PROMPT.format(statement=statement)
+    result = await llm_client.ainvoke_json(
+        model_name, prompt, fallback_model=None, format=COMBINED_SCHEMA, temperature=0, caller="extract_query"
+    )
+    return _parse_extraction(result)
+
+
 # === Example Usage ===
 if __name__ == "__main__":
     test_statements = [
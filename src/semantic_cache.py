@@ -0,0 +1,126 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+
+
+class SemanticCache:
+    """
+    Maps texts to values by meaning rather than by exact string.
+
+    Each stored text is embedded once; a lookup embeds the new text and returns the value of
+    the most similar live entry if its cosine similarity reaches `threshold`. Entries expire
+    after `ttl` seconds and, when the cache is full, the least recently used one is replaced.
+    Vectors live in one preallocated matrix, so a lookup is a single matrix-vector product.
+
+    `embed` is any callable turning a string into a vector (e.g. `Embeddings.embed_query`).
+    When `values` is given, only those values are ever stored. When `load` is given (e.g. a
+    function loading the embedding model), it is run once in a background thread on the first
+    lookup; until it has finished lookups miss without embedding, and if it fails the cache
+    stays disabled for the life of the process.
+    """
+
+    def __init__(self, name, embed, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL, values=None, load=None):
+        self.name = name
+        self.values = frozenset(values) if values is not None else None
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._embed = embed
+        self._load = load
+        # "ready", or "idle" / "loading" / "failed" while `load` has not succeeded
+        self.state = "ready" if load is None else "idle"
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._values = [None] * max_entries
+        self._expires = np.full(max_entries, -np.inf)
+        self._last_used = np.zeros(max_entries)
+
+    def start(self):
+        """Starts loading in the background, once; returns True if the cache is ready."""
+        with self._lock:
+            if self.state != "idle":
+                return self.state == "ready"
+            self.state = "loading"
+        threading.Thread(target=self._run_load, name=f"{self.name}-cache-load", daemon=True).start()
+        return False
+
+    def _run_load(self):
+        try:
+            with metrics.timed(f"{self.name}_cache_load"):
+                self._load()
+        except Exception as e:
+            logger.warning("Semantic cache %s disabled, could not load its model: %s", self.name, e)
+            self.state = "failed"
+        else:
+            logger.info("Semantic cache %s ready", self.name)
+            self.state = "ready"
+
+    def embed(self, text):
+        vector = np.asarray(self._embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, text):
+        """
+        Returns (value, vector): the cached value or None on a miss, plus the text's embedding
+        so the caller can `put` the freshly computed value without embedding it again.
+        Embedding failures are logged and treated as a miss with no vector, as are lookups
+        made before the cache is ready.
+        """
+        if not self.start():
+            metrics.inc("cache_skipped_total", cache=self.name, state=self.state)
+            return None, None
+        try:
+            with metrics.timed("semantic_cache_embed"):
+                vector = self.embed(text)
+        except Exception as e:
+            logger.warning("Semantic cache %s could not embed query: %s", self.name, e)
+            metrics.inc("cache_misses_total", cache=self.name)
+            return None, None
+
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is not None:
+                similarities = self._vectors @ vector
+                similarities[self._expires <= now] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._last_used[best] = now
+                    metrics.inc("cache_hits_total", cache=self.name)
+                    return self._values[best], vector
+
+        metrics.inc("cache_misses_total", cache=self.name)
+        return None, vector
+
+    def put(self, vector, value):
+        """Stores `value` under an embedding previously returned by `lookup`."""
+        if vector is None or (self.values is not None and value not in self.values):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            expired = np.flatnonzero(self._expires <= now)
+            slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._values[slot] = value
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+
+    def clear(self):
+        with self._lock:
+            self._values = [None] * self.max_entries
+            self._expires[:] = -np.inf
+
+    def __len__(self):
+        return int(np.count_nonzero(self._expires > time.monotonic()))
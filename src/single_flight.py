@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import weakref
+from src import metrics
+
+
+def normalize_wallet(address: str) -> str:
+    """Canonical form of a wallet address, matching how get_token_balances_dict parses it."""
+    return hex(int(str(address).strip(), 16))
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapses whitespace and case so resent or re-typed messages map to the same key."""
+    return " ".join(str(text).split()).lower()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key in a threaded context.
+
+    The first caller for a key runs the function; callers that arrive while it is still
+    running wait for it and receive the same result (or exception). Nothing is cached once
+    the call finishes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("single_flight_shared_total", group=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent coroutine calls with the same key on the running event loop.
+
+    The shared work runs as its own task, so one waiter being cancelled does not cancel it
+    for the others; it is only cancelled once every waiter has gone away.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # Futures belong to a loop, so in-flight calls are tracked per loop
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        entry = calls.get(key)
+
+        if entry is None:
+            task = loop.create_task(coro_fn(*args, **kwargs))
+            entry = calls[key] = [task, 0]
+            task.add_done_callback(lambda t: calls.pop(key, None) if calls.get(key) is entry else None)
+        else:
+            metrics.inc("single_flight_shared_total", group=self.name)
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and entry[1] == 1:
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StageScheduler:
+    """
+    Runs named pipeline stages as asyncio tasks so that independent stages overlap.
+
+    Stages can be started speculatively before we know whether their result is needed.
+    Every stage still running when the scheduler is closed is cancelled: speculative work
+    nobody awaited, and stages abandoned because a stage they were gathered with failed, so
+    neither keeps the RPC node or the model server busy after the request has ended.
+
+    Usage:
+        async with StageScheduler() as stages:
+            stages.start("balances", fetch_balances(address))
+            ...
+            balances = await stages.result("balances")
+    """
+
+    def __init__(self, deadline=None):
+        # Every stage started through the scheduler is bounded by the request deadline
+        self.deadline = deadline
+        self._tasks = {}
+        self._consumed = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.cancel_pending()
+        return False
+
+    def start(self, name, coro):
+        """Schedules `coro` as stage `name` unless that stage is already running."""
+        if name in self._tasks:
+            coro.close()
+            return self._tasks[name]
+        if self.deadline is not None:
+            coro = self.deadline.run(coro, name)
+        task = asyncio.ensure_future(coro)
+        # Retrieve the exception of stages nobody awaits so asyncio does not warn about it
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[name] = task
+        return task
+
+    def started(self, name):
+        return name in self._tasks
+
+    async def result(self, name, coro=None):
+        """
+        Awaits stage `name`. If it was never started, `coro` is run now instead, so callers
+        can use the same code path whether or not the stage was prefetched.
+        """
+        if name not in self._tasks:
+            if coro is None:
+                raise KeyError(f"Stage {name!r} was never started")
+            self.start(name, coro)
+        elif coro is not None:
+            coro.close()
+        self._consumed.add(name)
+        return await self._tasks[name]
+
+    async def gather(self, **stages):
+        """Awaits several stages concurrently; keyword values are fallback coroutines or None."""
+        names = list(stages)
+        results = await asyncio.gather(*(self.result(name, coro) for name, coro in stages.items()))
+        return dict(zip(names, results))
+
+    def cancel_pending(self):
+        """Cancels every started stage that has not finished; unused ones count as wasted."""
+        for name, task in self._tasks.items():
+            unused = name not in self._consumed
+            if not task.done():
+                task.cancel()
+                logger.info("Cancelled %s stage %s", "unused speculative" if unused else "abandoned", name)
+            if unused:
+                metrics.inc("speculative_stages_wasted_total", stage=name)
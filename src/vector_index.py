@@ -0,0 +1,541 @@
+"""
+Versioned on-disk format for the retriever's vector index.
+
+An index directory holds:
+    manifest.json             format version, index version, embedding model, file names
+    index-<version>.faiss     native FAISS index searched by the retriever
+    vectors-<version>.faiss   exact (flat) copy of the vectors when the search index is approximate
+    chunks-<version>.jsonl    one line per vector: docstore id, text and metadata
+
+The search index type is chosen with VECTOR_INDEX_TYPE:
+    flat     exact search, the vectors themselves (default)
+    hnsw     HNSW graph: lowest query latency, more memory than flat
+    ivfpq    inverted lists over product-quantized codes: a fraction of flat's memory
+    sq8      8-bit scalar-quantized vectors: a quarter of flat's memory, still exhaustive
+Approximate indexes are trained on the stored vectors and their search parameter (HNSW
+efSearch, IVF nprobe) is set to the smallest value that reaches VECTOR_INDEX_TARGET_RECALL
+against exact search; both are recorded in the manifest. Compare the options on a published
+index with `python -m src.vector_index report`, or switch an index's type without embedding
+anything again with `python -m src.vector_index reindex --type hnsw`.
+
+Indexes built by `update_index` are keyed by chunk content: each chunk's id is a hash of its
+text and metadata, and the FAISS index maps that hash to its vector, so a rebuild only embeds
+chunks that are new and deletes the ones that disappeared.
+
+Data files are written under new, versioned names and the manifest is replaced last, so
+readers always see a complete index and processes that still map an older version keep
+working. With faiss >= 1.11 indexes are loaded memory-mapped (IO_FLAG_MMAP_IFC), so several
+processes share page-cache-backed vectors instead of private copies; older builds read
+them into memory.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import argparse
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from src.embeddings import EMBEDDING_MODEL, get_embeddings
+from src.embedding_pool import EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS, embed_stream
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+# Older index versions kept next to the current one for processes that still map them
+KEEP_VERSIONS = int(os.getenv("VECTOR_INDEX_KEEP_VERSIONS", "2"))
+# Zero-copy mapping of flat vector storage (IndexFlat, IndexIDMap2, HNSW) needs faiss >= 1.11;
+# the older IO_FLAG_MMAP only maps inverted lists and would still copy these indexes
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq", "sq8")
+INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "200"))
+TARGET_RECALL = float(os.getenv("VECTOR_INDEX_TARGET_RECALL", "0.95"))
+RECALL_K = int(os.getenv("VECTOR_INDEX_RECALL_K", "10"))
+# Below this many vectors an approximate index buys nothing and flat is used instead
+ANN_MIN_VECTORS = int(os.getenv("VECTOR_INDEX_ANN_MIN_VECTORS", "1000"))
+TRAIN_SAMPLE = 100_000
+TUNING_QUERIES = 200
+EF_SEARCH_CANDIDATES = (16, 32, 64, 128, 256, 512)
+
+
+def manifest_path(directory):
+    return os.path.join(directory, MANIFEST_NAME)
+
+
+def read_manifest(directory):
+    with open(manifest_path(directory), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported vector index format in {directory}: {manifest.get('format_version')}")
+    return manifest
+
+
+def is_index_dir(path):
+    return os.path.isfile(manifest_path(path))
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def _prune_versions(directory, keep_files):
+    """Deletes data files of all but the newest KEEP_VERSIONS index versions."""
+    versions = {}
+    for name in os.listdir(directory):
+        prefix, _, rest = name.partition("-")
+        if prefix in ("index", "vectors", "chunks") and not name.endswith(".tmp"):
+            path = os.path.join(directory, name)
+            versions.setdefault(rest.rsplit(".", 1)[0], []).append(path)
+    ordered = sorted(versions.items(), key=lambda item: max(os.path.getmtime(p) for p in item[1]), reverse=True)
+    for _, paths in ordered[KEEP_VERSIONS:]:
+        for path in paths:
+            if os.path.basename(path) not in keep_files:
+                os.remove(path)
+
+
+def save_index(directory, index, chunks, embedding_model=EMBEDDING_MODEL, normalize=True, vectors=None,
+               embedding_kind="huggingface", **extra):
+    """
+    Publishes a new index version.
+
+    `index` is a FAISS index and `chunks` an iterable of (docstore id, Document) pairs in the
+    index's vector order. `vectors` is the exact index an approximate `index` was built from,
+    kept for incremental updates and recall checks. `embedding_model`, `normalize` and
+    `embedding_kind` must describe the embeddings the vectors came from, since loaders embed
+    queries with them (see get_embeddings). Extra keyword arguments are stored in the manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    index_file = f"index-{version}.faiss"
+    vectors_file = index_file
+    chunks_file = f"chunks-{version}.jsonl"
+
+    _write_atomic(os.path.join(directory, index_file), lambda path: faiss.write_index(index, path))
+    if vectors is not None and vectors is not index:
+        vectors_file = f"vectors-{version}.faiss"
+        _write_atomic(os.path.join(directory, vectors_file), lambda path: faiss.write_index(vectors, path))
+
+    count = 0
+
+    def write_chunks(path):
+        nonlocal count
+        with open(path, "w", encoding="utf-8") as f:
+            for doc_id, doc in chunks:
+                f.write(json.dumps({"id": doc_id, "text": doc.page_content, "metadata": doc.metadata}) + "\n")
+                count += 1
+
+    _write_atomic(os.path.join(directory, chunks_file), write_chunks)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": time.time(),
+        "embedding_model": embedding_model,
+        "embedding_kind": embedding_kind,
+        "normalize": normalize,
+        "dimension": index.d,
+        "count": count,
+        "index_file": index_file,
+        "vectors_file": vectors_file,
+        "chunks_file": chunks_file,
+        **extra,
+    }
+    _write_atomic(manifest_path(directory), lambda path: _write_json(path, manifest))
+    _prune_versions(directory, {index_file, vectors_file, chunks_file})
+    logger.info("Published vector index %s (%d chunks) to %s", version, count, directory)
+    return manifest
+
+
+def save_vector_store(vector_store, directory, embedding_model=EMBEDDING_MODEL, normalize=True,
+                      embedding_kind="huggingface"):
+    """Publishes a LangChain FAISS vector store in the native format."""
+    chunks = (
+        (doc_id, vector_store.docstore.search(doc_id))
+        for _, doc_id in sorted(vector_store.index_to_docstore_id.items())
+    )
+    return save_index(directory, vector_store.index, chunks, embedding_model, normalize,
+                      embedding_kind=embedding_kind)
+
+
+def manifest_embeddings(manifest):
+    """The embeddings the index in `manifest` was built with, for embedding queries."""
+    return get_embeddings(manifest["embedding_model"], manifest["normalize"],
+                          manifest.get("embedding_kind", "huggingface"))
+
+
+def read_index(path):
+    """Reads a FAISS index memory-mapped and read-only where possible, otherwise into memory."""
+    if MMAP_FLAG is None:
+        logger.info("Reading %s into memory (this faiss build cannot memory-map it)", path)
+        return faiss.read_index(path)
+    try:
+        index = faiss.read_index(path, MMAP_FLAG | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        # Not every index type can be mapped; load it into memory instead
+        logger.info("Memory-mapping %s not supported (%s); reading it into memory", path, e)
+        return faiss.read_index(path)
+    logger.info("Memory-mapped %s", path)
+    return index
+
+
+def read_chunks(path):
+    """Yields (docstore id, Document) pairs from a chunk store."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            yield entry["id"], Document(page_content=entry["text"], metadata=entry.get("metadata") or {})
+
+
+def _vector_store(index, chunks, embeddings, id_map):
+    if id_map:
+        # Search returns the hash-derived labels stored in the IndexIDMap
+        index_to_docstore_id = {chunk_label(doc_id): doc_id for doc_id, _ in chunks}
+    else:
+        index_to_docstore_id = {position: doc_id for position, (doc_id, _) in enumerate(chunks)}
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(chunks)),
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def load_vector_store(directory, manifest=None):
+    """Loads an index directory as a LangChain FAISS vector store."""
+    manifest = manifest or read_manifest(directory)
+    index = read_index(os.path.join(directory, manifest["index_file"]))
+    set_search_params(index, manifest.get("search_params") or {})
+    chunks = list(read_chunks(os.path.join(directory, manifest["chunks_file"])))
+    embeddings = manifest_embeddings(manifest)
+    return _vector_store(index, chunks, embeddings, manifest.get("id_map", False))
+
+
+def chunk_id(doc):
+    """Content hash of a chunk, used as its docstore id."""
+    payload = json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_label(doc_id):
+    """The 63-bit FAISS label of a chunk id."""
+    return int(doc_id[:15], 16)
+
+
+def set_search_params(index, params):
+    """Applies recorded search parameters (efSearch, nprobe) to an index wrapped in an IndexIDMap."""
+    base = faiss.downcast_index(index.index) if hasattr(index, "id_map") else faiss.downcast_index(index)
+    if "efSearch" in params:
+        base.hnsw.efSearch = params["efSearch"]
+    if "nprobe" in params:
+        base.nprobe = params["nprobe"]
+
+
+def _pq_subquantizers(dimension):
+    """Largest divisor of `dimension` leaving at least 8 dimensions per PQ sub-quantizer."""
+    return max(m for m in range(1, dimension // 8 + 1) if dimension % m == 0)
+
+
+def _make_ann(index_type, dimension, count):
+    """An empty approximate index and its parameters, sized for `count` vectors."""
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index, {"M": HNSW_M, "efConstruction": HNSW_EF_CONSTRUCTION}
+    if index_type == "ivfpq":
+        # ~4*sqrt(n) lists, with the 39 training points per centroid k-means asks for
+        nlist = max(1, min(int(4 * np.sqrt(count)), count // 39))
+        m = _pq_subquantizers(dimension)
+        nbits = int(min(8, max(4, np.log2(count / 39))))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, m, nbits)
+        return index, {"nlist": nlist, "m": m, "nbits": nbits}
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit), {}
+    raise ValueError(f"Unknown vector index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+
+
+def _exact_neighbours(vectors, ids, queries, k):
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, positions = flat.search(queries, k)
+    return ids[positions]
+
+
+def recall_at_k(index, queries, truth, k):
+    _, found = index.search(queries, k)
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def _tuning_queries(vectors, count=TUNING_QUERIES):
+    rng = np.random.default_rng(0)
+    return vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+
+
+def _tune(index, index_type, queries, truth, k, target):
+    """Picks the cheapest efSearch / nprobe whose recall@k reaches `target`."""
+    if index_type == "hnsw":
+        name, candidates = "efSearch", [ef for ef in EF_SEARCH_CANDIDATES if ef >= k] or [k]
+    elif index_type == "ivfpq":
+        nlist = faiss.extract_index_ivf(index).nlist
+        name, candidates = "nprobe", sorted({min(2 ** i, nlist) for i in range(int(np.log2(nlist)) + 2)})
+    else:
+        return {}, recall_at_k(index, queries, truth, k)
+    for value in candidates:
+        set_search_params(index, {name: value})
+        recall = recall_at_k(index, queries, truth, k)
+        if recall >= target:
+            break
+    return {name: value}, recall
+
+
+def build_search_index(source, index_type=INDEX_TYPE, k=RECALL_K, target=TARGET_RECALL):
+    """
+    Builds the index the retriever searches from `source`, an IndexIDMap2 over a flat index.
+
+    Returns (index, effective type, manifest details). Flat returns `source` itself; the
+    approximate types are trained on (a sample of) the vectors, filled with the same ids and
+    tuned against exact search. Corpora under ANN_MIN_VECTORS always use flat.
+    """
+    index_type = index_type.lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    if index_type == "flat" or source.ntotal < ANN_MIN_VECTORS:
+        if index_type != "flat":
+            logger.info("Only %d vectors; using a flat index instead of %s", source.ntotal, index_type)
+        return source, "flat", {}
+
+    started = time.perf_counter()
+    ids = faiss.vector_to_array(source.id_map)
+    vectors = source.index.reconstruct_n(0, source.ntotal)
+    base, build_params = _make_ann(index_type, vectors.shape[1], len(vectors))
+    if not base.is_trained:
+        base.train(_tuning_queries(vectors, TRAIN_SAMPLE))
+    index = faiss.IndexIDMap2(base)
+    index.add_with_ids(vectors, ids)
+
+    k = min(k, len(vectors))
+    queries = _tuning_queries(vectors)
+    search_params, recall = _tune(index, index_type, queries, _exact_neighbours(vectors, ids, queries, k), k, target)
+    details = {
+        "build_params": build_params,
+        "search_params": search_params,
+        "recall": {"k": k, "value": round(recall, 4), "target": target},
+        "build_seconds": round(time.perf_counter() - started, 3),
+    }
+    if recall < target:
+        logger.warning("%s index reaches recall@%d of %.3f, below the %.2f target", index_type, k, recall, target)
+    logger.info("Built %s index over %d vectors: %s", index_type, len(vectors), details)
+    return index, index_type, details
+
+
+def _batched_embed(embeddings, texts, batch_size):
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        yield np.arange(start, start + len(batch)), np.asarray(embeddings.embed_documents(batch), dtype=np.float32)
+
+
+def update_index(directory, documents, embeddings=None, embedding_model=EMBEDDING_MODEL, normalize=True,
+                 batch_size=EMBEDDING_BATCH_SIZE, workers=EMBEDDING_WORKERS, index_type=INDEX_TYPE,
+                 embedding_kind="huggingface"):
+    """
+    Brings the index in `directory` in line with `documents` and publishes a new version.
+
+    Chunks whose content hash is already indexed keep their vectors, chunks that are gone are
+    removed from the index and only new or changed chunks are embedded, so the cost scales
+    with the size of the change. A missing index, one built with a different embedding model,
+    or one in the older positional layout is rebuilt from scratch.
+
+    New chunks are embedded in batches of `batch_size` and added to the index batch by batch.
+    Without `embeddings`, `embedding_model` is run by the embedding worker pool (see
+    embedding_pool); a given Embeddings object is called in-process instead and must match
+    `embedding_model`, `normalize` and `embedding_kind`, which are recorded in the manifest.
+
+    Updates are applied to the exact copy of the vectors; the searched index is then rebuilt
+    from it as `index_type` (see build_search_index).
+    Returns the updated LangChain FAISS vector store.
+    """
+    started = time.perf_counter()
+
+    wanted = {}
+    for doc in documents:
+        wanted.setdefault(chunk_id(doc), doc)
+
+    index, existing = None, {}
+    if is_index_dir(directory):
+        manifest = read_manifest(directory)
+        reusable = (
+            manifest.get("id_map")
+            and manifest["embedding_model"] == embedding_model
+            and manifest["normalize"] == normalize
+            and manifest.get("embedding_kind", "huggingface") == embedding_kind
+        )
+        if reusable:
+            source_file = manifest.get("vectors_file", manifest["index_file"])
+            index = faiss.read_index(os.path.join(directory, source_file))
+            existing = dict(read_chunks(os.path.join(directory, manifest["chunks_file"])))
+        else:
+            logger.info("Index in %s is not reusable for incremental updates; rebuilding it", directory)
+
+    removed = [doc_id for doc_id in existing if doc_id not in wanted]
+    added = [doc_id for doc_id in wanted if doc_id not in existing]
+
+    if index is not None and removed:
+        index.remove_ids(np.array([chunk_label(doc_id) for doc_id in removed], dtype=np.int64))
+    embed_seconds = 0.0
+    if added:
+        texts = [wanted[doc_id].page_content for doc_id in added]
+        labels = np.array([chunk_label(doc_id) for doc_id in added], dtype=np.int64)
+        if embeddings is None and embedding_kind == "huggingface":
+            batches = embed_stream(texts, embedding_model, normalize, batch_size, workers)
+        elif embeddings is None:
+            # Worker processes only run plain HuggingFace models
+            embeddings = get_embeddings(embedding_model, normalize, embedding_kind)
+            batches = _batched_embed(embeddings, texts, batch_size)
+        else:
+            batches = _batched_embed(embeddings, texts, batch_size)
+        embed_started = time.perf_counter()
+        for positions, vectors in batches:
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            index.add_with_ids(vectors, labels[positions])
+        embed_seconds = time.perf_counter() - embed_started
+    if index is None:
+        raise ValueError("Cannot build an index without any documents")
+
+    stats = {
+        "added": len(added),
+        "removed": len(removed),
+        "reused": len(wanted) - len(added),
+        "seconds": round(time.perf_counter() - started, 3),
+        "chunks_per_second": round(len(added) / embed_seconds, 1) if embed_seconds else None,
+    }
+    chunks = list(wanted.items())
+    search_index, index_type, details = build_search_index(index, index_type)
+    save_index(directory, search_index, chunks, embedding_model, normalize, vectors=index,
+               embedding_kind=embedding_kind, id_map=True, index_type=index_type, last_update=stats, **details)
+    print(
+        f"Index updated: {stats['added']} chunks embedded, {stats['reused']} reused, "
+        f"{stats['removed']} removed in {stats['seconds']:.2f}s"
+    )
+    embeddings = embeddings or get_embeddings(embedding_model, normalize, embedding_kind)
+    return _vector_store(search_index, chunks, embeddings, id_map=True)
+
+
+def load_retriever(path, search_kwargs=None):
+    """
+    Loads a similarity retriever from an index directory. A path that is not an index
+    directory is treated as a retriever pickled by older versions of create_retriever.
+    """
+    if not is_index_dir(path):
+        import pickle
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return load_vector_store(path).as_retriever(search_type="similarity", search_kwargs=search_kwargs or {})
+
+
+def _read_source(directory, manifest):
+    if not manifest.get("id_map"):
+        raise ValueError(f"{directory} uses the positional layout; rebuild it with update_index first")
+    return faiss.read_index(os.path.join(directory, manifest.get("vectors_file", manifest["index_file"])))
+
+
+def reindex(directory, index_type=INDEX_TYPE):
+    """Republishes an index directory with another search index type, without re-embedding."""
+    manifest = read_manifest(directory)
+    source = _read_source(directory, manifest)
+    chunks = list(read_chunks(os.path.join(directory, manifest["chunks_file"])))
+    search_index, index_type, details = build_search_index(source, index_type)
+    return save_index(directory, search_index, chunks, manifest["embedding_model"], manifest["normalize"],
+                      vectors=source, embedding_kind=manifest.get("embedding_kind", "huggingface"),
+                      id_map=True, index_type=index_type,
+                      last_update=manifest.get("last_update"), **details)
+
+
+def report(directory, index_types=INDEX_TYPES, k=RECALL_K, queries=None):
+    """
+    Builds every index type over the vectors in `directory` and measures recall@k against
+    exact search, single-query latency and serialized size. `queries` are query texts,
+    embedded with the index's model; by default a sample of the stored vectors is used.
+    Returns one dict per index type.
+    """
+    manifest = read_manifest(directory)
+    source = _read_source(directory, manifest)
+    ids = faiss.vector_to_array(source.id_map)
+    vectors = source.index.reconstruct_n(0, source.ntotal)
+    if queries:
+        embeddings = manifest_embeddings(manifest)
+        query_vectors = np.asarray([embeddings.embed_query(text) for text in queries], dtype=np.float32)
+    else:
+        query_vectors = _tuning_queries(vectors)
+    k = min(k, len(vectors))
+    truth = _exact_neighbours(vectors, ids, query_vectors, k)
+
+    rows = []
+    for index_type in index_types:
+        started = time.perf_counter()
+        index, effective, details = build_search_index(source, index_type, k)
+        build_seconds = time.perf_counter() - started
+        latencies = []
+        for query in query_vectors:
+            query_started = time.perf_counter()
+            index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - query_started)
+        rows.append({
+            "type": index_type,
+            "effective_type": effective,
+            "recall": recall_at_k(index, query_vectors, truth, k),
+            "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+            "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+            "bytes": len(faiss.serialize_index(index)),
+            "build_seconds": build_seconds,
+            "search_params": details.get("search_params", {}),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and convert the retriever's vector index.")
+    parser.add_argument("command", choices=("report", "reindex"))
+    parser.add_argument("--path", default=os.getenv("RETRIEVER_PATH", "src/data/combined_index"))
+    parser.add_argument("--type", default=INDEX_TYPE, help="index type for reindex")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="comma-separated index types for report")
+    parser.add_argument("--k", type=int, default=RECALL_K)
+    parser.add_argument("--queries", help="file with one query per line (default: sample stored vectors)")
+    args = parser.parse_args()
+
+    if args.command == "reindex":
+        manifest = reindex(args.path, args.type)
+        print(f"Published {manifest['index_type']} index {manifest['version']} to {args.path}")
+        return
+
+    queries = None
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    manifest = read_manifest(args.path)
+    print(f"{manifest['count']} vectors of dimension {manifest['dimension']} in {args.path} "
+          f"(serving {manifest.get('index_type', 'flat')})")
+    print(f"{'type':<8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8} {'MB':>8} {'build s':>8}  params")
+    for row in report(args.path, [t.strip() for t in args.types.split(",") if t.strip()], args.k, queries):
+        name = row["type"] if row["type"] == row["effective_type"] else f"{row['type']}*"
+        print(f"{name:<8} {row['recall']:>10.3f} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} "
+              f"{row['bytes'] / 1e6:>8.1f} {row['build_seconds']:>8.2f}  {row['search_params']}")
+    print(f"* fewer than {ANN_MIN_VECTORS} vectors: built as flat")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,13 @@ from starknet_py.contract import Contract
 from starknet_py.net.full_node_client import FullNodeClient
 from dotenv import load_dotenv
 import os
+from src.single_flight import AsyncSingleFlight, normalize_wallet
 
 # ✅ Starknet RPC provider (Testnet / Mainnet)
 load_dotenv()
 NODE_URL = os.getenv("STARKNET_RPC_PROVIDER")  
 client = FullNodeClient(node_url=NODE_URL)
+_balance_flight = AsyncSingleFlight("get_token_balances")
 
 # ✅ List of ERC-20 token contract addresses
 PORTFOLIO_TOKENS = {
@@ -98,7 +100,16 @@ async def get_token_balances(contract_address: str) -> str:
     return "Wallet portfolio: \n" + balance_str if balance_str else "No tokens with balance found."
 
 async def get_token_balances_dict(contract_address: str) -> dict:
-    """Fetches balances of all tracked ERC-20 tokens, skipping zero-value balances."""
+    """
+    Fetches balances of all tracked ERC-20 tokens, skipping zero-value balances.
+    Concurrent requests for the same wallet share a single RPC fan-out.
+    """
+    balances = await _balance_flight.do(
+        normalize_wallet(contract_address), _get_token_balances_dict, contract_address
+    )
+    return dict(balances)
+
+async def _get_token_balances_dict(contract_address: str) -> dict:
     contract_address = int(contract_address, 16)
 
     # Fetch balances concurrently
@@ -32,7 +32,7 @@ BOT_USERNAME = os.getenv("BOT_USERNAME")
 
 
 # Initialize the chatbot
-RETRIEVER_PATH = "src/data/combined_retriever.pkl"
+RETRIEVER_PATH = "src/data/combined_index"
 # chatbot = create_chatbot(RETRIEVER_PATH, path_to_local_model)
 chatbot = create_chatbot(RETRIEVER_PATH)
 
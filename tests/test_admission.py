@@ -0,0 +1,78 @@
+import asyncio
+import time
+import pytest
+from src import admission
+from src.admission import AdmissionController, Deadline, DeadlineExceeded, Overloaded, request_deadline
+
+
+def test_deadline_bounds_each_stage_by_the_remaining_budget():
+    async def run():
+        deadline = Deadline(0.1)
+        assert await deadline.run(asyncio.sleep(0, "fast"), "fast") == "fast"
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded) as exc:
+            await deadline.run(asyncio.sleep(10), "slow")
+        return exc.value.stage, time.monotonic() - start
+
+    stage, elapsed = asyncio.run(run())
+    assert stage == "slow"
+    assert elapsed < 0.5
+
+
+def test_spent_deadline_skips_the_stage():
+    async def run():
+        never = asyncio.sleep(10)
+        with pytest.raises(DeadlineExceeded):
+            await Deadline(1.0).run(never, "plan", reserve=2.0)
+        return never.cr_frame
+
+    # The coroutine is closed rather than left unawaited
+    assert asyncio.run(run()) is None
+
+
+def test_request_deadline_only_lowers_the_budget(monkeypatch):
+    monkeypatch.setattr(admission, "REQUEST_DEADLINE_SECONDS", 10.0)
+    assert request_deadline({"timeout_ms": 2500}).budget == 2.5
+    assert request_deadline({"timeout_ms": 60000}).budget == 10.0
+    assert request_deadline({}).budget == 10.0
+    assert request_deadline(None).budget == 10.0
+
+
+def test_requests_beyond_the_queue_are_rejected_with_retry_after():
+    controller = AdmissionController(max_inflight=1, max_queue=1)
+    release = None
+
+    async def hold():
+        async with controller.slot():
+            await release.wait()
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        held = asyncio.ensure_future(hold())
+        queued = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        assert (controller.inflight, controller.waiting) == (1, 1)
+        with pytest.raises(Overloaded) as exc:
+            async with controller.slot():
+                pass
+        release.set()
+        await asyncio.gather(held, queued)
+        return exc.value.retry_after
+
+    assert asyncio.run(run()) >= 1
+    assert (controller.inflight, controller.waiting) == (0, 0)
+
+
+def test_waiting_for_a_slot_counts_against_the_deadline():
+    controller = AdmissionController(max_inflight=1, max_queue=1)
+
+    async def run():
+        async with controller.slot():
+            with pytest.raises(DeadlineExceeded) as exc:
+                async with controller.slot(Deadline(0.05)):
+                    pass
+        return exc.value.stage
+
+    assert asyncio.run(run()) == "admission"
+    assert controller.waiting == 0
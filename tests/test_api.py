@@ -0,0 +1,123 @@
+import json
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("flask")
+pytest.importorskip("pandas")
+pytest.importorskip("starknet_py")
+pytest.importorskip("langchain_community")
+pytest.importorskip("ollama")
+
+from fastapi.testclient import TestClient
+import app as flask_app
+import asgi_app
+from src import metrics
+from src import pipeline as pipeline_module
+
+
+@pytest.fixture(autouse=True)
+def pipeline(monkeypatch):
+    """Both servers call the same pipeline coroutine; record what it receives."""
+    received = []
+
+    async def handle_investment_plan(data):
+        received.append(data)
+        if not data:
+            return {"error": "Missing JSON body"}, 400, {}
+        if data["chat_id"] == "busy":
+            return {"error": "Server is busy, please retry later."}, 429, {"Retry-After": "3"}
+        return {"echo": data["chat_id"]}, 200, {}
+
+    async def stream_batch_plans(wallets, concurrency):
+        for index, item in enumerate(wallets):
+            yield json.dumps({"index": index, "wallet": item["wallet"], "concurrency": concurrency}) + "\n"
+
+    for server in (flask_app, asgi_app):
+        monkeypatch.setattr(server, "handle_investment_plan", handle_investment_plan)
+        monkeypatch.setattr(server, "stream_batch_plans", stream_batch_plans)
+    return received
+
+
+class Client:
+    """Drives the Flask or the ASGI app through its test client with one interface."""
+
+    def __init__(self, server):
+        self.server = server
+        self.client = flask_app.app.test_client() if server == "flask" else TestClient(asgi_app.app)
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.text
+
+    def post(self, path, payload):
+        """Posts `payload` (bytes are sent as-is) and returns (status, headers, text)."""
+        raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        kwargs = {"data" if self.server == "flask" else "content": raw}
+        response = self.client.post(path, headers={"Content-Type": "application/json"}, **kwargs)
+        return response.status_code, response.headers, response.text
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def client(request):
+    return Client(request.param)
+
+
+def test_status(client):
+    assert client.get("/status") == (200, "Investment Plan API is running!")
+
+
+def test_investment_plan_contract(client, pipeline):
+    status, _, text = client.post("/investment-plan", {"chat_id": "c1", "messages": []})
+    assert status == 200
+    assert json.loads(text) == {"echo": "c1"}
+    assert pipeline == [{"chat_id": "c1", "messages": []}]
+
+
+def test_overloaded_response_carries_retry_after(client):
+    status, headers, _ = client.post("/investment-plan", {"chat_id": "busy", "messages": []})
+    assert status == 429
+    assert headers["Retry-After"] == "3"
+
+
+def test_invalid_json_reaches_the_pipeline_as_none(client, pipeline):
+    status, _, _ = client.post("/investment-plan", b"not json")
+    assert status == 400
+    assert pipeline == [None]
+
+
+def test_batch_endpoint_streams_ndjson(client, monkeypatch):
+    monkeypatch.setattr(pipeline_module, "BATCH_CONCURRENCY", 4)
+    status, headers, text = client.post("/investment-plan/batch", {"wallets": [{"wallet": "0x1"}, {"wallet": "0x2"}]})
+    assert status == 200
+    assert headers["Content-Type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in text.splitlines()] == [
+        {"index": 0, "wallet": "0x1", "concurrency": 4},
+        {"index": 1, "wallet": "0x2", "concurrency": 4},
+    ]
+
+
+def test_invalid_batch_gets_400(client):
+    status, _, text = client.post("/investment-plan/batch", {"wallets": []})
+    assert status == 400
+    assert json.loads(text) == {"error": "Missing wallets"}
+
+
+def test_asgi_stream_endpoint_serves_server_sent_events(monkeypatch):
+    async def stream_investment_plan(data):
+        yield f"event: category\ndata: {json.dumps({'chat_id': data['chat_id']})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    monkeypatch.setattr(asgi_app, "stream_investment_plan", stream_investment_plan)
+    status, headers, text = Client("asgi").post("/investment-plan/stream", {"chat_id": "c1", "messages": []})
+    assert status == 200
+    assert headers["content-type"].startswith("text/event-stream")
+    assert headers["cache-control"] == "no-cache"
+    assert text == 'event: category\ndata: {"chat_id": "c1"}\n\nevent: done\ndata: {}\n\n'
+
+
+def test_metrics_endpoint(client):
+    metrics.observe("test_api", 0.5)
+    response = client.client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == metrics.PROMETHEUS_CONTENT_TYPE
+    assert 'tyrion_stage_latency_seconds_count{stage="test_api"}' in response.text
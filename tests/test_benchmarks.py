@@ -0,0 +1,68 @@
+import json
+import urllib.request
+import pytest
+from benchmarks.fake_ollama import reply_for, start_fake_ollama
+from benchmarks.fake_starknet_rpc import start_fake_rpc
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read().decode("utf-8")
+
+
+@pytest.fixture
+def ollama():
+    server, url = start_fake_ollama(token_rate=0, answer_tokens=5)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+def test_fake_ollama_classifies_by_the_current_query(ollama):
+    prompt = "You classify user queries.\nPrevious chat: balance\nCurrent query:\nUser: what yield can I get?"
+    reply = json.loads(post(f"{ollama}/api/generate", {"model": "m", "prompt": prompt, "stream": False}))
+    assert reply["done"] is True
+    assert json.loads(reply["response"])["category"] == "investment_query"
+
+
+def test_fake_ollama_answers_the_combined_prompt_with_category_and_filters():
+    query_llm = pytest.importorskip("src.query_llm")
+    reply = json.loads(reply_for(query_llm.COMBINED_PROMPT.format(statement="User: invest my ETH"), 5))
+    assert reply["category"] == "investment_query"
+    assert reply["risk_profile"] == "Balanced"
+
+
+def test_fake_ollama_streams_chat_tokens_with_final_stats(ollama):
+    text = post(f"{ollama}/api/chat", {"model": "m", "messages": [{"role": "user", "content": "What is Starknet?"}]})
+    chunks = [json.loads(line) for line in text.splitlines()]
+    assert [c["done"] for c in chunks] == [False] * 5 + [True]
+    assert "".join(c["message"]["content"] for c in chunks) == "Starknet is a validity rollup"
+    assert chunks[-1]["eval_count"] == 5
+
+
+def test_fake_ollama_ignores_clients_that_reset_the_connection(capsys):
+    server, _ = start_fake_ollama(token_rate=0)
+    try:
+        try:
+            raise ConnectionResetError("client stopped reading")
+        except ConnectionResetError:
+            server.handle_error(None, ("127.0.0.1", 0))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert capsys.readouterr().err == ""
+
+
+def test_fake_rpc_answers_batched_balance_calls():
+    server, url = start_fake_rpc(latency=0, balance=7)
+    try:
+        replies = json.loads(post(url, [
+            {"jsonrpc": "2.0", "id": 1, "method": "starknet_call", "params": {}},
+            {"jsonrpc": "2.0", "id": 2, "method": "starknet_unknown", "params": {}},
+        ]))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert replies[0] == {"jsonrpc": "2.0", "id": 1, "result": ["0x7", "0x0"]}
+    assert replies[1]["error"]["code"] == -32601
@@ -0,0 +1,57 @@
+import gzip
+import json
+import time
+from src import chat_log
+from src.chat_log import ChatLogWriter
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_written_as_json_lines(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    writer = ChatLogWriter(str(path), flush_interval=60)
+    writer.log("c1", [{"role": "user", "content": "héllo"}, {"content": "no role"}])
+    writer.close()
+    [record] = read_lines(path)
+    assert record["chat_id"] == "c1"
+    assert record["messages"] == [{"role": "user", "content": "héllo"}, {"role": "unknown", "content": "no role"}]
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_interval(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    writer = ChatLogWriter(str(path), max_batch=2, flush_interval=60)
+    writer.log("c1", [])
+    writer.log("c2", [])
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [record["chat_id"] for record in read_lines(path)] == ["c1", "c2"]
+    writer.close()
+
+
+def test_large_files_rotate_to_compressed_segments(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    writer = ChatLogWriter(str(path), max_batch=1, flush_interval=60, max_bytes=1, backup_count=2)
+    for i in range(4):
+        writer.log(f"c{i}", [])
+        # Distinct segment timestamps
+        time.sleep(0.01)
+    writer.close()
+    segments = sorted(tmp_path.glob("chat.jsonl.*.gz"))
+    assert len(segments) == 2
+    assert not path.exists()
+    with gzip.open(segments[-1], "rt", encoding="utf-8") as f:
+        assert json.loads(f.read())["chat_id"] == "c3"
+
+
+def test_records_are_dropped_when_the_queue_is_full(tmp_path, monkeypatch):
+    counted = []
+    monkeypatch.setattr(chat_log.metrics, "inc", lambda name, value=1, **labels: counted.append(name))
+    writer = ChatLogWriter(str(tmp_path / "chat.jsonl"), queue_size=1)
+    writer.close()
+    writer.log("kept", [])
+    writer.log("dropped", [])
+    assert counted == ["chat_log_dropped_total"]
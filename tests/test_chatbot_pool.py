@@ -0,0 +1,97 @@
+import os
+import time
+import threading
+import pytest
+
+pytest.importorskip("langchain_community")
+pytest.importorskip("langchain_ollama")
+
+from src.chatbot_pool import ChatbotPool
+
+
+class Loader:
+    """Builds a numbered fake chain per call; `gate` can hold reloads back."""
+
+    def __init__(self):
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self.fail = False
+
+    def __call__(self, path):
+        self.gate.wait(5)
+        if self.fail:
+            raise RuntimeError("broken retriever")
+        self.calls += 1
+        return f"chain {self.calls}"
+
+
+def touch(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    # Make sure the stamp changes even on filesystems with coarse timestamps
+    stamp = time.time() + 10
+    os.utime(path, (stamp, stamp))
+
+
+def wait_for_swap(pool, path, current):
+    deadline = time.monotonic() + 5
+    while pool.get(path) == current and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return pool.get(path)
+
+
+def test_chain_is_built_once_and_shared(tmp_path):
+    path = str(tmp_path / "retriever.pkl")
+    touch(path, "v1")
+    loader = Loader()
+    pool = ChatbotPool(loader=loader, check_interval=60)
+    chains = [pool.get(path) for _ in range(5)]
+    assert chains == ["chain 1"] * 5
+    assert loader.calls == 1
+
+
+def test_changed_retriever_is_swapped_in_after_it_has_loaded(tmp_path):
+    path = str(tmp_path / "retriever.pkl")
+    touch(path, "v1")
+    loader = Loader()
+    pool = ChatbotPool(loader=loader, check_interval=0)
+    assert pool.get(path) == "chain 1"
+
+    loader.gate.clear()
+    touch(path, "v2")
+    # The reload is blocked, so requests keep getting the current chain
+    assert pool.get(path) == "chain 1"
+    assert pool.get(path) == "chain 1"
+    loader.gate.set()
+    assert wait_for_swap(pool, path, "chain 1") != "chain 1"
+
+
+def test_failed_reload_keeps_the_current_chain(tmp_path):
+    path = str(tmp_path / "retriever.pkl")
+    touch(path, "v1")
+    loader = Loader()
+    pool = ChatbotPool(loader=loader, check_interval=0)
+    assert pool.get(path) == "chain 1"
+
+    loader.fail = True
+    touch(path, "v2")
+    pool.get(path)
+    time.sleep(0.2)
+    assert pool.get(path) == "chain 1"
+
+
+def test_index_directory_reloads_when_its_manifest_is_replaced(tmp_path):
+    directory = tmp_path / "index"
+    directory.mkdir()
+    manifest = str(directory / "manifest.json")
+    touch(manifest, "{}")
+    loader = Loader()
+    pool = ChatbotPool(loader=loader, check_interval=0)
+    assert pool.get(str(directory)) == "chain 1"
+
+    # New data files alone are not a new version until the manifest points at them
+    touch(str(directory / "index-2.faiss"), "v2")
+    assert pool.get(str(directory)) == "chain 1"
+    touch(manifest, '{"version": 2}')
+    assert wait_for_swap(pool, str(directory), "chain 1") == "chain 2"
@@ -0,0 +1,54 @@
+import re
+import zlib
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+pytest.importorskip("joblib")
+
+from src import classify_query
+
+
+class BagOfWordsEncoder:
+    """Stands in for the sentence transformer: hashed, normalized word counts."""
+
+    def encode(self, texts, normalize_embeddings=True):
+        vectors = np.zeros((len(texts), 256), dtype=np.float32)
+        for row, text in zip(vectors, texts):
+            for word in re.findall(r"\w+", text.lower()):
+                row[zlib.crc32(word.encode("utf-8")) % 256] += 1.0
+            row /= np.linalg.norm(row) or 1.0
+        return vectors
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    monkeypatch.setitem(classify_query._encoders, "fake-encoder", BagOfWordsEncoder())
+    monkeypatch.setattr(classify_query, "_router", None)
+    monkeypatch.setattr(classify_query, "_router_mtime", None)
+
+
+def test_missing_router_falls_through(tmp_path):
+    assert classify_query.route("How much ETH do I own?", str(tmp_path / "missing.joblib")) == (None, 0.0)
+
+
+def test_trained_router_is_saved_and_routes(tmp_path, encoder):
+    path = str(tmp_path / "router.joblib")
+    classify_query.train(path=path, model_name="fake-encoder")
+    category, probability = classify_query.route("How much ETH do I own?", path)
+    assert category == "balance_query"
+    assert 0.0 < probability <= 1.0
+    assert classify_query.route("What should I invest in right now?", path)[0] == "investment_query"
+
+
+def test_router_reloads_when_the_file_changes(tmp_path, encoder):
+    path = str(tmp_path / "router.joblib")
+    classify_query.train(path=path, model_name="fake-encoder")
+    first = classify_query.load_router(path)
+    assert classify_query.load_router(path) is first
+    classify_query.train(path=path, model_name="fake-encoder")
+    assert classify_query.load_router(path) is not first
+
+
+def test_addresses_are_dropped_before_embedding():
+    assert classify_query._prepare(f"Balance of  0x{'ab' * 32} please") == "Balance of please"
@@ -0,0 +1,88 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from src import conversation_store
+from src.conversation_store import MemoryConversationStore, SQLiteConversationStore, create_conversation_store
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(conversation_store, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemoryConversationStore(**kwargs)
+        kwargs.pop("max_bytes", None)
+        return SQLiteConversationStore(str(tmp_path / "chats.db"), purge_interval=0, **kwargs)
+    return make
+
+
+def test_keeps_the_last_messages_per_chat(make_store, clock):
+    store = make_store()
+    for i in range(5):
+        store.append("a", [user(f"a{i}")], max_history=3)
+    assert store.append("b", [user("b0")], max_history=3) == [user("b0")]
+    assert store.get("a") == [user("a2"), user("a3"), user("a4")]
+    assert store.get("unknown") == []
+
+
+def test_idle_chats_expire(make_store, clock):
+    store = make_store(ttl=60)
+    store.append("a", [user("old")], max_history=3)
+    clock.now += 61
+    assert store.get("a") == []
+    assert store.append("a", [user("new")], max_history=3) == [user("new")]
+
+
+def test_least_recently_used_chats_are_evicted(make_store, clock):
+    store = make_store(max_chats=2)
+    for chat_id in ("a", "b"):
+        clock.now += 1
+        store.append(chat_id, [user(chat_id)], max_history=3)
+    clock.now += 1
+    store.append("a", [user("a again")], max_history=3)
+    clock.now += 1
+    store.append("c", [user("c")], max_history=3)
+    assert len(store) == 2
+    assert store.get("b") == []
+    assert store.get("a") == [user("a"), user("a again")]
+
+
+def test_memory_cap_evicts_chats(clock):
+    store = MemoryConversationStore(max_bytes=1000)
+    for i in range(10):
+        store.append(str(i), [user("x" * 100)], max_history=3)
+    assert 0 < len(store) < 10
+    assert store.get("9") == [user("x" * 100)]
+
+
+def test_sqlite_store_does_not_lose_concurrent_appends(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "chats.db"))
+
+    def append(worker):
+        for i in range(10):
+            store.append("chat", [user(f"{worker}-{i}")], max_history=1000)
+
+    threads = [threading.Thread(target=append, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.get("chat")) == 40
+
+
+def test_store_is_chosen_by_spec(tmp_path):
+    assert isinstance(create_conversation_store("memory"), MemoryConversationStore)
+    store = create_conversation_store(f"sqlite:///{tmp_path}/nested/chats.db")
+    assert isinstance(store, SQLiteConversationStore)
+    with pytest.raises(ValueError, match="Unknown CONVERSATION_STORE"):
+        create_conversation_store("redis://localhost")
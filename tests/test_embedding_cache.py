@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from src import embedding_cache
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+def last_used(cache):
+    conn = cache._connection()
+    return dict(conn.execute("SELECT text_hash, last_used FROM embeddings").fetchall())
+
+
+def test_hits_misses_and_kinds_are_kept_apart(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=100)
+    cache.put_many("model", True, "document", ["a"], [[1.0, 2.0]])
+    hit, miss = cache.get_many("model", True, "document", ["a", "b"])
+    assert hit.tolist() == [1.0, 2.0] and miss is None
+    assert cache.get_many("model", True, "query", ["a"]) == [None]
+    assert cache.get_many("model", False, "document", ["a"]) == [None]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def fake_clock(monkeypatch):
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(embedding_cache, "time", SimpleNamespace(time=lambda: next(clock)))
+
+
+def test_hits_do_not_write_until_the_next_insert(tmp_path, monkeypatch):
+    fake_clock(monkeypatch)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=100)
+    cache.put_many("model", True, "query", ["a"], [[1.0]])
+    before = last_used(cache)
+    cache.get_many("model", True, "query", ["a"])
+    assert last_used(cache) == before
+    cache.put_many("model", True, "query", ["b"], [[2.0]])
+    key = embedding_cache.text_hash("a")
+    assert last_used(cache)[key] > before[key]
+
+
+def test_full_buffer_is_flushed_on_lookup(tmp_path, monkeypatch):
+    fake_clock(monkeypatch)
+    monkeypatch.setattr(embedding_cache, "TOUCH_BUFFER", 1)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=100)
+    cache.put_many("model", True, "query", ["a"], [[1.0]])
+    before = last_used(cache)
+    cache.get_many("model", True, "query", ["a"])
+    assert last_used(cache) != before
+    assert cache._touched == {}
+
+
+def test_eviction_drops_least_recently_used(tmp_path, monkeypatch):
+    fake_clock(monkeypatch)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    texts = [f"text {i}" for i in range(10)]
+    for text in texts:
+        cache.put_many("model", True, "document", [text], [[0.0]])
+    # Using the oldest entry makes the second one the least recently used
+    cache.get_many("model", True, "document", [texts[0]])
+    cache.put_many("model", True, "document", ["new"], [[0.0]])
+    remaining = set(last_used(cache))
+    assert len(remaining) == int(10 * embedding_cache.EVICT_TO)
+    assert embedding_cache.text_hash(texts[0]) in remaining
+    assert embedding_cache.text_hash(texts[1]) not in remaining
+    assert embedding_cache.text_hash("new") in remaining
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [-float(len(text))]
+
+
+def test_cached_embeddings_only_embed_missing_texts(tmp_path):
+    model = CountingEmbeddings()
+    cached = CachedEmbeddings(model, "model", cache=EmbeddingCache(str(tmp_path / "cache.sqlite")))
+    assert cached.embed_documents(["ab", "abc", "ab"]) == [[2.0], [3.0], [2.0]]
+    assert cached.embed_documents(["abc", "abcd"]) == [[3.0], [4.0]]
+    assert cached.embed_query("ab") == [-2.0]
+    assert cached.embed_query("ab") == [-2.0]
+    assert model.calls == [["ab", "abc"], ["abcd"], ["ab"]]
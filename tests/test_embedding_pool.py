@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_huggingface")
+
+from src import embedding_pool
+from src.embedding_cache import EmbeddingCache
+
+
+def test_core_groups_are_disjoint(monkeypatch):
+    monkeypatch.setattr(embedding_pool, "available_cores", lambda: list(range(8)))
+    assert embedding_pool.core_groups(3, threads_per_worker=2) == [[0, 1], [2, 3], [4, 5]]
+    # More workers than cores share cores round-robin
+    monkeypatch.setattr(embedding_pool, "available_cores", lambda: [0, 1])
+    assert embedding_pool.core_groups(3, threads_per_worker=2) == [[0], [1], [0]]
+
+
+class LengthEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_embed_stream_serves_cached_texts_and_embeds_the_rest_in_batches(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many("model", True, "document", ["bb"], [[2.0]])
+    model = LengthEmbeddings()
+    monkeypatch.setattr(embedding_pool, "get_cache", lambda: cache)
+    monkeypatch.setattr(embedding_pool, "get_embeddings", lambda *args: SimpleNamespace(embeddings=model))
+
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    vectors = {}
+    for positions, batch in embedding_pool.embed_stream(texts, "model", batch_size=2, workers=1):
+        vectors.update(zip(positions.tolist(), batch[:, 0].tolist()))
+    assert vectors == {i: float(len(text)) for i, text in enumerate(texts)}
+    assert model.batches == [["a", "ccc"], ["dddd", "eeeee"]]
+    # Fresh batches were written back to the cache
+    assert all(v is not None for v in cache.get_many("model", True, "document", texts))
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("ollama")
+pytest.importorskip("langchain_ollama")
+
+from src import extract_filters, llm_client
+
+
+def test_classify_risk_returns_only_the_filter_object(monkeypatch):
+    async def ainvoke_json(model, prompt, **kwargs):
+        assert prompt.endswith("User statement: Put my ETH somewhere safe")
+        return {"risk_profile": "Risk averse", "assets": ["ETH"]}
+
+    monkeypatch.setattr(llm_client, "ainvoke_json", ainvoke_json)
+    response = asyncio.run(extract_filters.aclassify_risk("Put my ETH somewhere safe", model_name="deepseek-r1"))
+    assert json.loads(response) == {"risk_profile": "Risk averse", "assets": ["ETH"]}
+
+
+def test_classify_risk_without_a_model_runs_the_cascade(monkeypatch):
+    models = []
+
+    async def ainvoke_json(model, prompt, **kwargs):
+        models.append(model)
+        return {"risk_profile": "aggressive"}
+
+    monkeypatch.setattr(llm_client, "ainvoke_json", ainvoke_json)
+    monkeypatch.setattr(extract_filters._cascade, "models", ["small", "large"])
+    response = json.loads(asyncio.run(extract_filters.aclassify_risk("Go all in")))
+    assert response["risk_profile"] == "Aggressive"
+    # Two agreeing samples from the small model settle it
+    assert models == ["small", "small"]
+
+
+def test_validate_filters_normalises_answers_for_comparison():
+    answer = {"risk_profile": "balanced", "protocols": ["Vesu ", "endur"], "assets": ["strk"], "apy": 4}
+    assert extract_filters.validate_filters(answer) == {
+        "risk_profile": "Balanced", "risk_levels": [], "is_audited": False,
+        "protocols": ["endur", "vesu"], "min_tvl": 0, "apy": 4, "assets": ["STRK"],
+    }
+
+
+@pytest.mark.parametrize("answer", [
+    ["Balanced"],
+    {"risk_profile": "reckless"},
+    {"risk_profile": "Balanced", "risk_levels": ["low"]},
+    {"risk_levels": ["extreme"]},
+    {"protocols": "vesu"},
+    {"min_tvl": -1},
+    {"is_audited": "yes"},
+])
+def test_validate_filters_rejects_answers_outside_the_schema(answer):
+    with pytest.raises(ValueError):
+        extract_filters.validate_filters(answer)
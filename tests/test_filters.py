@@ -0,0 +1,79 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("starknet_py")
+
+from src import filters
+from src.filters import FILTER_MIN_CONFIDENCE, extract_filters
+
+
+@pytest.fixture(autouse=True)
+def apy_snapshot(monkeypatch):
+    snapshot = pd.DataFrame({"protocol": ["vesu", "endur", "strkfarm", "nostra", "ekubo"]})
+    monkeypatch.setattr(filters, "load_apy_snapshot", lambda: ("test-snapshot", snapshot))
+    monkeypatch.setattr(filters, "_protocols", (None, None))
+
+
+def query(text, previous=""):
+    return f"Previous chat:\n{previous}\n\nCurrent query:\nUser: {text}"
+
+
+def test_plain_preferences_are_confident():
+    result = extract_filters(query("Show me low risk pools on vesu with APY above 5%"))
+    assert result["risk_levels"] == ["low"]
+    assert result["protocols"] == ["vesu"]
+    assert result["apy"] == 5
+    assert result["confidence"] >= FILTER_MIN_CONFIDENCE
+
+
+def test_audited_tvl_and_assets():
+    result = extract_filters(query("Only audited protocols with TVL over $2m for my USDC and ETH assets"))
+    assert result["is_audited"] is True
+    assert result["min_tvl"] == 2_000_000
+    assert result["assets"] == ["ETH", "USDC"]
+    assert result["confidence"] >= FILTER_MIN_CONFIDENCE
+
+
+def test_risk_profile():
+    result = extract_filters(query("I want to invest aggressively"))
+    assert result["risk_profile"] == "Aggressive"
+    assert result["confidence"] >= FILTER_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text", [
+    "Anything but vesu",
+    "skip vesu, use endur",
+    "stay away from strkfarm",
+    "anything but aggressive",
+    "Invest my STRK tokens, apart from nostra",
+    "Besides ekubo, what pools are there?",
+    "avoid high risk pools",
+    "Any protocol except endur",
+    "I don't want vesu",
+    "no ETH assets please",
+])
+def test_exclusions_fall_through_to_the_llm(text):
+    assert extract_filters(query(text))["confidence"] < FILTER_MIN_CONFIDENCE
+
+
+def test_exclusion_cue_in_an_earlier_sentence_does_not_count():
+    result = extract_filters(query("Skip the intro. Show me vesu"))
+    assert result["protocols"] == ["vesu"]
+    assert result["confidence"] >= FILTER_MIN_CONFIDENCE
+
+
+def test_unaudited_is_not_audited():
+    result = extract_filters(query("I am fine with unaudited protocols"))
+    assert result["is_audited"] is False
+    assert result["confidence"] < FILTER_MIN_CONFIDENCE
+
+
+def test_tokens_not_called_assets_are_dropped():
+    result = extract_filters(query("What should I do with STRK?"))
+    assert result["assets"] == []
+    assert result["confidence"] < FILTER_MIN_CONFIDENCE
+
+
+def test_preferences_in_previous_chat_lower_confidence():
+    result = extract_filters(query("Show me pools on vesu", previous="User: I only want low risk pools"))
+    assert result["confidence"] < FILTER_MIN_CONFIDENCE
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("ollama")
+pytest.importorskip("langchain_ollama")
+
+from src import llm_accounting, llm_client
+
+STATS = {
+    "prompt_eval_count": 12,
+    "eval_count": 40,
+    "load_duration": 500_000_000,
+    "prompt_eval_duration": 250_000_000,
+    "eval_duration": 2_000_000_000,
+    "total_duration": 2_800_000_000,
+}
+
+
+@pytest.fixture
+def records(monkeypatch):
+    records = []
+    monkeypatch.setattr(llm_accounting, "_sinks", [records.append])
+    return records
+
+
+def test_record_is_built_from_ollama_stats():
+    record = llm_accounting.build_record("mistral", STATS, started=0.0, caller="test")
+    assert (record["model"], record["caller"]) == ("mistral", "test")
+    assert (record["prompt_tokens"], record["output_tokens"]) == (12, 40)
+    assert record["load_seconds"] == 0.5
+    # Without a client-side first token time, TTFT is model load plus prompt evaluation
+    assert record["ttft_seconds"] == 0.75
+    assert record["tokens_per_second"] == 20.0
+    assert record["stopped_early"] is False
+
+
+class FakeClient:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def generate(self, stream=False, **request):
+        def chunks():
+            for text in self.texts:
+                yield SimpleNamespace(response=text, done=False)
+            yield SimpleNamespace(response="", done=True, **STATS)
+        return chunks()
+
+
+def test_full_stream_records_the_final_stats(monkeypatch, records):
+    monkeypatch.setattr(llm_client, "_sync_client", FakeClient(["a", "b"]))
+    assert [chunk.response for chunk in llm_client.stream("mistral", "hi", caller="test")] == ["a", "b", ""]
+    [record] = records
+    assert (record["caller"], record["output_tokens"], record["stopped_early"]) == ("test", 40, False)
+    assert record["ttft_seconds"] is not None
+
+
+def test_stream_closed_early_is_recorded_as_stopped(monkeypatch, records):
+    monkeypatch.setattr(llm_client, "_sync_client", FakeClient(["a", "b", "c"]))
+    chunks = llm_client.stream("mistral", "hi")
+    next(chunks)
+    next(chunks)
+    chunks.close()
+    [record] = records
+    assert record["stopped_early"] is True
+    # Ollama never sent its counters, so the streamed chunks stand in for output tokens
+    assert (record["prompt_tokens"], record["output_tokens"]) == (None, 2)
+
+
+def test_failing_sink_does_not_break_the_call(monkeypatch, records):
+    def broken(record):
+        raise RuntimeError("sink down")
+
+    monkeypatch.setattr(llm_accounting, "_sinks", [broken, records.append])
+    llm_accounting.record({"model": "mistral"})
+    assert records == [{"model": "mistral"}]
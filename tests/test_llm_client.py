@@ -0,0 +1,250 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("ollama")
+pytest.importorskip("langchain_ollama")
+
+from src import llm_client
+
+
+def test_model_slot_bounds_concurrent_calls(monkeypatch):
+    monkeypatch.setattr(llm_client, "_sync_slots", {})
+    monkeypatch.setitem(llm_client.MODEL_CONCURRENCY, "mistral", 1)
+    acquired = threading.Event()
+
+    def second_call():
+        with llm_client.model_slot("mistral"):
+            acquired.set()
+
+    with llm_client.model_slot("mistral"):
+        thread = threading.Thread(target=second_call)
+        thread.start()
+        assert not acquired.wait(0.2)
+    thread.join(1)
+    assert acquired.is_set()
+
+
+def test_model_concurrency_is_case_insensitive(monkeypatch):
+    monkeypatch.setitem(llm_client.MODEL_CONCURRENCY, "mistral", 2)
+    assert llm_client.model_concurrency("Mistral") == 2
+    assert llm_client.model_concurrency("mistral") == 2
+
+
+def test_sync_slots_share_one_semaphore_across_name_casing(monkeypatch):
+    monkeypatch.setattr(llm_client, "_sync_slots", {})
+    monkeypatch.setitem(llm_client.MODEL_CONCURRENCY, "mistral", 1)
+    acquired = threading.Event()
+
+    def try_other_casing():
+        with llm_client.model_slot("mistral"):
+            acquired.set()
+
+    with llm_client.model_slot("Mistral"):
+        thread = threading.Thread(target=try_other_casing)
+        thread.start()
+        # The only slot is held, so the lower-case name must wait for it
+        assert not acquired.wait(0.2)
+    thread.join(1)
+    assert acquired.is_set()
+    assert list(llm_client._sync_slots) == ["mistral"]
+
+
+def test_async_slots_share_one_semaphore_across_name_casing(monkeypatch):
+    monkeypatch.setitem(llm_client.MODEL_CONCURRENCY, "mistral", 1)
+
+    async def run():
+        async with llm_client.amodel_slot("Mistral"):
+            other = asyncio.ensure_future(llm_client.amodel_slot("mistral").__aenter__())
+            await asyncio.sleep(0.05)
+            blocked = not other.done()
+        await other
+        slots = llm_client._async_slots[asyncio.get_running_loop()]
+        return blocked, list(slots)
+
+    blocked, keys = asyncio.run(run())
+    assert blocked
+    assert keys == ["mistral"]
+
+
+def test_calls_share_the_pooled_client(monkeypatch):
+    requests = []
+
+    class FakeClient:
+        def generate(self, **request):
+            requests.append(request)
+            return SimpleNamespace(response="ok")
+
+    monkeypatch.setattr(llm_client, "_sync_client", FakeClient())
+    assert llm_client.invoke("mistral", "hi", temperature=0, system="be brief") == "ok"
+    assert llm_client.invoke("mistral", "again") == "ok"
+    assert requests[0] == {
+        "model": "mistral",
+        "prompt": "hi",
+        "format": "",
+        "options": {"temperature": 0},
+        "keep_alive": llm_client.OLLAMA_KEEP_ALIVE,
+        "system": "be brief",
+    }
+    assert "system" not in requests[1]
+
+
+def test_async_clients_are_kept_per_event_loop():
+    async def client():
+        first = llm_client.get_async_client()
+        assert llm_client.get_async_client() is first
+        return first
+
+    assert asyncio.run(client()) != asyncio.run(client())
+
+
+def test_langchain_llm_is_built_once_per_configuration():
+    llm = llm_client.get_langchain_llm("mistral", temperature=0.3)
+    assert llm_client.get_langchain_llm("mistral", temperature=0.3) is llm
+    assert llm_client.get_langchain_llm("mistral", temperature=0.5) is not llm
+    assert llm.base_url == llm_client.OLLAMA_BASE_URL
+
+
+def feed_all(parser, chunks):
+    for chunk in chunks:
+        result = parser.feed(chunk)
+        if result is not None:
+            return result
+    return None
+
+
+def test_json_parser_skips_reasoning_and_returns_at_the_closing_brace():
+    parser = llm_client.JsonStreamParser()
+    chunks = ["<thi", "nk>", "maybe {", "not this}", "</th", "ink>", 'Sure: {"a": ', '"}{", "b": {"c": 1}', "}", " trailing"]
+    assert feed_all(parser, chunks) == {"a": "}{", "b": {"c": 1}}
+    assert parser.reasoning_tokens == 4
+
+
+def test_json_parser_moves_past_braces_that_are_not_json():
+    parser = llm_client.JsonStreamParser()
+    assert feed_all(parser, ["use {curly} then ", '{"ok": true}']) == {"ok": True}
+
+
+def fake_stream(monkeypatch, replies):
+    """Streams canned chunks per model; returns each call's model and how many chunks it sent."""
+    calls = []
+
+    def stream(model, prompt, **kwargs):
+        call = {"model": model, "sent": 0}
+        calls.append(call)
+        for text in replies[model]:
+            call["sent"] += 1
+            yield SimpleNamespace(response=text)
+
+    monkeypatch.setattr(llm_client, "stream", stream)
+    return calls
+
+
+def test_invoke_json_stops_the_generation_once_the_object_is_complete(monkeypatch):
+    calls = fake_stream(monkeypatch, {"deepseek-r1": ['{"risk": ', '"low"}', " and more", " and more"]})
+    assert llm_client.invoke_json("deepseek-r1", "prompt") == {"risk": "low"}
+    assert [(call["model"], call["sent"]) for call in calls] == [("deepseek-r1", 2)]
+
+
+def test_invoke_json_retries_on_the_fallback_model_past_the_reasoning_budget(monkeypatch):
+    calls = fake_stream(monkeypatch, {
+        "deepseek-r1": ["<think>"] + ["hmm"] * 10,
+        "mistral": ['{"risk": "high"}'],
+    })
+    assert llm_client.invoke_json("deepseek-r1", "prompt", reasoning_budget=3, fallback_model="mistral") == {"risk": "high"}
+    assert [call["model"] for call in calls] == ["deepseek-r1", "mistral"]
+    # The reasoning model was cut off at its budget
+    assert calls[0]["sent"] == 5
+
+
+def test_invoke_json_without_fallback_raises(monkeypatch):
+    fake_stream(monkeypatch, {"mistral": ["no object here"]})
+    with pytest.raises(ValueError, match="No JSON object"):
+        llm_client.invoke_json("mistral", "prompt", fallback_model=None)
+
+
+def _validate(answer):
+    if answer.get("risk") not in ("low", "high"):
+        raise ValueError("bad risk")
+    return answer["risk"]
+
+
+def _fake_invoke_json(monkeypatch, answers):
+    """Replaces invoke_json with canned answers per model; returns the recorded calls."""
+    calls = []
+    remaining = {model: list(values) for model, values in answers.items()}
+
+    def invoke_json(model, prompt, **kwargs):
+        calls.append((model, kwargs))
+        answer = remaining[model].pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(llm_client, "invoke_json", invoke_json)
+    return calls
+
+
+def test_cascade_resolves_on_consistent_cheap_tier(monkeypatch):
+    calls = _fake_invoke_json(monkeypatch, {"small": [{"risk": "low"}, {"risk": "low"}]})
+    cascade = llm_client.Cascade("test", ["small", "large"], _validate, samples=2)
+    assert cascade.invoke("prompt") == "low"
+    assert [model for model, _ in calls] == ["small", "small"]
+
+
+def test_cascade_escalates_on_inconsistent_or_invalid_answers(monkeypatch):
+    calls = _fake_invoke_json(monkeypatch, {
+        "small": [{"risk": "low"}, {"risk": "high"}],
+        "medium": [{"risk": "unknown"}, {"risk": "unknown"}],
+        "large": [{"risk": "high"}],
+    })
+    cascade = llm_client.Cascade("test", ["small", "medium", "large"], _validate, samples=2)
+    assert cascade.invoke("prompt") == "high"
+    assert [model for model, _ in calls][-1] == "large"
+
+
+def test_cascade_last_tier_never_falls_back_to_another_model(monkeypatch):
+    calls = _fake_invoke_json(monkeypatch, {
+        "mistral": [ValueError("no JSON"), ValueError("no JSON")],
+        "deepseek-r1": [{"risk": "low"}],
+    })
+    cascade = llm_client.Cascade("test", ["mistral", "deepseek-r1"], _validate, samples=2)
+    assert cascade.invoke("prompt", temperature=0) == "low"
+    for model, kwargs in calls:
+        assert kwargs["fallback_model"] is None
+        assert kwargs["caller"] == "test"
+    last_kwargs = calls[-1][1]
+    assert last_kwargs["reasoning_budget"] == 0
+    # Sampling temperature is for the cheap tiers only
+    assert last_kwargs["temperature"] == 0
+
+
+def test_cascade_raises_when_last_tier_fails(monkeypatch):
+    _fake_invoke_json(monkeypatch, {"small": [ValueError("x"), ValueError("x")], "large": [ValueError("bad")]})
+    cascade = llm_client.Cascade("test", ["small", "large"], _validate, samples=2)
+    with pytest.raises(ValueError, match="bad"):
+        cascade.invoke("prompt")
+
+
+def test_async_cascade_cancels_sibling_samples_before_escalating(monkeypatch):
+    events = []
+
+    async def ainvoke_json(model, prompt, **kwargs):
+        if model == "large":
+            events.append("large")
+            return {"risk": "high"}
+        if not events:
+            events.append("failed")
+            raise ValueError("no JSON")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+
+    monkeypatch.setattr(llm_client, "ainvoke_json", ainvoke_json)
+    cascade = llm_client.Cascade("test", ["small", "large"], _validate, samples=2)
+    assert asyncio.run(cascade.ainvoke("prompt")) == "high"
+    assert events == ["failed", "cancelled", "large"]
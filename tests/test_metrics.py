@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from src import metrics
+
+
+def test_quantiles_come_from_the_window_of_recent_samples():
+    stats = metrics.StageStats(window_size=100)
+    for ms in range(1000):
+        stats.observe(ms / 1000)
+    assert stats.count == 1000
+    assert stats.quantiles() == {0.5: 0.950, 0.95: 0.994, 0.99: 0.998}
+    assert metrics.StageStats().quantiles() == {0.5: 0.0, 0.95: 0.0, 0.99: 0.0}
+
+
+def test_timed_counts_exceptions_as_errors():
+    with metrics.timed("test_timed"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timed("test_timed"):
+            raise ValueError
+    stage = metrics.snapshot()["test_timed"]
+    assert (stage["count"], stage["errors"]) == (2, 1)
+
+
+def test_prometheus_rendering():
+    metrics.observe("test_render", 0.25)
+    metrics.inc("test_hits_total", cache="plan")
+    metrics.inc("test_hits_total", 2, cache="plan")
+    text = metrics.render_prometheus()
+    assert 'tyrion_stage_latency_seconds{stage="test_render",quantile="0.99"} 0.250000' in text
+    assert 'tyrion_stage_latency_seconds_count{stage="test_render"} 1' in text
+    assert 'tyrion_stage_errors_total{stage="test_render"} 0' in text
+    assert 'tyrion_test_hits_total{cache="plan"} 3' in text
+    assert text.count("# TYPE tyrion_test_hits_total counter") == 1
+
+
+def test_cancelled_stages_are_not_errors():
+    async def cancelled():
+        with metrics.timed("test_cancelled"):
+            await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.ensure_future(cancelled())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    stage = metrics.snapshot()["test_cancelled"]
+    assert (stage["count"], stage["errors"]) == (1, 0)
@@ -0,0 +1,501 @@
+import asyncio
+import json
+import time
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("starknet_py")
+pytest.importorskip("langchain_community")
+pytest.importorskip("ollama")
+
+from src import pipeline
+from src.admission import AdmissionController
+from src.conversation_store import MemoryConversationStore
+from src.semantic_cache import SemanticCache
+
+WALLET = "0x" + "ab" * 32
+# The fixture replaces it; plan caching tests use the real one
+build_investment_plan = pipeline.build_investment_plan
+
+
+def body(text, chat_id="chat", **extra):
+    return dict({"chat_id": chat_id, "messages": [{"role": "user", "content": text}]}, **extra)
+
+
+def classifier(category, delay=0.0):
+    async def aclassify_query(statement):
+        await asyncio.sleep(delay)
+        return json.dumps({"category": category, "response": ""})
+    return aclassify_query
+
+
+async def aanswer(chatbot, question, docs=None):
+    return f"answer to {question.splitlines()[-1]}"
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    """Replaces the model, RPC and disk dependencies of the pipeline with fast fakes."""
+    monkeypatch.setattr(pipeline, "conversation_store", MemoryConversationStore())
+    monkeypatch.setattr(pipeline, "admission", AdmissionController(max_inflight=2, max_queue=0))
+    monkeypatch.setattr(pipeline, "route", lambda text: (None, 0.0))
+    monkeypatch.setattr(pipeline.classification_cache, "lookup", lambda text: (None, None))
+    monkeypatch.setattr(pipeline, "COMBINED_EXTRACTION", False)
+    # Statements go to the LLM filter extraction unless a test makes the rules confident
+    monkeypatch.setattr(pipeline, "extract_rule_filters", lambda statement: {"confidence": 0.0})
+    monkeypatch.setattr(pipeline.chat_log, "log", lambda chat_id, history: None)
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("other_query"))
+    monkeypatch.setattr(pipeline, "get_chatbot", lambda path: object())
+    monkeypatch.setattr(pipeline, "aanswer", aanswer)
+
+    async def load_context(statement, deadline):
+        return None, []
+
+    async def get_token_balances_dict(address):
+        return {"ETH": 1.0, "USDC": 0.0}
+
+    async def aclassify_risk(statement, model_name=None):
+        return json.dumps({"risk_profile": "aggressive", "protocols": ["vesu"]})
+
+    monkeypatch.setattr(pipeline, "load_context", load_context)
+    monkeypatch.setattr(pipeline, "load_apy_snapshot", lambda: ("v1", None))
+    monkeypatch.setattr(pipeline, "get_token_balances_dict", get_token_balances_dict)
+    monkeypatch.setattr(pipeline, "aclassify_risk", aclassify_risk)
+    monkeypatch.setattr(pipeline, "build_investment_plan", lambda user_assets, filters, snapshot=None: [filters])
+    pipeline.filter_cache.clear()
+
+
+def run(data):
+    return asyncio.run(pipeline.handle_investment_plan(data))
+
+
+def run_timed(data):
+    """Like run, plus the seconds until the response (asyncio.run also waits for worker threads)."""
+    async def timed():
+        start = time.monotonic()
+        response = await pipeline.handle_investment_plan(data)
+        return response, time.monotonic() - start
+    return asyncio.run(timed())
+
+
+@pytest.mark.parametrize("data, message", [
+    (None, "Missing JSON body"),
+    ({"chat_id": "chat"}, "Missing chat_id or messages"),
+    ({"chat_id": "chat", "messages": [{"role": "assistant", "content": "hi"}]}, "No user message found"),
+])
+def test_invalid_requests_get_400(data, message):
+    result, status, _ = run(data)
+    assert status == 400
+    assert result == {"error": message}
+
+
+def test_balance_query(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("balance_query"))
+    result, status, _ = run(body(f"What is in {WALLET}?"))
+    assert status == 200
+    # Zero balances are left out
+    assert result == {"balances": [{"symbol": "ETH", "balance": 1.0, "usdValue": 1.0}]}
+
+
+def test_investment_query_uses_the_extracted_filters(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("investment_query"))
+    result, status, _ = run(body(f"Invest {WALLET} aggressively on vesu"))
+    assert status == 200
+    filters = result["investment_plan"][0]
+    assert filters["risk_profile"] == "Aggressive"
+    assert filters["protocols"] == ["vesu"]
+
+
+def test_repeated_investment_chats_reuse_the_extracted_filters(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("investment_query"))
+    statements = []
+
+    async def aclassify_risk(statement, model_name=None):
+        statements.append(statement)
+        return json.dumps({"risk_profile": "aggressive"})
+
+    monkeypatch.setattr(pipeline, "aclassify_risk", aclassify_risk)
+    for chat_id in ("a", "b"):
+        result, status, _ = run(body(f"Invest {WALLET} aggressively", chat_id=chat_id))
+        assert result["investment_plan"][0]["risk_profile"] == "Aggressive"
+    assert len(statements) == 1
+
+
+def test_plans_are_cached_per_apy_snapshot(monkeypatch):
+    version = ["v1"]
+    calls = []
+
+    def allocate_assets(user_assets, **filters):
+        calls.append(filters)
+        return None, [f"plan {len(calls)}"]
+
+    monkeypatch.setattr(pipeline, "plan_cache", pipeline.PlanCache())
+    monkeypatch.setattr(pipeline, "allocate_assets", allocate_assets)
+    monkeypatch.setattr(pipeline, "apy_snapshot_version", lambda: version[0])
+    filters = {"risk_profile": "Balanced"}
+    assert build_investment_plan({"ETH": 1.0}, filters) == ["plan 1"]
+    assert build_investment_plan({"ETH": 1.0}, filters) == ["plan 1"]
+    version[0] = "v2"
+    assert build_investment_plan({"ETH": 1.0}, filters) == ["plan 2"]
+
+
+def test_confident_rule_filters_skip_the_llm(monkeypatch):
+    async def aclassify_risk(statement, model_name=None):
+        raise AssertionError("the LLM must not be called")
+
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("investment_query"))
+    monkeypatch.setattr(pipeline, "aclassify_risk", aclassify_risk)
+    monkeypatch.setattr(pipeline, "extract_rule_filters",
+                        lambda statement: {"risk_profile": "Balanced", "protocols": ["ekubo"], "confidence": 1.0})
+    result, status, _ = run(body(f"Invest {WALLET} on ekubo"))
+    assert status == 200
+    assert result["investment_plan"][0]["protocols"] == ["ekubo"]
+
+
+def test_combined_extraction_replaces_both_llm_calls(monkeypatch):
+    async def aextract_query(statement):
+        return {"category": "investment_query", "risk_profile": "Risk averse", "protocols": ["endur"]}
+
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("the separate LLM calls must not run")
+
+    monkeypatch.setattr(pipeline, "COMBINED_EXTRACTION", True)
+    monkeypatch.setattr(pipeline, "aextract_query", aextract_query)
+    monkeypatch.setattr(pipeline, "aclassify_query", unexpected)
+    monkeypatch.setattr(pipeline, "aclassify_risk", unexpected)
+    result, status, _ = run(body(f"Invest {WALLET} safely on endur"))
+    assert status == 200
+    filters = result["investment_plan"][0]
+    assert (filters["risk_profile"], filters["protocols"]) == ("Risk averse", ["endur"])
+
+
+def test_unusable_combined_extraction_falls_back_to_the_classifier(monkeypatch):
+    async def aextract_query(statement):
+        raise ValueError("Unexpected model response format")
+
+    monkeypatch.setattr(pipeline, "COMBINED_EXTRACTION", True)
+    monkeypatch.setattr(pipeline, "aextract_query", aextract_query)
+    result, status, _ = run(body("What is Starknet?"))
+    assert result == "answer to User: What is Starknet?"
+
+
+def test_other_query_is_answered_by_the_chatbot():
+    result, status, _ = run(body("What is Starknet?"))
+    assert status == 200
+    assert result == "answer to User: What is Starknet?"
+
+
+def test_balances_are_fetched_while_the_query_is_classified(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("balance_query", delay=0.3))
+
+    async def get_token_balances_dict(address):
+        await asyncio.sleep(0.3)
+        return {"ETH": 1.0}
+
+    monkeypatch.setattr(pipeline, "get_token_balances_dict", get_token_balances_dict)
+    (result, status, _), elapsed = run_timed(body(f"What is in {WALLET}?"))
+    assert status == 200
+    assert elapsed < 0.5
+
+
+def test_requests_beyond_the_admission_queue_get_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("balance_query", delay=0.2))
+
+    async def burst():
+        return await asyncio.gather(*(
+            pipeline.handle_investment_plan(body(f"What is in {WALLET}?", chat_id=str(i))) for i in range(3)
+        ))
+
+    responses = asyncio.run(burst())
+    assert sorted(status for _, status, _ in responses) == [200, 200, 429]
+    rejected = [headers for _, status, headers in responses if status == 429]
+    assert int(rejected[0]["Retry-After"]) >= 1
+
+
+def test_slow_classifier_gets_504_within_the_deadline(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("other_query", delay=10))
+    (result, status, _), elapsed = run_timed(body("Hello", timeout_ms=100))
+    assert status == 504
+    assert elapsed < 1
+
+
+def test_slow_conversation_store_counts_against_the_deadline(monkeypatch):
+    def slow_append(chat_id, messages, max_history):
+        time.sleep(0.5)
+        return list(messages)
+
+    monkeypatch.setattr(pipeline.conversation_store, "append", slow_append)
+    (result, status, _), elapsed = run_timed(body("Hello", timeout_ms=100))
+    assert status == 504
+    assert elapsed < 0.4
+
+
+def test_slow_router_counts_against_the_deadline(monkeypatch):
+    def slow_route(text):
+        time.sleep(0.5)
+        return "other_query", 1.0
+
+    monkeypatch.setattr(pipeline, "route", slow_route)
+    (result, status, _), elapsed = run_timed(body("Hello", timeout_ms=100))
+    assert status == 504
+    assert elapsed < 0.4
+
+
+def test_slow_semantic_cache_counts_against_the_deadline(monkeypatch):
+    def slow_lookup(text):
+        time.sleep(0.5)
+        return None, None
+
+    monkeypatch.setattr(pipeline.classification_cache, "lookup", slow_lookup)
+    (result, status, _), elapsed = run_timed(body("Hello", timeout_ms=100))
+    assert status == 504
+    assert elapsed < 0.4
+
+
+def test_low_budget_degrades_filter_extraction_to_balanced(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("investment_query"))
+
+    async def aclassify_risk(statement, model_name=None):
+        raise AssertionError("the LLM must not be called without budget")
+
+    monkeypatch.setattr(pipeline, "aclassify_risk", aclassify_risk)
+    monkeypatch.setattr(pipeline, "FILTER_MIN_BUDGET", 60)
+    result, status, _ = run(body(f"Invest {WALLET} somewhere sensible"))
+    assert status == 200
+    assert result["investment_plan"][0]["risk_profile"] == "Balanced"
+
+
+def test_confident_router_skips_the_classifier(monkeypatch):
+    async def aclassify_query(statement):
+        raise AssertionError("the classifier LLM must not be called")
+
+    monkeypatch.setattr(pipeline, "aclassify_query", aclassify_query)
+    monkeypatch.setattr(pipeline, "route", lambda text: ("balance_query", 0.99))
+    result, status, _ = run(body(f"What is in {WALLET}?"))
+    assert status == 200 and "balances" in result
+
+
+def test_unsure_router_falls_through_to_the_classifier(monkeypatch):
+    monkeypatch.setattr(pipeline, "route", lambda text: ("balance_query", pipeline.ROUTER_MIN_CONFIDENCE / 2))
+    result, status, _ = run(body("What is Starknet?"))
+    assert result == "answer to User: What is Starknet?"
+
+
+def test_repeated_queries_reuse_the_cached_category(monkeypatch):
+    calls = []
+
+    async def aclassify_query(statement):
+        calls.append(statement)
+        category = "balance_query" if "0x" in statement else "other_query"
+        return json.dumps({"category": category, "response": ""})
+
+    def embed(text):
+        # Same text, same direction; anything else is orthogonal
+        return [1.0, 0.0] if text == "What is in <address>?" else [0.0, 1.0]
+
+    monkeypatch.setattr(pipeline, "aclassify_query", aclassify_query)
+    monkeypatch.setattr(pipeline, "classification_cache", SemanticCache(
+        "classification", embed, values=pipeline.SEMANTIC_CACHE_CATEGORIES
+    ))
+    other_wallet = "0x" + "cd" * 32
+    for chat_id, text in (("a", f"What is in {WALLET}?"), ("b", f"What is in {other_wallet}?")):
+        result, status, _ = run(body(text, chat_id=chat_id))
+        assert status == 200 and "balances" in result
+    assert len(calls) == 1
+
+    # other_query answers are never cached
+    for chat_id in ("c", "d"):
+        run(body("What is Starknet?", chat_id=chat_id))
+    assert len(calls) == 3
+
+
+def test_semantic_cache_can_be_turned_off(monkeypatch):
+    def lookup(text):
+        raise AssertionError("the semantic cache is off")
+
+    monkeypatch.setattr(pipeline, "SEMANTIC_CACHE", False)
+    monkeypatch.setattr(pipeline.classification_cache, "lookup", lookup)
+    result, status, _ = run(body("What is Starknet?"))
+    assert status == 200
+
+
+def test_follow_ups_skip_the_router_and_the_semantic_cache(monkeypatch):
+    calls = []
+
+    async def aclassify_query(statement):
+        calls.append(statement)
+        return json.dumps({"category": "other_query", "response": ""})
+
+    def lookup(text):
+        raise AssertionError("follow-ups must not use the semantic cache")
+
+    monkeypatch.setattr(pipeline, "aclassify_query", aclassify_query)
+    monkeypatch.setattr(pipeline, "route", lambda text: ("balance_query", 1.0))
+    result, status, _ = run(body(f"What is in {WALLET}?"))
+    assert status == 200 and "balances" in result and calls == []
+
+    monkeypatch.setattr(pipeline.classification_cache, "lookup", lookup)
+    result, status, _ = run(body("yes, do that"))
+    assert status == 200
+    # The classifier saw the earlier turn as well
+    assert len(calls) == 1 and WALLET in calls[0]
+
+
+def test_history_keeps_the_last_messages_per_chat():
+    for i in range(5):
+        run(body(f"message {i}"))
+    history = pipeline.update_history("chat", [{"role": "user", "content": "message 5"}])
+    assert [m["content"] for m in history] == ["message 3", "message 4", "message 5"]
+
+
+def parse_sse(text):
+    event, data = text.strip().split("\n")
+    assert event.startswith("event: ") and data.startswith("data: ")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+def stream(data):
+    async def collect():
+        return [event async for event in pipeline.stream_investment_plan(data)]
+    return [parse_sse(event) for event in asyncio.run(collect())]
+
+
+def test_stream_sends_chatbot_tokens_as_they_are_generated(monkeypatch):
+    async def astream_answer(chatbot, question, docs=None):
+        for token in ("Stark", "net", " is", " an L2"):
+            yield token
+
+    monkeypatch.setattr(pipeline, "astream_answer", astream_answer)
+    assert stream(body("What is Starknet?")) == [
+        ("category", {"category": "other_query"}),
+        ("token", {"token": "Stark"}),
+        ("token", {"token": "net"}),
+        ("token", {"token": " is"}),
+        ("token", {"token": " an L2"}),
+        ("done", {}),
+    ]
+
+
+def test_stream_sends_other_answers_as_one_result(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("balance_query"))
+    assert stream(body(f"What is in {WALLET}?")) == [
+        ("category", {"category": "balance_query"}),
+        ("result", {"balances": [{"symbol": "ETH", "balance": 1.0, "usdValue": 1.0}]}),
+        ("done", {}),
+    ]
+
+
+def test_stream_reports_failures_as_error_events(monkeypatch):
+    assert stream({"chat_id": "chat"}) == [
+        ("error", {"error": "Missing chat_id or messages", "status": 400}),
+        ("done", {}),
+    ]
+
+    async def astream_answer(chatbot, question, docs=None):
+        yield "partial"
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(pipeline, "astream_answer", astream_answer)
+    events = stream(body("What is Starknet?"))
+    assert events[-2:] == [("error", {"error": "An unexpected error occurred.", "status": 500}), ("done", {})]
+
+
+def test_stream_reports_an_exceeded_deadline(monkeypatch):
+    monkeypatch.setattr(pipeline, "aclassify_query", classifier("other_query", delay=10))
+    assert stream(body("Hello", timeout_ms=50)) == [
+        ("error", {"error": "The request took too long, please try again.", "status": 504}),
+        ("done", {}),
+    ]
+
+
+def test_slow_token_stream_is_cut_off_at_the_deadline(monkeypatch):
+    closed = []
+
+    async def astream_answer(chatbot, question, docs=None):
+        try:
+            yield "Stark"
+            await asyncio.sleep(10)
+            yield "net"
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(pipeline, "astream_answer", astream_answer)
+    start = time.monotonic()
+    events = stream(body("What is Starknet?", timeout_ms=200))
+    assert time.monotonic() - start < 2
+    assert ("token", {"token": "Stark"}) in events
+    assert events[-2:] == [
+        ("error", {"error": "The request took too long, please try again.", "status": 504}),
+        ("done", {}),
+    ]
+    assert closed == [True]
+
+
+def batch(wallets, concurrency=4):
+    async def collect():
+        return [json.loads(line) async for line in pipeline.stream_batch_plans(wallets, concurrency)]
+    return asyncio.run(collect())
+
+
+def test_batch_streams_one_line_per_wallet():
+    lines = batch([
+        {"wallet": WALLET, "filters": {"risk_profile": "aggressive", "protocols": ["vesu"]}},
+        {"filters": {}},
+        {"wallet": WALLET},
+    ])
+    by_index = {line["index"]: line for line in lines}
+    assert sorted(by_index) == [0, 1, 2]
+    assert by_index[0]["investment_plan"][0]["risk_profile"] == "Aggressive"
+    assert by_index[1] == {"index": 1, "wallet": None, "error": "Missing wallet"}
+    assert by_index[2]["investment_plan"][0]["risk_profile"] is None
+
+
+def test_batch_keeps_at_most_concurrency_wallets_in_flight(monkeypatch):
+    in_flight, peak = [0], [0]
+
+    async def get_token_balances_dict(address):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return {"ETH": 1.0}
+
+    monkeypatch.setattr(pipeline, "get_token_balances_dict", get_token_balances_dict)
+    lines = batch([{"wallet": WALLET}] * 10, concurrency=3)
+    assert len(lines) == 10 and not any("error" in line for line in lines)
+    assert peak[0] == 3
+
+
+def test_batch_failures_are_reported_per_wallet(monkeypatch):
+    async def get_token_balances_dict(address):
+        raise RuntimeError("rpc down")
+
+    monkeypatch.setattr(pipeline, "get_token_balances_dict", get_token_balances_dict)
+    assert batch([{"wallet": WALLET}]) == [
+        {"index": 0, "wallet": WALLET, "error": "An unexpected error occurred."},
+    ]
+
+
+@pytest.mark.parametrize("data, message", [
+    (None, "Missing JSON body"),
+    ([{"wallet": WALLET}], "Expected a JSON object"),
+    ("wallets", "Expected a JSON object"),
+    ({"wallets": []}, "Missing wallets"),
+    ({"wallets": [{"wallet": WALLET}] * 3}, "Too many wallets"),
+    ({"wallets": [{"wallet": WALLET}], "concurrency": "abc"}, "concurrency must be an integer"),
+    ({"wallets": [{"wallet": WALLET}], "concurrency": [4]}, "concurrency must be an integer"),
+    ({"wallets": [{"wallet": WALLET}], "concurrency": 2.5}, "concurrency must be an integer"),
+    ({"wallets": [{"wallet": WALLET}], "concurrency": True}, "concurrency must be an integer"),
+])
+def test_invalid_batch_requests_are_rejected(data, message, monkeypatch):
+    monkeypatch.setattr(pipeline, "BATCH_MAX_WALLETS", 2)
+    with pytest.raises(ValueError, match=message):
+        pipeline.parse_batch_request(data)
+
+
+def test_batch_concurrency_is_clamped(monkeypatch):
+    monkeypatch.setattr(pipeline, "BATCH_CONCURRENCY", 8)
+    wallets = [{"wallet": WALLET}]
+    assert pipeline.parse_batch_request({"wallets": wallets, "concurrency": 100}) == (wallets, 8)
+    assert pipeline.parse_batch_request({"wallets": wallets, "concurrency": -3}) == (wallets, 1)
+    assert pipeline.parse_batch_request({"wallets": wallets}) == (wallets, 8)
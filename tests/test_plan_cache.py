@@ -0,0 +1,46 @@
+import json
+import pytest
+from src.plan_cache import LRUCache, PlanCache, balances_fingerprint, normalize_filters
+
+
+def test_lru_cache_drops_the_least_recently_used_entry():
+    cache = LRUCache("test", max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_keys_ignore_ordering_and_case():
+    assert balances_fingerprint({"ETH": 1.0, "USDC": 2}) == balances_fingerprint({"USDC": 2.0, "ETH": 1})
+    assert balances_fingerprint({"ETH": 1.0}) != balances_fingerprint({"ETH": 1.5})
+    assert normalize_filters({"protocols": ["Vesu", "ekubo"], "risk_profile": "Balanced"}) == \
+        normalize_filters({"risk_profile": "balanced", "protocols": ["ekubo", "vesu"]})
+
+
+def test_new_apy_snapshot_version_drops_cached_plans():
+    cache = PlanCache()
+    balances, filters = {"ETH": 1.0}, {"risk_profile": "Balanced"}
+    cache.put(balances, filters, "v1", ["plan v1"])
+    assert cache.get(dict(balances), dict(filters), "v1") == ["plan v1"]
+    assert cache.get(balances, filters, "v2") is None
+    cache.put(balances, filters, "v2", ["plan v2"])
+    # Going back to an older version does not resurrect its plans either
+    assert cache.get(balances, filters, "v1") is None
+
+
+def test_apy_data_is_parsed_once_per_snapshot_version(tmp_path):
+    investment_model = pytest.importorskip("src.investment_model")
+    path = tmp_path / "apy.json"
+    path.write_text(json.dumps([{"pool": "a"}]))
+    (tmp_path / "apy.json.version").write_text("v1")
+    first = investment_model.load_apy_data(str(path))
+    assert investment_model.load_apy_data(str(path)) is first
+
+    path.write_text(json.dumps([{"pool": "a"}, {"pool": "b"}]))
+    assert investment_model.load_apy_data(str(path)) is first
+    (tmp_path / "apy.json.version").write_text("v2")
+    assert len(investment_model.load_apy_data(str(path))) == 2
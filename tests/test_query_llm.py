@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("ollama")
+pytest.importorskip("langchain_ollama")
+
+from src import llm_client, query_llm
+
+EXTRACTION = {
+    "category": "investment_query", "risk_profile": "Aggressive", "risk_levels": [], "is_audited": True,
+    "protocols": ["vesu"], "min_tvl": 0, "apy": 5, "assets": ["STRK"],
+}
+
+
+def test_combined_extraction_is_one_schema_constrained_call(monkeypatch):
+    calls = []
+
+    def invoke_json(model, prompt, **kwargs):
+        calls.append((model, prompt, kwargs))
+        return dict(EXTRACTION)
+
+    monkeypatch.setattr(llm_client, "invoke_json", invoke_json)
+    assert query_llm.extract_query("Invest my STRK on audited vesu pools", model_name="mistral") == EXTRACTION
+    [(model, prompt, kwargs)] = calls
+    assert model == "mistral"
+    assert prompt.endswith("Invest my STRK on audited vesu pools")
+    assert kwargs == {
+        "fallback_model": None, "format": query_llm.COMBINED_SCHEMA, "temperature": 0, "caller": "extract_query"
+    }
+
+
+@pytest.mark.parametrize("response", [{"category": "weather_query"}, ValueError("No JSON object in mistral output")])
+def test_unusable_extraction_raises(monkeypatch, response):
+    async def ainvoke_json(model, prompt, **kwargs):
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(llm_client, "ainvoke_json", ainvoke_json)
+    with pytest.raises(ValueError):
+        asyncio.run(query_llm.aextract_query("Invest my STRK"))
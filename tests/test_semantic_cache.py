@@ -0,0 +1,127 @@
+import time
+import threading
+import numpy as np
+from src.semantic_cache import SemanticCache
+
+VECTORS = {
+    "what is my balance": [1.0, 0.0, 0.0],
+    "show my wallet balance": [0.98, 0.2, 0.0],
+    "invest my STRK": [0.0, 1.0, 0.0],
+    "what is starknet": [0.0, 0.0, 1.0],
+    "half related": [0.7, 0.7, 0.0],
+}
+
+
+def make_cache(**kwargs):
+    return SemanticCache("test", lambda text: VECTORS[text], **kwargs)
+
+
+def store(cache, text, value):
+    _, vector = cache.lookup(text)
+    cache.put(vector, value)
+
+
+def test_similar_text_hits_and_unrelated_text_misses():
+    cache = make_cache(threshold=0.9)
+    store(cache, "what is my balance", "balance_query")
+    assert cache.lookup("show my wallet balance")[0] == "balance_query"
+    assert cache.lookup("invest my STRK")[0] is None
+
+
+def test_similarity_below_threshold_misses():
+    cache = make_cache(threshold=0.9)
+    store(cache, "what is my balance", "balance_query")
+    # cos = 0.707, under the threshold
+    assert cache.lookup("half related")[0] is None
+    looser = make_cache(threshold=0.7)
+    store(looser, "what is my balance", "balance_query")
+    assert looser.lookup("half related")[0] == "balance_query"
+
+
+def test_entries_expire_after_ttl():
+    cache = make_cache(ttl=0.05)
+    store(cache, "what is my balance", "balance_query")
+    assert cache.lookup("what is my balance")[0] == "balance_query"
+    time.sleep(0.1)
+    assert cache.lookup("what is my balance")[0] is None
+    assert len(cache) == 0
+
+
+def test_values_outside_the_allowed_set_are_not_stored():
+    cache = make_cache(values=("balance_query", "investment_query"))
+    store(cache, "what is starknet", "other_query")
+    store(cache, "invest my STRK", "investment_query")
+    assert cache.lookup("what is starknet")[0] is None
+    assert cache.lookup("invest my STRK")[0] == "investment_query"
+    assert len(cache) == 1
+
+
+def test_full_cache_replaces_least_recently_used_entry():
+    cache = make_cache(max_entries=2)
+    store(cache, "what is my balance", "balance")
+    store(cache, "invest my STRK", "invest")
+    # Touch the balance entry so the investment one is the least recently used
+    assert cache.lookup("what is my balance")[0] == "balance"
+    store(cache, "what is starknet", "other")
+    assert cache.lookup("invest my STRK")[0] is None
+    assert cache.lookup("what is my balance")[0] == "balance"
+    assert cache.lookup("what is starknet")[0] == "other"
+
+
+def test_embedding_failure_is_a_miss_without_vector():
+    def fail(text):
+        raise RuntimeError("model unavailable")
+
+    cache = SemanticCache("test", fail)
+    value, vector = cache.lookup("anything")
+    assert value is None and vector is None
+    cache.put(vector, "balance_query")
+    assert len(cache) == 0
+
+
+def test_lookup_returns_normalized_vector():
+    cache = SemanticCache("test", lambda text: [3.0, 4.0])
+    _, vector = cache.lookup("x")
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+
+
+def wait_until_loaded(cache):
+    deadline = time.monotonic() + 5
+    while cache.state == "loading" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_lookups_miss_without_embedding_until_loaded():
+    loaded = threading.Event()
+    embedded = []
+
+    def embed(text):
+        embedded.append(text)
+        return VECTORS[text]
+
+    cache = SemanticCache("test", embed, load=loaded.wait)
+    assert cache.lookup("what is my balance") == (None, None)
+    assert cache.state == "loading"
+    loaded.set()
+    wait_until_loaded(cache)
+    assert cache.state == "ready"
+    store(cache, "what is my balance", "balance_query")
+    assert cache.lookup("what is my balance")[0] == "balance_query"
+    # Only lookups made after the load reached the model
+    assert embedded == ["what is my balance", "what is my balance"]
+
+
+def test_failed_load_disables_the_cache_and_is_not_retried():
+    calls = []
+
+    def load():
+        calls.append(1)
+        raise OSError("model not available offline")
+
+    cache = SemanticCache("test", lambda text: VECTORS[text], load=load)
+    cache.lookup("what is my balance")
+    wait_until_loaded(cache)
+    assert cache.state == "failed"
+    for _ in range(3):
+        assert cache.lookup("what is my balance") == (None, None)
+    assert calls == [1]
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+import pytest
+from src.single_flight import AsyncSingleFlight, SingleFlight, normalize_prompt, normalize_wallet
+
+
+def test_keys_are_normalized():
+    assert normalize_wallet(" 0x00AB ") == normalize_wallet("0xab") == "0xab"
+    assert normalize_prompt("  What is\n  Starknet? ") == normalize_prompt("what is starknet?")
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight("test")
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        time.sleep(0.2)
+        return {"ETH": 1.0}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fetch, "k"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["k"]
+    assert results == [{"ETH": 1.0}] * 4
+    # Nothing is cached once the call is over
+    flight.do("k", fetch, "k")
+    assert len(calls) == 2
+
+
+def test_waiting_threads_get_the_same_error():
+    flight = SingleFlight("test")
+
+    def fail():
+        time.sleep(0.2)
+        raise RuntimeError("rpc down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == ["rpc down"] * 3
+
+
+async def _counted(calls, value, delay=0.1):
+    calls.append(value)
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_concurrent_coroutines_share_one_call():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def run():
+        return await asyncio.gather(
+            flight.do("a", _counted, calls, "a"),
+            flight.do("a", _counted, calls, "a"),
+            flight.do("b", _counted, calls, "b"),
+        )
+
+    assert asyncio.run(run()) == ["a", "a", "b"]
+    assert calls == ["a", "b"]
+
+
+def test_shared_call_survives_until_its_last_waiter_is_cancelled():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("k", _counted, calls, "k", delay=0.2))
+        second = asyncio.ensure_future(flight.do("k", _counted, calls, "k", delay=0.2))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        assert await second == "k"
+
+        third = asyncio.ensure_future(flight.do("k", _counted, calls, "k", delay=10))
+        await asyncio.sleep(0.05)
+        [(task, _)] = flight._calls[asyncio.get_running_loop()].values()
+        third.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await third
+        await asyncio.sleep(0)
+        return task.cancelled()
+
+    assert asyncio.run(run())
+    assert calls == ["k", "k"]
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from src.stage_scheduler import StageScheduler
+
+
+async def _fail(delay=0.0):
+    await asyncio.sleep(delay)
+    raise RuntimeError("balances failed")
+
+
+async def _value(value, delay=0.0):
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_result_runs_fallback_when_stage_was_not_started():
+    async def run():
+        async with StageScheduler() as stages:
+            return await stages.result("filters", _value("filters"))
+
+    assert asyncio.run(run()) == "filters"
+
+
+def test_started_stage_is_reused_and_fallback_closed():
+    async def run():
+        async with StageScheduler() as stages:
+            stages.start("filters", _value("prefetched"))
+            fallback = _value("fallback")
+            result = await stages.result("filters", fallback)
+            return result, fallback.cr_frame
+
+    result, frame = asyncio.run(run())
+    assert result == "prefetched"
+    # The unused fallback coroutine was closed rather than left unawaited
+    assert frame is None
+
+
+def test_unused_speculative_stage_is_cancelled_on_exit():
+    async def run():
+        async with StageScheduler() as stages:
+            speculative = stages.start("plan", _value("plan", delay=10))
+            await stages.result("balances", _value("balances"))
+        await asyncio.sleep(0)
+        # Checked inside the loop: asyncio.run cancels whatever is left when it returns
+        return speculative.cancelled()
+
+    assert asyncio.run(run())
+
+
+def test_gathered_stage_is_cancelled_when_another_stage_fails():
+    async def run():
+        slow = None
+        with pytest.raises(RuntimeError):
+            async with StageScheduler() as stages:
+                slow = stages.start("filters", _value("filters", delay=10))
+                await stages.gather(balances=_fail(), filters=None)
+        await asyncio.sleep(0)
+        return slow.cancelled()
+
+    assert asyncio.run(run())
+
+
+def test_finished_stages_are_left_alone():
+    async def run():
+        async with StageScheduler() as stages:
+            results = await stages.gather(balances=_value(1), filters=_value(2))
+            tasks = [stages.start("balances", _value(3)), stages.start("filters", _value(4))]
+        return results, tasks
+
+    results, tasks = asyncio.run(run())
+    assert results == {"balances": 1, "filters": 2}
+    assert [task.result() for task in tasks] == [1, 2]
@@ -0,0 +1,177 @@
+import pickle
+import hashlib
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_community")
+pytest.importorskip("langchain_huggingface")
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from src import vector_index
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic unit vectors per text; records every text it embeds."""
+
+    def __init__(self, dimension=16):
+        self.dimension = dimension
+        self.embedded = []
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    embeddings = HashEmbeddings()
+    # Loading an index builds its query embeddings from the manifest
+    monkeypatch.setattr(vector_index, "get_embeddings", lambda *args, **kwargs: embeddings)
+    return embeddings
+
+
+def docs(*texts):
+    return [Document(page_content=text, metadata={"source": "test"}) for text in texts]
+
+
+def test_saved_vector_store_loads_with_its_manifest(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    store = FAISS.from_documents(docs("vesu lending", "endur staking", "ekubo swaps"), embeddings)
+    vector_index.save_vector_store(store, directory, embedding_model="test-model")
+    manifest = vector_index.read_manifest(directory)
+    assert manifest["embedding_model"] == "test-model"
+    assert manifest["count"] == 3 and manifest["dimension"] == 16
+
+    loaded = vector_index.load_vector_store(directory)
+    assert loaded.similarity_search("endur staking", k=1)[0].page_content == "endur staking"
+    assert loaded.similarity_search("endur staking", k=1)[0].metadata == {"source": "test"}
+
+
+def test_index_records_the_embedding_kind_queries_are_embedded_with(tmp_path, embeddings, monkeypatch):
+    directory = str(tmp_path / "index")
+    vector_index.update_index(directory, docs("vesu lending", "endur staking"),
+                              embeddings=embeddings, embedding_model="test-model", embedding_kind="bge")
+    manifest = vector_index.read_manifest(directory)
+    assert (manifest["embedding_model"], manifest["embedding_kind"]) == ("test-model", "bge")
+
+    loaded_with = []
+    monkeypatch.setattr(vector_index, "get_embeddings", lambda *args: loaded_with.append(args) or embeddings)
+    vector_index.load_vector_store(directory)
+    assert loaded_with == [("test-model", True, "bge")]
+
+
+def test_old_versions_are_pruned(tmp_path, embeddings, monkeypatch):
+    monkeypatch.setattr(vector_index, "KEEP_VERSIONS", 1)
+    directory = tmp_path / "index"
+    for texts in (("a",), ("a", "b"), ("a", "b", "c")):
+        vector_index.update_index(str(directory), docs(*texts), embeddings=embeddings, embedding_model="test-model")
+    manifest = vector_index.read_manifest(str(directory))
+    data_files = sorted(p.name for p in directory.iterdir() if p.name != vector_index.MANIFEST_NAME)
+    assert data_files == sorted({manifest["index_file"], manifest["vectors_file"], manifest["chunks_file"]})
+
+
+@pytest.mark.skipif(vector_index.MMAP_FLAG is None, reason="faiss build cannot memory-map flat indexes")
+def test_flat_index_is_memory_mapped(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    vector_index.update_index(directory, docs("a", "b"), embeddings=embeddings, embedding_model="test-model")
+    path = str(tmp_path / "index" / vector_index.read_manifest(directory)["index_file"])
+    index = vector_index.read_index(path)
+    with open("/proc/self/maps") as f:
+        assert path in f.read()
+    assert index.ntotal == 2
+
+
+def test_legacy_pickled_retriever_still_loads(tmp_path):
+    path = tmp_path / "retriever.pkl"
+    path.write_bytes(pickle.dumps({"retriever": "legacy"}))
+    assert vector_index.load_retriever(str(path)) == {"retriever": "legacy"}
+
+
+def test_update_only_embeds_new_and_changed_chunks(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    vector_index.update_index(directory, docs("a", "b", "c"), embeddings=embeddings, embedding_model="test-model")
+    embeddings.embedded.clear()
+
+    store = vector_index.update_index(directory, docs("a", "b", "c changed", "d"),
+                                      embeddings=embeddings, embedding_model="test-model")
+    assert sorted(embeddings.embedded) == ["c changed", "d"]
+    stats = vector_index.read_manifest(directory)["last_update"]
+    assert (stats["added"], stats["removed"], stats["reused"]) == (2, 1, 2)
+    assert store.similarity_search("c changed", k=1)[0].page_content == "c changed"
+    assert {doc.page_content for doc in store.docstore._dict.values()} == {"a", "b", "c changed", "d"}
+
+    loaded = vector_index.load_vector_store(directory)
+    assert loaded.similarity_search("d", k=1)[0].page_content == "d"
+
+
+def test_other_embedding_model_rebuilds_from_scratch(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    vector_index.update_index(directory, docs("a", "b"), embeddings=embeddings, embedding_model="test-model")
+    embeddings.embedded.clear()
+    vector_index.update_index(directory, docs("a", "b"), embeddings=embeddings, embedding_model="other-model")
+    assert sorted(embeddings.embedded) == ["a", "b"]
+
+
+def test_positional_index_is_rebuilt_keyed_by_content(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    store = FAISS.from_documents(docs("a", "b"), embeddings)
+    vector_index.save_vector_store(store, directory, embedding_model="test-model")
+    embeddings.embedded.clear()
+    vector_index.update_index(directory, docs("a", "b"), embeddings=embeddings, embedding_model="test-model")
+    assert sorted(embeddings.embedded) == ["a", "b"]
+    assert vector_index.read_manifest(directory)["id_map"] is True
+
+
+def test_update_without_documents_raises(tmp_path, embeddings):
+    with pytest.raises(ValueError, match="without any documents"):
+        vector_index.update_index(str(tmp_path / "index"), [], embeddings=embeddings, embedding_model="test-model")
+
+
+def test_update_adds_vectors_batch_by_batch(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    texts = [f"chunk {i}" for i in range(5)]
+    store = vector_index.update_index(directory, docs(*texts), embeddings=embeddings,
+                                      embedding_model="test-model", batch_size=2)
+    assert store.index.ntotal == 5
+    assert store.similarity_search("chunk 3", k=1)[0].page_content == "chunk 3"
+    assert vector_index.read_manifest(directory)["last_update"]["chunks_per_second"] > 0
+
+
+def test_reindex_switches_type_without_embedding(tmp_path, embeddings, monkeypatch):
+    monkeypatch.setattr(vector_index, "ANN_MIN_VECTORS", 10)
+    directory = str(tmp_path / "index")
+    texts = [f"chunk {i}" for i in range(200)]
+    vector_index.update_index(directory, docs(*texts), embeddings=embeddings, embedding_model="test-model")
+    embeddings.embedded.clear()
+
+    manifest = vector_index.reindex(directory, "hnsw")
+    assert embeddings.embedded == []
+    assert manifest["index_type"] == "hnsw"
+    assert manifest["search_params"]["efSearch"] >= 1
+    assert manifest["vectors_file"] != manifest["index_file"]
+    store = vector_index.load_vector_store(directory)
+    assert store.similarity_search("chunk 42", k=1)[0].page_content == "chunk 42"
+
+
+def test_small_corpora_stay_flat(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    vector_index.update_index(directory, docs("a", "b"), embeddings=embeddings, embedding_model="test-model")
+    manifest = vector_index.reindex(directory, "ivfpq")
+    assert manifest["index_type"] == "flat"
+
+
+def test_unknown_index_type_is_rejected(tmp_path, embeddings):
+    directory = str(tmp_path / "index")
+    vector_index.update_index(directory, docs("a", "b"), embeddings=embeddings, embedding_model="test-model")
+    with pytest.raises(ValueError, match="Unknown vector index type"):
+        vector_index.reindex(directory, "annoy")